@@ -0,0 +1,105 @@
+"""
+Derived avatar sizes.
+
+Uploads are stored untouched; ``process_avatar`` (run by the Celery task of
+the same name once the upload is committed) decodes the original once, at
+reduced scale where the format allows it (``Image.draft`` for JPEG, then
+``thumbnail`` with ``reducing_gap``), and writes one re-encoded variant per
+``AVATAR_VARIANT_SIZES`` entry next to the original. Their names are kept
+in ``CustomUserModel.avatar_variants`` and ``variant_url`` picks the smallest
+variant that covers the size a client asked for. Until the variants exist
+the original is served.
+"""
+
+import io
+import logging
+import os
+
+from PIL import Image, ImageOps
+from prometheus_client import Histogram
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+logger = logging.getLogger(__name__)
+
+AVATAR_PROCESSING_SECONDS = Histogram(
+    "access_avatar_processing_seconds",
+    "Time spent decoding an avatar and writing its variants",
+)
+
+FORMAT_EXTENSIONS = {"WEBP": "webp", "JPEG": "jpg"}
+
+
+def variant_name(original_name, size):
+    root, _ = os.path.splitext(original_name)
+    extension = FORMAT_EXTENSIONS[settings.AVATAR_VARIANT_FORMAT]
+    return f"{root}_{size}.{extension}"
+
+
+def pick_variant(variants, size=None):
+    """Return the variant name for ``size`` (a default size when ``None``)."""
+    if not variants:
+        return None
+    size = size or settings.AVATAR_DEFAULT_SIZE
+    sizes = sorted(int(available) for available in variants)
+    fitting = next((available for available in sizes if available >= size), sizes[-1])
+    return variants[str(fitting)]
+
+
+def variant_url(avatar, variants, size=None):
+    """URL of the variant of ``avatar`` for ``size``, or of the original."""
+    if not avatar:
+        return None
+    name = pick_variant(variants, size)
+    return avatar.storage.url(name) if name else avatar.url
+
+
+def render_variants(storage, original_name):
+    """Write every configured variant of ``original_name``; returns size -> name."""
+    sizes = sorted(settings.AVATAR_VARIANT_SIZES, reverse=True)
+    image_format = settings.AVATAR_VARIANT_FORMAT
+    variants = {}
+    with AVATAR_PROCESSING_SECONDS.time(), storage.open(original_name) as handle:
+        image = Image.open(handle)
+        # Lets the JPEG decoder scale down by up to 8x while decoding.
+        image.draft("RGB", (sizes[0], sizes[0]))
+        image = ImageOps.exif_transpose(image)
+        image = image.convert("RGBA" if image_format == "WEBP" else "RGB")
+        for size in sizes:
+            image.thumbnail((size, size), Image.Resampling.LANCZOS, reducing_gap=2.0)
+            buffer = io.BytesIO()
+            image.save(buffer, image_format, quality=settings.AVATAR_VARIANT_QUALITY)
+            name = storage.save(
+                variant_name(original_name, size), ContentFile(buffer.getvalue())
+            )
+            variants[str(size)] = name
+    return variants
+
+
+def process_avatar(user_id, original_name, stale=()):
+    """
+    Render the variants of ``original_name`` and attach them to the user,
+    then delete the ``stale`` variants of the avatar it replaced.
+    """
+    from . import profile_cache, user_cache
+    from .models import CustomUserModel
+
+    storage = CustomUserModel._meta.get_field("avatar").storage
+    variants = {}
+    if original_name:
+        variants = render_variants(storage, original_name)
+        # Only attach them if the user has not uploaded another avatar since.
+        updated = CustomUserModel.objects.filter(
+            pk=user_id, avatar=original_name
+        ).update(avatar_variants=variants)
+        if updated:
+            # QuerySet.update() bypasses the signals that refresh these caches.
+            user_cache.invalidate_user(user_id)
+            profile_cache.bump_version(user_id)
+        else:
+            stale = list(stale) + list(variants.values())
+
+    for name in stale:
+        storage.delete(name)
+    return variants
@@ -0,0 +1,198 @@
+"""
+Credit ledger.
+
+Every change to a user's ``dalle_credits`` or ``subscription_credits`` is a
+``CreditTransaction`` row, written by ``debit`` or ``credit`` together with
+a single ``UPDATE ... SET balance = balance +/- n`` on the user row. Debits
+make that update conditional on the balance covering them, so an overdraft
+is a zero-row update rather than a read-check-write race, and no
+``select_for_update`` is taken: the ledger row is inserted first, so the
+user row is only locked from the update to the commit.
+
+An idempotency key makes a retried operation return the transaction it
+already recorded instead of charging twice; reusing a key for a different
+operation, account or amount raises ``IdempotencyKeyReused``. The balance
+columns are a cache of the ledger sum and ``reconcile`` (run by the
+``reconcile_credit_balances`` task) corrects any that drifted, e.g. through a
+direct ``save()``.
+"""
+
+import logging
+
+from prometheus_client import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+
+from . import profile_cache, user_cache
+from .models import CreditTransaction, CustomUserModel
+
+logger = logging.getLogger(__name__)
+
+CREDIT_OPERATIONS = Counter(
+    "access_credit_operations_total",
+    "Credit ledger operations by outcome",
+    ["operation", "result"],
+)
+CREDIT_DRIFT = Counter(
+    "access_credit_balance_drift_total",
+    "Balance columns corrected to match the credit ledger",
+    ["account"],
+)
+
+
+class InsufficientCredits(Exception):
+    """The balance does not cover the requested debit."""
+
+
+class IdempotencyKeyReused(Exception):
+    """The idempotency key was already used for a different operation."""
+
+
+def balance_field(account):
+    try:
+        return CreditTransaction.ACCOUNT_FIELDS[account]
+    except KeyError:
+        raise ValueError(f"Unknown credit account {account!r}") from None
+
+
+def _invalidate(user_id):
+    # QuerySet.update() bypasses the signals that refresh these caches.
+    user_cache.invalidate_user(user_id)
+    profile_cache.bump_version(user_id)
+
+
+def _apply(operation, user_id, account, amount, reason, idempotency_key):
+    if amount <= 0:
+        raise ValueError("Credit amounts must be positive")
+    field = balance_field(account)
+    delta = -amount if operation == "debit" else amount
+
+    try:
+        with transaction.atomic():
+            entry = CreditTransaction.objects.create(
+                user_id=user_id,
+                account=account,
+                amount=delta,
+                reason=reason,
+                idempotency_key=idempotency_key,
+            )
+            users = CustomUserModel.objects.filter(pk=user_id)
+            if operation == "debit":
+                users = users.filter(**{f"{field}__gte": amount})
+            if not users.update(**{field: F(field) + delta}):
+                if not CustomUserModel.objects.filter(pk=user_id).exists():
+                    raise CustomUserModel.DoesNotExist(user_id)
+                CREDIT_OPERATIONS.labels(operation=operation, result="refused").inc()
+                raise InsufficientCredits(
+                    f"{account} balance of {user_id} is below {amount}"
+                )
+    except IntegrityError:
+        if idempotency_key is None:
+            raise
+        # Another call with this key already committed; report its result.
+        entry = CreditTransaction.objects.get(
+            user_id=user_id, idempotency_key=idempotency_key
+        )
+        # The sign of the amount tells debits and credits apart.
+        if entry.account != account or entry.amount != delta:
+            CREDIT_OPERATIONS.labels(operation=operation, result="conflict").inc()
+            raise IdempotencyKeyReused(
+                f"Key {idempotency_key!r} of {user_id} was used for "
+                f"{entry.amount:+d} {entry.account} credits"
+            )
+        CREDIT_OPERATIONS.labels(operation=operation, result="replayed").inc()
+        return entry
+
+    CREDIT_OPERATIONS.labels(operation=operation, result="applied").inc()
+    transaction.on_commit(lambda: _invalidate(user_id))
+    return entry
+
+
+def debit(user_id, amount, account="dalle", reason="", idempotency_key=None):
+    """
+    Take ``amount`` credits from ``account``; returns the ``CreditTransaction``.
+
+    Raises ``InsufficientCredits`` when the balance does not cover it, and
+    ``IdempotencyKeyReused`` when the key was used for another operation.
+    """
+    return _apply("debit", user_id, account, amount, reason, idempotency_key)
+
+
+def credit(user_id, amount, account="dalle", reason="", idempotency_key=None):
+    """Add ``amount`` credits to ``account``; returns the ``CreditTransaction``."""
+    return _apply("credit", user_id, account, amount, reason, idempotency_key)
+
+
+def ledger_balances(user_ids):
+    """Return ``{(user_id, account): sum of amounts}`` for ``user_ids``."""
+    rows = (
+        CreditTransaction.objects.filter(user_id__in=user_ids)
+        .order_by()
+        .values("user_id", "account")
+        .annotate(total=Sum("amount"))
+    )
+    return {(row["user_id"], row["account"]): row["total"] for row in rows}
+
+
+def _correct(user_id):
+    """Set the balance columns of ``user_id`` to its ledger sums."""
+    fields = CreditTransaction.ACCOUNT_FIELDS
+    with transaction.atomic():
+        # Pending debits also update this row, so locking it orders them
+        # entirely before or after the ledger sum read below.
+        current = (
+            CustomUserModel.objects.select_for_update()
+            .filter(pk=user_id)
+            .values(*fields.values())
+            .first()
+        )
+        if current is None:
+            return []
+        totals = ledger_balances([user_id])
+        corrected = {
+            field: totals.get((user_id, account), 0)
+            for account, field in fields.items()
+            if current[field] != totals.get((user_id, account), 0)
+        }
+        if corrected:
+            CustomUserModel.objects.filter(pk=user_id).update(**corrected)
+    for account, field in fields.items():
+        if field in corrected:
+            CREDIT_DRIFT.labels(account=account).inc()
+            logger.warning(
+                f"Corrected {field} of {user_id} from {current[field]} "
+                f"to {corrected[field]}"
+            )
+    if corrected:
+        _invalidate(user_id)
+    return list(corrected)
+
+
+def reconcile(chunk_size=1000):
+    """
+    Compare every balance column with its ledger sum and fix the ones that
+    differ; returns the number of users corrected.
+
+    The comparison runs without locks; only users that look out of line are
+    locked and checked again before they are corrected.
+    """
+    fields = CreditTransaction.ACCOUNT_FIELDS
+    corrected = 0
+    after = ""
+    while True:
+        rows = list(
+            CustomUserModel.objects.filter(pk__gt=after)
+            .order_by("pk")
+            .values_list("pk", *fields.values())[:chunk_size]
+        )
+        if not rows:
+            return corrected
+        after = rows[-1][0]
+        totals = ledger_balances([row[0] for row in rows])
+        for user_id, *balances in rows:
+            if any(
+                balance != totals.get((user_id, account), 0)
+                for account, balance in zip(fields, balances)
+            ):
+                corrected += bool(_correct(user_id))
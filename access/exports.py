@@ -0,0 +1,130 @@
+"""
+Streaming table exports for ops tooling.
+
+Rows are read with ``values_list().iterator()`` (a server-side cursor on
+PostgreSQL) and rendered straight to NDJSON or CSV, so an export holds one
+chunk of rows in memory no matter how large the table is and skips the
+per-row cost of a DRF serializer.
+"""
+
+import csv
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import CustomUserModel, LoggedDevice, PreRegister
+
+CHUNK_SIZE = 2000
+BUFFER_SIZE = 64 * 1024
+
+EXPORTS = {
+    "users": (
+        CustomUserModel,
+        (
+            ("userId", "userId"),
+            ("username", "username"),
+            ("email", "email"),
+            ("phone_number", "phone_number"),
+            ("birth_date", "birth_date"),
+            ("avatar", "avatar"),
+            ("is_email_confirmed", "is_email_confirmed"),
+            ("is_active", "is_active"),
+            ("dalle_credits", "dalle_credits"),
+            ("subscription_credits", "subscription_credits"),
+            ("created", "created"),
+            ("updated", "updated"),
+        ),
+    ),
+    "pre-register": (
+        PreRegister,
+        (
+            ("id", "id"),
+            ("email", "email"),
+            ("date", "date"),
+            ("created", "created"),
+        ),
+    ),
+    "logged-devices": (
+        LoggedDevice,
+        (
+            ("id", "id"),
+            ("user_id", "user_id"),
+            ("user_email", "user__email"),
+            ("device_type", "device_type"),
+            ("device_name", "device_name"),
+            ("place", "place"),
+            ("last_login_at", "last_login_at"),
+            ("created", "created"),
+        ),
+    ),
+}
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+class _Echo:
+    """File-like object that hands back whatever csv.writer writes to it."""
+
+    def write(self, value):
+        return value
+
+
+def iter_rows(name):
+    model, columns = EXPORTS[name]
+    lookups = [lookup for _, lookup in columns]
+    return (
+        model.objects.order_by("pk")
+        .values_list(*lookups)
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def render_ndjson(name, rows):
+    _, columns = EXPORTS[name]
+    names = [column for column, _ in columns]
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode(dict(zip(names, row))) + "\n"
+
+
+def render_csv(name, rows):
+    _, columns = EXPORTS[name]
+    writer = csv.writer(_Echo())
+    yield writer.writerow([column for column, _ in columns])
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def buffered(lines, size=BUFFER_SIZE):
+    """Join small lines into chunks of roughly ``size`` bytes."""
+    buffer = []
+    length = 0
+    for line in lines:
+        data = line.encode()
+        buffer.append(data)
+        length += len(data)
+        if length >= size:
+            yield b"".join(buffer)
+            buffer = []
+            length = 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def gzipped(chunks):
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(name, output="ndjson", compress=False):
+    """Return an iterator of encoded chunks for the ``name`` export."""
+    render = render_csv if output == "csv" else render_ndjson
+    chunks = buffered(render(name, iter_rows(name)))
+    return gzipped(chunks) if compress else chunks
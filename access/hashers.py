@@ -0,0 +1,149 @@
+"""
+Password hasher that can run PBKDF2 off the request thread.
+
+With ``PASSWORD_HASHING_POOL_SIZE`` > 0 every encode/verify is executed in a
+bounded process pool. Requests that find ``PASSWORD_HASHING_MAX_QUEUE`` jobs
+already in flight, or whose job is not done within
+``PASSWORD_HASHING_QUEUE_TIMEOUT`` seconds, fail fast with a 503 instead of
+piling up behind the CPU. A job that times out before it starts is cancelled,
+and one that reaches a worker after its caller gave up is skipped there.
+
+The hasher keeps the ``pbkdf2_sha256`` algorithm name, so existing hashes stay
+valid, and Django's ``check_password`` rehashes them on the next successful
+login whenever ``PASSWORD_HASHING_ITERATIONS`` changes.
+"""
+
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from prometheus_client import Counter, Gauge, Histogram
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+HASH_QUEUE_DEPTH = Gauge(
+    "access_password_hash_queue_depth",
+    "Password hashing jobs submitted to the pool and not yet finished",
+)
+HASH_LATENCY = Histogram(
+    "access_password_hash_seconds",
+    "Time spent hashing a password, including time queued",
+    ["mode"],
+)
+HASH_REJECTIONS = Counter(
+    "access_password_hash_rejections_total",
+    "Password hashing jobs rejected because the pool was saturated",
+    ["reason"],
+)
+
+
+class PasswordHashingUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Too many concurrent sign-ins, please retry shortly."
+    default_code = "password_hashing_unavailable"
+
+
+class _QueueTimeout(Exception):
+    pass
+
+
+def pbkdf2_encode(password, salt, iterations):
+    """Encode without touching settings, so it can run in a bare process."""
+    return PBKDF2PasswordHasher().encode(password, salt, iterations)
+
+
+def _encode(enqueued_at, max_wait, password, salt, iterations):
+    # Runs in the pool process; skip work the caller has already given up on.
+    if time.time() - enqueued_at > max_wait:
+        raise _QueueTimeout
+    return pbkdf2_encode(password, salt, iterations)
+
+
+class HashingPool:
+    def __init__(self):
+        self._executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return settings.PASSWORD_HASHING_POOL_SIZE > 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=settings.PASSWORD_HASHING_POOL_SIZE,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+                self._slots = threading.BoundedSemaphore(
+                    settings.PASSWORD_HASHING_MAX_QUEUE
+                )
+            return self._executor, self._slots
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._slots = None
+
+    def encode(self, password, salt, iterations):
+        executor, slots = self._get_executor()
+        if not slots.acquire(blocking=False):
+            HASH_REJECTIONS.labels(reason="queue_full").inc()
+            raise PasswordHashingUnavailable()
+
+        started = time.time()
+        HASH_QUEUE_DEPTH.inc()
+        try:
+            future = executor.submit(
+                _encode,
+                started,
+                settings.PASSWORD_HASHING_QUEUE_TIMEOUT,
+                password,
+                salt,
+                iterations,
+            )
+            return future.result(timeout=settings.PASSWORD_HASHING_QUEUE_TIMEOUT)
+        except TimeoutError:
+            future.cancel()
+            HASH_REJECTIONS.labels(reason="queue_timeout").inc()
+            raise PasswordHashingUnavailable()
+        except _QueueTimeout:
+            HASH_REJECTIONS.labels(reason="queue_timeout").inc()
+            raise PasswordHashingUnavailable()
+        except BrokenProcessPool:
+            HASH_REJECTIONS.labels(reason="broken_pool").inc()
+            self.shutdown()
+            raise PasswordHashingUnavailable()
+        finally:
+            HASH_QUEUE_DEPTH.dec()
+            slots.release()
+            HASH_LATENCY.labels(mode="pool").observe(time.time() - started)
+
+
+pool = HashingPool()
+
+
+class PooledPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    ``pbkdf2_sha256`` hasher that runs in ``pool`` when it is enabled.
+    """
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASHING_ITERATIONS
+
+    def encode(self, password, salt, iterations=None):
+        self._check_encode_args(password, salt)
+        iterations = iterations or self.iterations
+        if pool.enabled:
+            return pool.encode(password, salt, iterations)
+        with HASH_LATENCY.labels(mode="inline").time():
+            return super().encode(password, salt, iterations)
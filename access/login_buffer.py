@@ -0,0 +1,154 @@
+"""
+Write-coalescing buffer for ``LoggedDevice.last_login_at``.
+
+With ``DEVICE_LOGIN_COALESCE`` enabled, device touches are recorded in the
+shared cache instead of issuing an UPDATE each. Every touch stores the latest
+timestamp for its device and appends the device id to a sequence-numbered log;
+``flush`` (run by the ``flush_device_logins`` beat task) drains the log and
+writes every pending timestamp in one UPDATE per batch. Readers merge pending
+timestamps back in through ``merge_pending`` so the API stays
+read-your-writes consistent between flushes.
+
+The flag requires ``REDIS_URL``: with the per-process fallback cache the flush
+task would never see the buffer, so settings refuse to load.
+"""
+
+import logging
+
+from prometheus_client import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, DateTimeField, F, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEVICE_LOGINS_BUFFERED = Counter(
+    "access_device_logins_buffered_total",
+    "Device login touches recorded in the coalescing buffer",
+)
+DEVICE_LOGINS_FLUSHED = Counter(
+    "access_device_logins_flushed_total",
+    "Devices whose buffered login time was written to the database",
+)
+
+SEQ_KEY = "access:device_login:seq"
+FLUSHED_KEY = "access:device_login:flushed"
+LAST_HEAD_KEY = "access:device_login:last_head"
+FLUSH_LOCK_KEY = "access:device_login:flush_lock"
+FLUSH_BATCH_SIZE = 500
+
+
+def timestamp_key(device_id):
+    return f"access:device_login:at:{device_id}"
+
+
+def log_key(seq):
+    return f"access:device_login:log:{seq}"
+
+
+def _entry_timeout():
+    # Keep entries around for a few missed flushes before giving up on them.
+    return settings.DEVICE_LOGIN_FLUSH_INTERVAL * 10
+
+
+def record_login(device_id, when=None):
+    """Buffer a login for ``device_id`` and return its timestamp."""
+    when = when or timezone.now()
+    cache.set(timestamp_key(device_id), when, timeout=_entry_timeout())
+    try:
+        seq = cache.incr(SEQ_KEY)
+    except ValueError:
+        cache.add(SEQ_KEY, 0, timeout=None)
+        seq = cache.incr(SEQ_KEY)
+    cache.set(log_key(seq), device_id, timeout=_entry_timeout())
+    DEVICE_LOGINS_BUFFERED.inc()
+    return when
+
+
+def merge_pending(devices):
+    """Overlay buffered login times on ``devices`` with a single cache read."""
+    devices = list(devices)
+    if not settings.DEVICE_LOGIN_COALESCE or not devices:
+        return devices
+    pending = cache.get_many([timestamp_key(device.pk) for device in devices])
+    for device in devices:
+        when = pending.get(timestamp_key(device.pk))
+        if when and (device.last_login_at is None or when > device.last_login_at):
+            device.last_login_at = when
+    return devices
+
+
+def _write_batch(device_ids):
+    from .models import LoggedDevice
+
+    pending = cache.get_many([timestamp_key(device_id) for device_id in device_ids])
+    pending = {
+        device_id: pending[timestamp_key(device_id)]
+        for device_id in device_ids
+        if timestamp_key(device_id) in pending
+    }
+    if not pending:
+        return 0
+    latest = Case(
+        *[When(pk=device_id, then=Value(when)) for device_id, when in pending.items()],
+        output_field=DateTimeField(),
+    )
+    # Never move last_login_at backwards if the row was touched directly.
+    return LoggedDevice.objects.filter(pk__in=list(pending)).update(
+        last_login_at=Greatest(Coalesce(F("last_login_at"), latest), latest)
+    )
+
+
+def flush():
+    """Write buffered login times to the database; returns the device count."""
+    if not cache.add(FLUSH_LOCK_KEY, 1, timeout=_entry_timeout()):
+        logger.info("Device login flush already running")
+        return 0
+
+    try:
+        state = cache.get_many([SEQ_KEY, FLUSHED_KEY, LAST_HEAD_KEY])
+        head = state.get(SEQ_KEY, 0)
+        start = state.get(FLUSHED_KEY, 0) + 1
+        last_head = state.get(LAST_HEAD_KEY, 0)
+
+        # A log entry missing above the previous head may belong to a touch
+        # that has incremented the sequence but not written its entry yet, so
+        # stop there and pick it up on the next run. Entries still missing
+        # after that have expired.
+        flushed_upto = head
+        device_ids = set()
+        for chunk_start in range(start, head + 1, FLUSH_BATCH_SIZE):
+            seqs = range(chunk_start, min(chunk_start + FLUSH_BATCH_SIZE, head + 1))
+            entries = cache.get_many([log_key(seq) for seq in seqs])
+            for seq in seqs:
+                device_id = entries.get(log_key(seq))
+                if device_id is not None:
+                    device_ids.add(device_id)
+                elif seq > last_head and flushed_upto == head:
+                    flushed_upto = seq - 1
+
+        device_ids = list(device_ids)
+        flushed = 0
+        for batch_start in range(0, len(device_ids), FLUSH_BATCH_SIZE):
+            flushed += _write_batch(
+                device_ids[batch_start : batch_start + FLUSH_BATCH_SIZE]
+            )
+
+        cache.set_many({FLUSHED_KEY: flushed_upto, LAST_HEAD_KEY: head}, timeout=None)
+        for chunk_start in range(start, flushed_upto + 1, FLUSH_BATCH_SIZE):
+            cache.delete_many(
+                [
+                    log_key(seq)
+                    for seq in range(
+                        chunk_start,
+                        min(chunk_start + FLUSH_BATCH_SIZE, flushed_upto + 1),
+                    )
+                ]
+            )
+        DEVICE_LOGINS_FLUSHED.inc(flushed)
+        return flushed
+    finally:
+        cache.delete(FLUSH_LOCK_KEY)
@@ -0,0 +1,50 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from access import exports
+
+
+class Command(BaseCommand):
+    help = "Stream a full table export as NDJSON or CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "name",
+            type=str,
+            choices=list(exports.EXPORTS),
+            help="Table to export",
+        )
+        parser.add_argument(
+            "--output",
+            type=str,
+            choices=list(exports.FORMATS),
+            default="ndjson",
+            help="Row format",
+        )
+        parser.add_argument(
+            "--gzip",
+            action="store_true",
+            help="Compress the output with gzip",
+        )
+        parser.add_argument(
+            "--file",
+            type=str,
+            help="Write to this file instead of stdout",
+        )
+
+    def handle(self, *args, **options):
+        chunks = exports.stream_export(
+            options["name"], options["output"], options["gzip"]
+        )
+        if options["file"]:
+            with open(options["file"], "wb") as handle:
+                for chunk in chunks:
+                    handle.write(chunk)
+            self.stderr.write(
+                self.style.SUCCESS(f"Exported {options['name']} to {options['file']}")
+            )
+        else:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
@@ -0,0 +1,217 @@
+import csv
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_email
+
+from access.hashers import PooledPBKDF2PasswordHasher, pbkdf2_encode
+from access.models import CustomUserModel
+
+IMPORT_FIELDS = ("email", "username", "phone_number", "first_name", "last_name")
+NULLABLE_FIELDS = ("username", "phone_number")
+
+
+def read_rows(stream, fmt):
+    """Yield ``(line_number, row)`` pairs without loading the whole file."""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except json.JSONDecodeError:
+                yield line_number, None
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    help = "Bulk import users from a CSV or JSONL file"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path",
+            type=str,
+            help="CSV or JSONL file to import, or '-' to read from stdin",
+        )
+        parser.add_argument(
+            "--format",
+            type=str,
+            choices=["csv", "jsonl"],
+            help="Input format (defaults to the file extension)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Rows hashed and inserted per batch",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Password hashing processes (0 hashes in this process)",
+        )
+        parser.add_argument(
+            "--rejects",
+            type=str,
+            help="Write rejected rows with their reason to this JSONL file",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("csv" if path.endswith(".csv") else "jsonl")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive")
+
+        self.hasher = PooledPBKDF2PasswordHasher()
+        self.workers = options["workers"]
+        self.executor = None
+        if self.workers > 0:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+
+        stream = sys.stdin if path == "-" else open(path, newline="")
+        rejects = open(options["rejects"], "w") if options["rejects"] else None
+        imported = rejected = processed = 0
+        try:
+            for batch in batched(read_rows(stream, fmt), options["batch_size"]):
+                batch_imported, batch_rejects = self.import_batch(batch)
+                imported += batch_imported
+                rejected += len(batch_rejects)
+                processed += len(batch)
+                if rejects:
+                    for line_number, email, reason in batch_rejects:
+                        rejects.write(
+                            json.dumps(
+                                {"line": line_number, "email": email, "reason": reason}
+                            )
+                            + "\n"
+                        )
+                self.stdout.write(
+                    f"Processed {processed} rows: {imported} imported, "
+                    f"{rejected} rejected"
+                )
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+            if rejects:
+                rejects.close()
+            if self.executor:
+                self.executor.shutdown()
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Imported {imported} users, rejected {rejected}")
+        )
+
+    def import_batch(self, batch):
+        rejects = []
+        users = []
+        raw_passwords = []
+        seen = {field: set() for field in ("email", *NULLABLE_FIELDS)}
+
+        for line_number, row in batch:
+            if not isinstance(row, dict):
+                rejects.append((line_number, None, "malformed row"))
+                continue
+
+            values = {
+                field: str(row.get(field) or "").strip() for field in IMPORT_FIELDS
+            }
+            for field in NULLABLE_FIELDS:
+                values[field] = values[field] or None
+            email = values["email"]
+            try:
+                validate_email(email)
+            except ValidationError:
+                rejects.append((line_number, email, "invalid email"))
+                continue
+            values["email"] = CustomUserModel.objects.normalize_email(email)
+
+            duplicate = next(
+                (
+                    field
+                    for field, taken in seen.items()
+                    if values[field] is not None and values[field] in taken
+                ),
+                None,
+            )
+            if duplicate:
+                rejects.append((line_number, email, f"duplicate {duplicate} in batch"))
+                continue
+
+            password_hash = row.get("password_hash")
+            if password_hash:
+                try:
+                    identify_hasher(password_hash)
+                except ValueError:
+                    rejects.append((line_number, email, "unknown password hash"))
+                    continue
+
+            for field, taken in seen.items():
+                if values[field] is not None:
+                    taken.add(values[field])
+
+            user = CustomUserModel(**values)
+            if password_hash:
+                user.password = password_hash
+            elif row.get("password"):
+                raw_passwords.append((user, row["password"]))
+            else:
+                user.password = make_password(None)
+            users.append((line_number, user))
+
+        self.hash_passwords(raw_passwords)
+
+        CustomUserModel.objects.bulk_create(
+            [user for _, user in users], ignore_conflicts=True
+        )
+        inserted = set(
+            CustomUserModel.objects.filter(
+                pk__in=[user.pk for _, user in users]
+            ).values_list("pk", flat=True)
+        )
+        for line_number, user in users:
+            if str(user.pk) not in inserted:
+                rejects.append((line_number, user.email, "already exists"))
+
+        return len(inserted), rejects
+
+    def hash_passwords(self, raw_passwords):
+        if not raw_passwords:
+            return
+        iterations = self.hasher.iterations
+        salts = [self.hasher.salt() for _ in raw_passwords]
+        passwords = [password for _, password in raw_passwords]
+        if self.executor:
+            encoded = self.executor.map(
+                pbkdf2_encode,
+                passwords,
+                salts,
+                [iterations] * len(passwords),
+                chunksize=max(1, len(passwords) // (4 * self.workers)),
+            )
+        else:
+            encoded = map(
+                pbkdf2_encode, passwords, salts, [iterations] * len(passwords)
+            )
+        for (user, _), password_hash in zip(raw_passwords, encoded):
+            user.password = password_hash
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from access import retention
+
+
+class Command(BaseCommand):
+    help = "Create upcoming control table partitions and apply retention"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--purge",
+            action="store_true",
+            help="Also drop expired partitions or delete expired rows",
+        )
+
+    def handle(self, *args, **options):
+        created = retention.maintain_partitions()
+        self.stdout.write(f"Ensured {len(created)} partitions")
+
+        if options["purge"]:
+            for table, removed in retention.purge_expired().items():
+                self.stdout.write(
+                    f"{table}: dropped {removed['partitions']} partitions, "
+                    f"deleted {removed['rows']} rows"
+                )
+
+        self.stdout.write(self.style.SUCCESS("Partition maintenance complete"))
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-17 02:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("access", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="customusermodel",
+            index=models.Index(
+                fields=["created", "userId"], name="access_user_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="loggeddevice",
+            index=models.Index(
+                fields=["user", "last_login_at", "id"],
+                name="access_device_login_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,140 @@
+# Generated by Django 5.2.6 on 2026-10-17 02:08
+
+from datetime import datetime
+from datetime import timezone as dt_timezone
+
+from django.db import migrations, models
+
+# Partitions past these months are created by the purge_control_tables task.
+MONTHS_AHEAD = 3
+
+# Frozen copy of general.partitioning.partition_table and its helpers as of
+# this migration, so later changes to that module cannot change the schema a
+# fresh database ends up with.
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(value, months):
+    month = value.month - 1 + months
+    return value.replace(year=value.year + month // 12, month=month % 12 + 1)
+
+
+def is_partitioned(connection, table):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table p "
+            "JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = %s AND pg_table_is_visible(c.oid)",
+            [table],
+        )
+        return cursor.fetchone() is not None
+
+
+def create_partitions(connection, table, first, last):
+    qn = connection.ops.quote_name
+    start = month_start(first)
+    with connection.cursor() as cursor:
+        while start <= last:
+            end = add_months(start, 1)
+            name = f"{table}_p{start:%Y%m}"
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {qn(name)} PARTITION OF {qn(table)} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            )
+            start = end
+
+
+def partition_table(connection, model, column, months_ahead):
+    table = model._meta.db_table
+    if connection.vendor != "postgresql" or is_partitioned(connection, table):
+        return
+
+    qn = connection.ops.quote_name
+    pk = model._meta.pk
+    old = f"{table}_unpartitioned"
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {qn(table)} RENAME TO {qn(old)}")
+        # Free the primary key's index name for the new table.
+        cursor.execute(
+            "SELECT conname FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype = 'p'",
+            [old],
+        )
+        for (constraint,) in cursor.fetchall():
+            cursor.execute(f"ALTER TABLE {qn(old)} DROP CONSTRAINT {qn(constraint)}")
+        cursor.execute(
+            f"CREATE TABLE {qn(table)} "
+            f"(LIKE {qn(old)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS, "
+            f"PRIMARY KEY ({qn(pk.column)}, {qn(column)})) "
+            f"PARTITION BY RANGE ({qn(column)})"
+        )
+        if pk.get_internal_type() in ("AutoField", "BigAutoField"):
+            # Identity columns are not copied by LIKE, so keep numbering going
+            # with a sequence owned by the new table.
+            sequence = f"{table}_{pk.column}_partitioned_seq"
+            cursor.execute(
+                f"CREATE SEQUENCE {qn(sequence)} OWNED BY {qn(table)}.{qn(pk.column)}"
+            )
+            cursor.execute(
+                f"ALTER TABLE {qn(table)} ALTER COLUMN {qn(pk.column)} "
+                f"SET DEFAULT nextval('{sequence}')"
+            )
+            cursor.execute(
+                f"SELECT setval('{sequence}', "
+                f"COALESCE((SELECT MAX({qn(pk.column)}) FROM {qn(old)}), 0) + 1, false)"
+            )
+        cursor.execute(
+            f"CREATE TABLE {qn(f'{table}_default')} PARTITION OF {qn(table)} DEFAULT"
+        )
+        cursor.execute(f"SELECT MIN({qn(column)}) FROM {qn(old)}")
+        oldest = cursor.fetchone()[0]
+
+    now = datetime.now(dt_timezone.utc)
+    create_partitions(
+        connection, table, oldest or now, add_months(month_start(now), months_ahead)
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {qn(table)} SELECT * FROM {qn(old)}")
+        cursor.execute(f"DROP TABLE {qn(old)}")
+
+
+def partition_control_tables(apps, schema_editor):
+    for model_name in ("ResetPasswordControl", "EmailConfirmationControl"):
+        partition_table(
+            schema_editor.connection,
+            apps.get_model("access", model_name),
+            "date",
+            MONTHS_AHEAD,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("access", "0002_customusermodel_access_user_created_idx_and_more"),
+    ]
+
+    operations = [
+        # No-op outside PostgreSQL. Runs before the indexes are added so they
+        # are created on the partitioned tables and cascade to partitions.
+        migrations.RunPython(partition_control_tables, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="emailconfirmationcontrol",
+            index=models.Index(
+                fields=["email", "date"], name="access_confirm_email_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="preregister",
+            index=models.Index(fields=["date"], name="access_preregister_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="resetpasswordcontrol",
+            index=models.Index(
+                fields=["email", "date"], name="access_reset_email_date_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,147 @@
+# Generated by Django 5.2.6 on 2026-10-17 02:11
+
+import django.db.models.expressions
+import django.db.models.lookups
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+# Frozen copy of access.models.notification_mask_for as of this migration, so
+# later changes to the model code cannot change what the backfill writes.
+NOTIFICATION_CHANNELS = ("email", "push")
+NOTIFICATION_TOPICS = ("updates", "tips", "payment")
+
+
+def notification_mask_for(notification_settings):
+    mask = 0
+    for channel_index, channel in enumerate(NOTIFICATION_CHANNELS):
+        topics = (notification_settings or {}).get(channel)
+        if not isinstance(topics, dict):
+            continue
+        for topic_index, topic in enumerate(NOTIFICATION_TOPICS):
+            if topics.get(topic) is True:
+                mask |= 1 << (channel_index * len(NOTIFICATION_TOPICS) + topic_index)
+    return mask
+
+
+def backfill_notification_mask(apps, schema_editor):
+    CustomUserModel = apps.get_model("access", "CustomUserModel")
+    users = CustomUserModel.objects.order_by("pk").only("pk", "notification_settings")
+    batch = []
+    for user in users.iterator(chunk_size=BATCH_SIZE):
+        mask = notification_mask_for(user.notification_settings)
+        if mask:
+            user.notification_mask = mask
+            batch.append(user)
+        if len(batch) == BATCH_SIZE:
+            CustomUserModel.objects.bulk_update(batch, ["notification_mask"])
+            batch = []
+    if batch:
+        CustomUserModel.objects.bulk_update(batch, ["notification_mask"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("access", "0003_control_table_partitioning"),
+        ("auth", "0012_alter_user_first_name_max_length"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customusermodel",
+            name="notification_mask",
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_notification_mask, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="customusermodel",
+            index=models.Index(
+                condition=models.Q(
+                    django.db.models.lookups.Exact(
+                        django.db.models.expressions.CombinedExpression(
+                            models.F("notification_mask"), "&", models.Value(1)
+                        ),
+                        1,
+                    )
+                ),
+                fields=["userId"],
+                name="access_user_email_updates_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="customusermodel",
+            index=models.Index(
+                condition=models.Q(
+                    django.db.models.lookups.Exact(
+                        django.db.models.expressions.CombinedExpression(
+                            models.F("notification_mask"), "&", models.Value(2)
+                        ),
+                        2,
+                    )
+                ),
+                fields=["userId"],
+                name="access_user_email_tips_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="customusermodel",
+            index=models.Index(
+                condition=models.Q(
+                    django.db.models.lookups.Exact(
+                        django.db.models.expressions.CombinedExpression(
+                            models.F("notification_mask"), "&", models.Value(4)
+                        ),
+                        4,
+                    )
+                ),
+                fields=["userId"],
+                name="access_user_email_payment_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="customusermodel",
+            index=models.Index(
+                condition=models.Q(
+                    django.db.models.lookups.Exact(
+                        django.db.models.expressions.CombinedExpression(
+                            models.F("notification_mask"), "&", models.Value(8)
+                        ),
+                        8,
+                    )
+                ),
+                fields=["userId"],
+                name="access_user_push_updates_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="customusermodel",
+            index=models.Index(
+                condition=models.Q(
+                    django.db.models.lookups.Exact(
+                        django.db.models.expressions.CombinedExpression(
+                            models.F("notification_mask"), "&", models.Value(16)
+                        ),
+                        16,
+                    )
+                ),
+                fields=["userId"],
+                name="access_user_push_tips_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="customusermodel",
+            index=models.Index(
+                condition=models.Q(
+                    django.db.models.lookups.Exact(
+                        django.db.models.expressions.CombinedExpression(
+                            models.F("notification_mask"), "&", models.Value(32)
+                        ),
+                        32,
+                    )
+                ),
+                fields=["userId"],
+                name="access_user_push_payment_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.2.6 on 2026-10-17 02:13
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("access", "0004_customusermodel_notification_mask"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Broadcast",
+            fields=[
+                (
+                    "id",
+                    models.CharField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        max_length=64,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                (
+                    "created",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Data Criação"
+                    ),
+                ),
+                (
+                    "updated",
+                    models.DateTimeField(
+                        auto_now=True, verbose_name="Data Atualização"
+                    ),
+                ),
+                (
+                    "channel",
+                    models.CharField(
+                        choices=[("email", "email"), ("push", "push")], max_length=20
+                    ),
+                ),
+                (
+                    "topic",
+                    models.CharField(
+                        choices=[
+                            ("updates", "updates"),
+                            ("tips", "tips"),
+                            ("payment", "payment"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("subject", models.CharField(max_length=200)),
+                ("body", models.TextField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("running", "Running"),
+                            ("completed", "Completed"),
+                        ],
+                        default="pending",
+                        max_length=20,
+                    ),
+                ),
+                ("cursor", models.CharField(blank=True, default="", max_length=64)),
+                ("dispatched", models.BooleanField(default=False)),
+                ("chunks_total", models.PositiveIntegerField(default=0)),
+                ("chunks_done", models.PositiveIntegerField(default=0)),
+                ("chunks_failed", models.PositiveIntegerField(default=0)),
+                ("recipients_total", models.PositiveIntegerField(default=0)),
+                ("recipients_delivered", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "ordering": ["-created"],
+            },
+        ),
+    ]
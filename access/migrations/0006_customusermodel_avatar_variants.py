@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 02:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("access", "0005_broadcast"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customusermodel",
+            name="avatar_variants",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,116 @@
+# Generated by Django 5.2.6 on 2026-10-17 02:22
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Q
+
+BATCH_SIZE = 2000
+
+
+def record_opening_balances(apps, schema_editor):
+    """Start the ledger from the balances users already have."""
+    CustomUserModel = apps.get_model("access", "CustomUserModel")
+    CreditTransaction = apps.get_model("access", "CreditTransaction")
+    users = (
+        CustomUserModel.objects.exclude(Q(dalle_credits=0) & Q(subscription_credits=0))
+        .order_by("pk")
+        .values_list("pk", "dalle_credits", "subscription_credits")
+    )
+    batch = []
+    for user_id, dalle_credits, subscription_credits in users.iterator(
+        chunk_size=BATCH_SIZE
+    ):
+        for account, amount in (
+            ("dalle", dalle_credits),
+            ("subscription", subscription_credits),
+        ):
+            if amount:
+                batch.append(
+                    CreditTransaction(
+                        user_id=user_id,
+                        account=account,
+                        amount=amount,
+                        reason="opening balance",
+                        idempotency_key=f"opening:{account}",
+                    )
+                )
+        if len(batch) >= BATCH_SIZE:
+            CreditTransaction.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        CreditTransaction.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("access", "0006_customusermodel_avatar_variants"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CreditTransaction",
+            fields=[
+                (
+                    "id",
+                    models.CharField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        max_length=64,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                (
+                    "created",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Data Criação"
+                    ),
+                ),
+                (
+                    "updated",
+                    models.DateTimeField(
+                        auto_now=True, verbose_name="Data Atualização"
+                    ),
+                ),
+                (
+                    "account",
+                    models.CharField(
+                        choices=[("dalle", "dalle"), ("subscription", "subscription")],
+                        max_length=20,
+                    ),
+                ),
+                ("amount", models.IntegerField()),
+                ("reason", models.CharField(blank=True, default="", max_length=100)),
+                (
+                    "idempotency_key",
+                    models.CharField(blank=True, max_length=100, null=True),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="credit_transactions",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-created"],
+                "indexes": [
+                    models.Index(
+                        fields=["user", "created"], name="access_credit_user_idx"
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "idempotency_key"),
+                        name="access_credit_idempotency_key",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(record_opening_balances, migrations.RunPython.noop),
+    ]
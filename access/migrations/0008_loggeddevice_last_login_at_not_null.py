@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-17 03:06
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_last_login_at(apps, schema_editor):
+    """Date devices that never recorded a login by their last update."""
+    LoggedDevice = apps.get_model("access", "LoggedDevice")
+    LoggedDevice.objects.filter(last_login_at__isnull=True).update(
+        last_login_at=F("updated")
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("access", "0007_credittransaction"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_last_login_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="loggeddevice",
+            name="last_login_at",
+            field=models.DateTimeField(
+                blank=True,
+                default=django.utils.timezone.now,
+                help_text="Data e hora do último login neste dispositivo.",
+            ),
+        ),
+    ]
@@ -2,8 +2,11 @@ from uuid import uuid4
 
 import stripe
 
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser, BaseUserManager, PermissionsMixin
-from django.db import models
+from django.db import connections, models
+from django.db.models import F, Q
+from django.db.models.lookups import Exact
 from django.utils import timezone
 
 from general.abstract_models import BaseModel
@@ -26,6 +29,21 @@ class CustomUserModelManager(BaseUserManager):
 
         return user
 
+    def subscribed(self, channel, topic, chunk_size=5000):
+        """
+        Stream the IDs of users subscribed to ``topic`` on ``channel``.
+
+        Served by the partial index for that subscription and read through a
+        server-side cursor on PostgreSQL, so memory use stays flat however
+        many users match.
+        """
+        return (
+            self.filter(subscription_condition(channel, topic))
+            .order_by()
+            .values_list("userId", flat=True)
+            .iterator(chunk_size=chunk_size)
+        )
+
     def create_superuser(self, username, email, password):
         user = self.create_user(username, email, password=password)
 
@@ -44,6 +62,39 @@ def default_notification_settings():
     }
 
 
+NOTIFICATION_CHANNELS = ("email", "push")
+NOTIFICATION_TOPICS = ("updates", "tips", "payment")
+
+
+def notification_bit(channel, topic):
+    """Return the ``notification_mask`` bit of a channel/topic pair."""
+    try:
+        position = NOTIFICATION_CHANNELS.index(channel) * len(
+            NOTIFICATION_TOPICS
+        ) + NOTIFICATION_TOPICS.index(topic)
+    except ValueError:
+        raise ValueError(f"Unknown notification subscription {channel}.{topic}")
+    return 1 << position
+
+
+def notification_mask_for(notification_settings):
+    """Fold ``notification_settings`` into a bitmask of enabled subscriptions."""
+    mask = 0
+    for channel in NOTIFICATION_CHANNELS:
+        topics = (notification_settings or {}).get(channel)
+        if not isinstance(topics, dict):
+            continue
+        for topic in NOTIFICATION_TOPICS:
+            if topics.get(topic) is True:
+                mask |= notification_bit(channel, topic)
+    return mask
+
+
+def subscription_condition(channel, topic):
+    bit = notification_bit(channel, topic)
+    return Exact(F("notification_mask").bitand(bit), bit)
+
+
 class CustomUserModel(AbstractUser, PermissionsMixin):
     userId = models.CharField(
         max_length=64, default=uuid4, primary_key=True, editable=False
@@ -51,6 +102,8 @@ class CustomUserModel(AbstractUser, PermissionsMixin):
     username = models.CharField(max_length=100, unique=True, null=True, blank=True)
     email = models.EmailField(max_length=100, unique=True, null=False, blank=False)
     avatar = models.ImageField(storage=PrivateMediaStorage(), null=True, blank=True)
+    # Resized copies of avatar written by access.avatars, keyed by size.
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False)
     stripeCustomerId = models.CharField(max_length=100, null=True, blank=True)
     dalle_credits = models.IntegerField(default=0, null=False, blank=False)
     subscription_credits = models.IntegerField(default=0, null=False, blank=False)
@@ -91,19 +144,51 @@ class CustomUserModel(AbstractUser, PermissionsMixin):
     notification_settings = models.JSONField(
         default=default_notification_settings, blank=True, null=True
     )
+    # Denormalized from notification_settings on save, one bit per
+    # channel/topic pair (see notification_bit).
+    notification_mask = models.PositiveSmallIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.email
 
     class Meta:
         verbose_name = "Custom User"
+        indexes = [
+            models.Index(fields=["created", "userId"], name="access_user_created_idx"),
+        ] + [
+            models.Index(
+                fields=["userId"],
+                condition=Q(subscription_condition(channel, topic)),
+                name=f"access_user_{channel}_{topic}_idx",
+            )
+            for channel in NOTIFICATION_CHANNELS
+            for topic in NOTIFICATION_TOPICS
+        ]
+
+    def save(self, *args, **kwargs):
+        self.notification_mask = notification_mask_for(self.notification_settings)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "notification_settings" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "notification_mask"}
+        super().save(*args, **kwargs)
 
     @property
     def whoami(self):
+        from . import profile_cache
+
+        return profile_cache.whoami(self)
+
+    def avatar_url(self, size=None):
+        """URL of the avatar variant that best fits ``size`` pixels."""
+        from .avatars import variant_url
+
+        return variant_url(self.avatar, self.avatar_variants, size)
+
+    def build_whoami(self):
         return {
             "email": self.email,
             "username": self.username,
-            "avatar": self.avatar.url if self.avatar else None,
+            "avatar": self.avatar_url(),
             "credits": self.dalle_credits,
         }
 
@@ -115,6 +200,11 @@ class ResetPasswordControl(models.Model):
     email = models.EmailField(max_length=200, unique=False, null=False, blank=False)
     date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["email", "date"], name="access_reset_email_date_idx"),
+        ]
+
     def __str__(self):
         return "{} - {} - {} - {}".format(
             self.pk,
@@ -146,6 +236,11 @@ class EmailConfirmationControl(models.Model):
         verbose_name = "Email Confirmation Control"
         verbose_name_plural = "Email Confirmation Controls"
         ordering = ["-date"]
+        indexes = [
+            models.Index(
+                fields=["email", "date"], name="access_confirm_email_date_idx"
+            ),
+        ]
 
     def __str__(self):
         return f"{self.email} - {self.date.strftime('%Y-%m-%d %H:%M:%S')}"
@@ -155,10 +250,73 @@ class PreRegister(BaseModel):
     email = models.EmailField(max_length=200, unique=True, null=False, blank=False)
     date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["date"], name="access_preregister_date_idx"),
+        ]
+
     def __str__(self):
         return self.email
 
 
+class LoggedDeviceManager(models.Manager):
+    def register_or_touch(self, user, device_type, device_name, place=None):
+        """
+        Registers the device or refreshes its last_login_at in one statement.
+
+        Uses INSERT ... ON CONFLICT DO UPDATE ... RETURNING on the
+        (user, device_type, device_name) unique constraint, which both
+        PostgreSQL and SQLite (3.35+) support.
+        """
+        connection = connections[self.db]
+        now = timezone.now()
+        values = {
+            "id": str(uuid4()),
+            "created": now,
+            "updated": now,
+            "user": user.pk,
+            "device_type": device_type,
+            "device_name": device_name,
+            "last_login_at": now,
+            "place": place or "unknown",
+        }
+
+        if connection.vendor not in ("postgresql", "sqlite"):
+            device, _ = self.update_or_create(
+                user=user,
+                device_type=device_type,
+                device_name=device_name,
+                defaults={"last_login_at": now, **({"place": place} if place else {})},
+            )
+            return device
+
+        quote = connection.ops.quote_name
+        meta = self.model._meta
+        fields = {name: meta.get_field(name) for name in values}
+        columns = {name: quote(field.column) for name, field in fields.items()}
+        updated = ["last_login_at", "updated"] + (["place"] if place else [])
+        sql = (
+            "INSERT INTO {table} ({columns}) VALUES ({placeholders}) "
+            "ON CONFLICT ({conflict}) DO UPDATE SET {updates} RETURNING {returning}"
+        ).format(
+            table=quote(meta.db_table),
+            columns=", ".join(columns.values()),
+            placeholders=", ".join(["%s"] * len(values)),
+            conflict=", ".join(
+                columns[name] for name in ("user", "device_type", "device_name")
+            ),
+            updates=", ".join(
+                f"{columns[name]} = EXCLUDED.{columns[name]}" for name in updated
+            ),
+            returning=", ".join(quote(field.column) for field in meta.concrete_fields),
+        )
+        params = [
+            fields[name].get_db_prep_save(value, connection)
+            for name, value in values.items()
+        ]
+        return next(iter(self.raw(sql, params)))
+
+
 class LoggedDevice(BaseModel):
     DEVICE_TYPE_CHOICES = (
         ("desktop", "Desktop"),
@@ -191,7 +349,6 @@ class LoggedDevice(BaseModel):
     last_login_at = models.DateTimeField(
         default=timezone.now,
         blank=True,
-        null=True,
         help_text="Data e hora do último login neste dispositivo.",
     )
 
@@ -202,16 +359,115 @@ class LoggedDevice(BaseModel):
         null=True,
     )
 
+    objects = LoggedDeviceManager()
+
     class Meta:
         unique_together = ("user", "device_type", "device_name")
         ordering = ["-last_login_at"]
+        indexes = [
+            models.Index(
+                fields=["user", "last_login_at", "id"], name="access_device_login_idx"
+            ),
+        ]
         verbose_name = "Dispositivo"
         verbose_name_plural = "Dispositivos"
 
     def update_last_login(self):
         """Atualiza o campo last_login_at para o horário atual."""
+        if settings.DEVICE_LOGIN_COALESCE:
+            from . import login_buffer
+
+            self.last_login_at = login_buffer.record_login(self.pk)
+            return
         self.last_login_at = timezone.now()
         self.save(update_fields=["last_login_at"])
 
     def __str__(self):
         return f"{self.device_name} ({self.device_type})"
+
+
+class Broadcast(BaseModel):
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_COMPLETED = "completed"
+    STATUS_CHOICES = (
+        (STATUS_PENDING, "Pending"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_COMPLETED, "Completed"),
+    )
+
+    channel = models.CharField(
+        max_length=20, choices=[(channel, channel) for channel in NOTIFICATION_CHANNELS]
+    )
+    topic = models.CharField(
+        max_length=20, choices=[(topic, topic) for topic in NOTIFICATION_TOPICS]
+    )
+    subject = models.CharField(max_length=200)
+    body = models.TextField()
+    status = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING
+    )
+
+    # Dispatch checkpoint: the last userId handed to a chunk, and whether
+    # every recipient has been handed out.
+    cursor = models.CharField(max_length=64, blank=True, default="")
+    dispatched = models.BooleanField(default=False)
+
+    chunks_total = models.PositiveIntegerField(default=0)
+    chunks_done = models.PositiveIntegerField(default=0)
+    chunks_failed = models.PositiveIntegerField(default=0)
+    recipients_total = models.PositiveIntegerField(default=0)
+    recipients_delivered = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["-created"]
+
+    @property
+    def progress(self):
+        """Share of dispatched chunks that have finished, from 0 to 1."""
+        if not self.chunks_total:
+            return 1.0 if self.dispatched else 0.0
+        return (self.chunks_done + self.chunks_failed) / self.chunks_total
+
+    def __str__(self):
+        return f"{self.subject} ({self.channel}.{self.topic})"
+
+
+class CreditTransaction(BaseModel):
+    """
+    Append-only ledger entry for a change to one of a user's credit balances.
+
+    The balance columns on ``CustomUserModel`` are a running total of these
+    rows, maintained by ``access.credits``; the ledger is authoritative.
+    """
+
+    ACCOUNT_FIELDS = {
+        "dalle": "dalle_credits",
+        "subscription": "subscription_credits",
+    }
+
+    user = models.ForeignKey(
+        CustomUserModel, on_delete=models.CASCADE, related_name="credit_transactions"
+    )
+    account = models.CharField(
+        max_length=20, choices=[(account, account) for account in ACCOUNT_FIELDS]
+    )
+    # Negative for debits.
+    amount = models.IntegerField()
+    reason = models.CharField(max_length=100, blank=True, default="")
+    idempotency_key = models.CharField(max_length=100, null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created"]
+        indexes = [
+            models.Index(fields=["user", "created"], name="access_credit_user_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "idempotency_key"],
+                name="access_credit_idempotency_key",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.account} {self.amount:+d}"
@@ -0,0 +1,25 @@
+from rest_framework.pagination import CursorPagination
+
+
+class UserCursorPagination(CursorPagination):
+    """
+    Keyset pagination over users, newest first.
+
+    ``userId`` breaks ties between users created in the same instant so the
+    order is deterministic. Backed by the ``access_user_created_idx`` index.
+    """
+
+    ordering = ("-created", "-userId")
+
+
+class LoggedDeviceCursorPagination(CursorPagination):
+    """
+    Keyset pagination over a user's devices, most recently used first.
+
+    The cursor positions on ``last_login_at`` alone and skips past devices
+    sharing that instant by offset, which is why the column is non-null:
+    DRF's cursor filter would silently drop rows with a NULL key. Backed by
+    the ``access_device_login_idx`` index.
+    """
+
+    ordering = ("-last_login_at", "-id")
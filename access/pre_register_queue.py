@@ -0,0 +1,122 @@
+"""
+Asynchronous ingestion queue for anonymous pre-registrations.
+
+With ``PRE_REGISTER_ASYNC`` enabled, ``PreRegisterViewSet.create`` only
+validates the email format and appends it to a sequence-numbered log in the
+shared cache, then answers 202. ``drain`` (run by the ``drain_pre_registrations``
+task, on the beat schedule and whenever ``PRE_REGISTER_BATCH_SIZE`` emails have
+queued up) writes the log to the database with one
+``bulk_create(ignore_conflicts=True)`` per batch, so a traffic spike turns into
+a handful of inserts instead of one transaction per request.
+
+Log entries do not expire; they are deleted once written. The flag requires
+``REDIS_URL``: with the per-process fallback cache the workers would never see
+the log, so settings refuse to load.
+"""
+
+import logging
+
+from prometheus_client import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+PRE_REGISTRATIONS_QUEUED = Counter(
+    "access_pre_registrations_queued_total",
+    "Pre-registrations appended to the ingestion queue",
+)
+PRE_REGISTRATIONS_DEDUPLICATED = Counter(
+    "access_pre_registrations_deduplicated_total",
+    "Pre-registrations dropped because the email was queued recently",
+)
+PRE_REGISTRATIONS_WRITTEN = Counter(
+    "access_pre_registrations_written_total",
+    "Queued pre-registrations handed to the database by the consumer",
+)
+
+SEQ_KEY = "access:pre_register:seq"
+DRAINED_KEY = "access:pre_register:drained"
+LAST_HEAD_KEY = "access:pre_register:last_head"
+DRAIN_LOCK_KEY = "access:pre_register:drain_lock"
+DRAIN_LOCK_TIMEOUT = 300
+# Repeat submissions of the same email within this window are dropped
+# before they reach the queue.
+DEDUPLICATION_TIMEOUT = 3600
+
+
+def log_key(seq):
+    return f"access:pre_register:log:{seq}"
+
+
+def seen_key(email):
+    return f"access:pre_register:seen:{email}"
+
+
+def enqueue(email):
+    """Queue ``email`` for insertion; returns False if it was a recent repeat."""
+    if not cache.add(seen_key(email), 1, timeout=DEDUPLICATION_TIMEOUT):
+        PRE_REGISTRATIONS_DEDUPLICATED.inc()
+        return False
+    try:
+        seq = cache.incr(SEQ_KEY)
+    except ValueError:
+        cache.add(SEQ_KEY, 0, timeout=None)
+        seq = cache.incr(SEQ_KEY)
+    cache.set(log_key(seq), email, timeout=None)
+    PRE_REGISTRATIONS_QUEUED.inc()
+
+    if seq % settings.PRE_REGISTER_BATCH_SIZE == 0:
+        from .tasks import drain_pre_registrations
+
+        drain_pre_registrations.delay()
+    return True
+
+
+def _write_batch(emails):
+    from .models import PreRegister
+
+    PreRegister.objects.bulk_create(
+        [PreRegister(email=email) for email in emails], ignore_conflicts=True
+    )
+
+
+def drain():
+    """Insert queued pre-registrations; returns the number of emails read."""
+    if not cache.add(DRAIN_LOCK_KEY, 1, timeout=DRAIN_LOCK_TIMEOUT):
+        logger.info("Pre-registration drain already running")
+        return 0
+
+    batch_size = settings.PRE_REGISTER_BATCH_SIZE
+    try:
+        state = cache.get_many([SEQ_KEY, DRAINED_KEY, LAST_HEAD_KEY])
+        head = state.get(SEQ_KEY, 0)
+        start = state.get(DRAINED_KEY, 0) + 1
+        last_head = state.get(LAST_HEAD_KEY, 0)
+
+        # Same in-flight gap handling as access.login_buffer.flush: stop at
+        # an entry missing above the previous head and retry it next run.
+        drained_upto = head
+        drained = 0
+        for chunk_start in range(start, head + 1, batch_size):
+            seqs = range(chunk_start, min(chunk_start + batch_size, head + 1))
+            entries = cache.get_many([log_key(seq) for seq in seqs])
+            emails = []
+            for seq in seqs:
+                email = entries.get(log_key(seq))
+                if email is not None:
+                    emails.append(email)
+                elif seq > last_head and drained_upto == head:
+                    drained_upto = seq - 1
+            if emails:
+                _write_batch(emails)
+                drained += len(emails)
+            cache.set(DRAINED_KEY, min(seqs[-1], drained_upto), timeout=None)
+            cache.delete_many([log_key(seq) for seq in seqs if seq <= drained_upto])
+
+        cache.set_many({DRAINED_KEY: drained_upto, LAST_HEAD_KEY: head}, timeout=None)
+        PRE_REGISTRATIONS_WRITTEN.inc(drained)
+        return drained
+    finally:
+        cache.delete(DRAIN_LOCK_KEY)
@@ -0,0 +1,107 @@
+"""
+Versioned cache for serialized user profiles.
+
+Every user has an opaque profile version in the shared cache, replaced by the
+``CustomUserModel`` save/delete signals in ``access.signals``. Rendered
+profiles are cached under the version they were rendered from, so a render
+that races a save is simply never read again, and the version doubles as the
+ETag for ``/api/access/users/me/``: a matching ``If-None-Match`` is answered
+with 304 from one cache read, without touching the database or a serializer.
+
+Renders always start from a fresh database row (``fresh``): the instance on
+``request.user`` comes from the per-process tier of ``access.user_cache``,
+which other processes only invalidate when it expires, and caching a
+rendering of it under the new version would serve the stale profile for
+``PROFILE_CACHE_TIMEOUT``.
+
+As with ``access.user_cache``, changes made through ``QuerySet.update()``
+bypass signals and must call ``bump_version`` explicitly.
+"""
+
+import hashlib
+import logging
+from uuid import uuid4
+
+from prometheus_client import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+PROFILE_CACHE_REQUESTS = Counter(
+    "access_profile_cache_requests_total",
+    "Profile lookups by how they were served",
+    ["result"],
+)
+
+
+def version_key(user_id):
+    return f"access:profile:version:{user_id}"
+
+
+def profile_key(user_id, version, variant):
+    return f"access:profile:{user_id}:{version}:{variant}"
+
+
+def get_version(user_id):
+    """
+    Return the current profile version of ``user_id``, creating one if needed.
+
+    Returns ``None`` when the shared cache is unavailable.
+    """
+    key = version_key(user_id)
+    try:
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, uuid4().hex, timeout=settings.PROFILE_CACHE_TIMEOUT)
+            version = cache.get(key)
+    except Exception:
+        logger.warning("Shared profile cache unavailable", exc_info=True)
+        return None
+    return version
+
+
+def bump_version(user_id):
+    """Invalidate every cached rendering of ``user_id``'s profile."""
+    try:
+        cache.set(
+            version_key(user_id), uuid4().hex, timeout=settings.PROFILE_CACHE_TIMEOUT
+        )
+    except Exception:
+        logger.warning("Shared profile cache unavailable", exc_info=True)
+
+
+def etag(version, variant):
+    digest = hashlib.blake2b(f"{version}:{variant}".encode(), digest_size=16)
+    return f'"{digest.hexdigest()}"'
+
+
+def fresh(user):
+    """Reload ``user`` from the database before rendering it."""
+    return type(user)._default_manager.get(pk=user.pk)
+
+
+def get_or_render(user_id, version, variant, render):
+    """Return the cached rendering for ``version``, calling ``render`` on a miss."""
+    key = profile_key(user_id, version, variant)
+    try:
+        data = cache.get(key)
+    except Exception:
+        logger.warning("Shared profile cache unavailable", exc_info=True)
+        return render()
+    if data is not None:
+        PROFILE_CACHE_REQUESTS.labels(result="hit").inc()
+        return data
+    PROFILE_CACHE_REQUESTS.labels(result="miss").inc()
+    data = render()
+    cache.set(key, data, timeout=settings.PROFILE_CACHE_TIMEOUT)
+    return data
+
+
+def whoami(user):
+    """Return ``user.whoami`` as of the last save, cached per profile version."""
+    version = None if user._state.adding else get_version(user.pk)
+    if version is None:
+        return user.build_whoami()
+    return get_or_render(user.pk, version, "whoami", lambda: fresh(user).build_whoami())
@@ -0,0 +1,56 @@
+"""
+Retention for the append-only control tables.
+
+``ResetPasswordControl`` and ``EmailConfirmationControl`` are range
+partitioned by month on PostgreSQL (see migration 0003), so expiring them is
+a partition drop. ``PreRegister`` keeps its unique ``email`` constraint,
+which the batched ingestion in ``access.pre_register_queue`` relies on and
+which cannot span partitions, so it is purged with chunked deletes, and only
+when ``PRE_REGISTER_RETENTION_DAYS`` is set.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from general import partitioning
+
+from .models import EmailConfirmationControl, PreRegister, ResetPasswordControl
+
+PARTITIONED_MODELS = (ResetPasswordControl, EmailConfirmationControl)
+
+
+def retention_policies():
+    """Return ``(model, retention days)`` pairs; 0 days keeps rows forever."""
+    return (
+        (ResetPasswordControl, settings.CONTROL_TABLE_RETENTION_DAYS),
+        (EmailConfirmationControl, settings.CONTROL_TABLE_RETENTION_DAYS),
+        (PreRegister, settings.PRE_REGISTER_RETENTION_DAYS),
+    )
+
+
+def maintain_partitions():
+    """Create upcoming monthly partitions; returns the partition names."""
+    created = []
+    for model in PARTITIONED_MODELS:
+        created += partitioning.ensure_partitions(
+            model, settings.CONTROL_TABLE_PARTITION_MONTHS_AHEAD
+        )
+    return created
+
+
+def purge_expired():
+    """Apply every retention policy; returns the removals per table."""
+    now = timezone.now()
+    results = {}
+    for model, days in retention_policies():
+        if days <= 0:
+            continue
+        results[model._meta.db_table] = partitioning.purge(
+            model,
+            "date",
+            now - timedelta(days=days),
+            settings.RETENTION_PURGE_CHUNK_SIZE,
+        )
+    return results
@@ -0,0 +1,207 @@
+"""
+Cache-backed revocation store for JWTs.
+
+Revoked refresh tokens and "revoke all sessions" cut-offs live in the shared
+Django cache (Redis in production) and expire together with the tokens they
+cover. Every process keeps a Bloom filter of the revocations it has seen, fed
+from an append-only log in the cache at most once per
+``TOKEN_REVOCATION_SYNC_INTERVAL`` seconds, so the common "not revoked"
+answer never leaves the process.
+
+Refresh rotation does not go through the log: ``claim_for_rotation`` is an
+atomic ``add`` that both checks and revokes the presented token, which is the
+only place a rotated-out refresh token can ever be replayed.
+
+``iat`` only has one-second resolution, so tokens issued by this project also
+carry ``ISSUED_AT_CLAIM`` with the sub-second issue time (see ``stamp``). A
+"revoke all sessions" cut-off is compared against it, and a login right after
+the revocation stays valid even within the same second.
+"""
+
+import logging
+import threading
+import time
+
+from prometheus_client import Counter
+from rest_framework_simplejwt.settings import api_settings
+
+from django.conf import settings
+from django.core.cache import cache
+
+from general.cache import BloomFilter
+
+logger = logging.getLogger(__name__)
+
+REVOCATION_CHECKS = Counter(
+    "access_token_revocation_checks_total",
+    "Token revocation checks by outcome",
+    ["result"],
+)
+
+SEQ_KEY = "access:revoked:seq"
+FLOOR_KEY = "access:revoked:floor"
+SYNC_CHUNK_SIZE = 1000
+ISSUED_AT_CLAIM = "issued_at"
+
+
+def token_key(jti):
+    return f"access:revoked:jti:{jti}"
+
+
+def user_key(user_id):
+    return f"access:revoked:user:{user_id}"
+
+
+def log_key(seq):
+    return f"access:revoked:log:{seq}"
+
+
+def stamp(token):
+    """Record the sub-second issue time of a freshly issued ``token``."""
+    token[ISSUED_AT_CLAIM] = time.time()
+    return token
+
+
+def issued_before(token, cutoff):
+    """Return whether ``token`` was issued no later than ``cutoff``."""
+    issued = token.get(ISSUED_AT_CLAIM)
+    if issued is None:
+        # Tokens without the claim are only known to the second.
+        return token.get("iat", 0) <= cutoff
+    return issued <= cutoff
+
+
+def _remaining_lifetime(token):
+    return max(1, int(token["exp"] - time.time()))
+
+
+class RevocationStore:
+    def __init__(self, capacity, error_rate, sync_interval):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._bloom = BloomFilter(self.capacity, self.error_rate)
+        self._seq = 0
+        self._synced_at = float("-inf")
+
+    def _append_log(self, item, timeout):
+        cache.add(SEQ_KEY, 0, timeout=None)
+        seq = cache.incr(SEQ_KEY)
+        cache.set(log_key(seq), item, timeout)
+        with self._lock:
+            self._bloom.add(item)
+
+    def sync(self, force=False):
+        """Pull revocations logged by other processes into the Bloom filter."""
+        now = time.monotonic()
+        if not force and now - self._synced_at < self.sync_interval:
+            return
+        with self._lock:
+            self._synced_at = now
+            try:
+                state = cache.get_many([SEQ_KEY, FLOOR_KEY])
+                head = state.get(SEQ_KEY, 0)
+                floor = state.get(FLOOR_KEY, 1)
+                start = max(self._seq + 1, floor)
+                first_live = None
+                for chunk_start in range(start, head + 1, SYNC_CHUNK_SIZE):
+                    chunk_end = min(chunk_start + SYNC_CHUNK_SIZE, head + 1)
+                    keys = [log_key(seq) for seq in range(chunk_start, chunk_end)]
+                    entries = cache.get_many(keys)
+                    for seq in range(chunk_start, chunk_end):
+                        item = entries.get(log_key(seq))
+                        if item is None:
+                            continue
+                        if first_live is None:
+                            first_live = seq
+                        self._bloom.add(item)
+                if start == floor and first_live and first_live > floor:
+                    cache.set(FLOOR_KEY, first_live, timeout=None)
+            except Exception:
+                logger.warning("Token revocation log unavailable", exc_info=True)
+                return
+            self._seq = max(self._seq, head)
+            # Duplicates and expired entries keep counting towards capacity,
+            # so start over from the live part of the log once full.
+            rebuild = self._bloom.saturated and start > floor
+            if rebuild:
+                self._reset()
+        if rebuild:
+            self.sync(force=True)
+
+    def claim_for_rotation(self, token):
+        """
+        Atomically revoke ``token`` unless it already was.
+
+        Returns ``False`` when the token had already been revoked, i.e. it is
+        being replayed.
+        """
+        claimed = cache.add(
+            token_key(token[api_settings.JTI_CLAIM]),
+            1,
+            timeout=_remaining_lifetime(token),
+        )
+        REVOCATION_CHECKS.labels(result="claimed" if claimed else "revoked").inc()
+        return claimed
+
+    def revoke_token(self, token):
+        """Revoke a single token, e.g. on logout."""
+        jti = token[api_settings.JTI_CLAIM]
+        timeout = _remaining_lifetime(token)
+        cache.set(token_key(jti), 1, timeout)
+        self._append_log(f"jti:{jti}", timeout)
+
+    def revoke_user(self, user_id):
+        """
+        Revoke every token issued to ``user_id`` up to now.
+
+        Tokens without ``ISSUED_AT_CLAIM`` issued during the same second are
+        revoked as well.
+        """
+        timeout = int(
+            max(
+                api_settings.ACCESS_TOKEN_LIFETIME,
+                api_settings.REFRESH_TOKEN_LIFETIME,
+            ).total_seconds()
+        )
+        cache.set(user_key(user_id), time.time(), timeout)
+        self._append_log(f"user:{user_id}", timeout)
+
+    def is_revoked(self, token):
+        """Return whether ``token`` or its user's sessions were revoked."""
+        self.sync()
+        jti = token.get(api_settings.JTI_CLAIM)
+        user_id = token.get(api_settings.USER_ID_CLAIM)
+
+        keys = []
+        if jti is not None and f"jti:{jti}" in self._bloom:
+            keys.append(token_key(jti))
+        if user_id is not None and f"user:{user_id}" in self._bloom:
+            keys.append(user_key(user_id))
+        if not keys:
+            REVOCATION_CHECKS.labels(result="bloom_negative").inc()
+            return False
+
+        try:
+            found = cache.get_many(keys)
+        except Exception:
+            logger.warning("Token revocation store unavailable", exc_info=True)
+            found = {}
+
+        revoked = token_key(jti) in found
+        cutoff = found.get(user_key(user_id))
+        if cutoff is not None and issued_before(token, cutoff):
+            revoked = True
+        REVOCATION_CHECKS.labels(result="revoked" if revoked else "not_revoked").inc()
+        return revoked
+
+
+store = RevocationStore(
+    capacity=settings.TOKEN_REVOCATION_BLOOM_CAPACITY,
+    error_rate=settings.TOKEN_REVOCATION_BLOOM_ERROR_RATE,
+    sync_interval=settings.TOKEN_REVOCATION_SYNC_INTERVAL,
+)
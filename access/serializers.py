@@ -1,8 +1,12 @@
 from rest_framework import serializers
 
 from django.contrib.auth.password_validation import validate_password
+from django.db import IntegrityError, transaction
+from django.db.models import Q
 
+from .broadcast import CHANNEL_BACKENDS
 from .models import (
+    Broadcast,
     CustomUserModel,
     EmailConfirmationControl,
     LoggedDevice,
@@ -10,9 +14,20 @@ from .models import (
     PreRegister,
     ResetPasswordControl,
 )
+from .tasks import fan_out_broadcast, process_avatar, request_email_confirmation
+
+UNIQUE_USER_FIELDS = ("email", "username", "phone_number")
 
 
 class CustomUserSerializer(serializers.ModelSerializer):
+    """
+    User serializer used for registration and profile updates.
+
+    Uniqueness of email, username and phone_number is enforced by the
+    database rather than pre-checked with one query per field; a violation
+    is mapped back to the offending fields after the failed write.
+    """
+
     password = serializers.CharField(write_only=True, validators=[validate_password])
     password_confirm = serializers.CharField(write_only=True)
 
@@ -41,33 +56,103 @@ class CustomUserSerializer(serializers.ModelSerializer):
             "dalle_credits",
             "subscription_credits",
         )
+        extra_kwargs = {field: {"validators": []} for field in UNIQUE_USER_FIELDS}
 
     def validate(self, attrs):
         if attrs.get("password") != attrs.get("password_confirm"):
             raise serializers.ValidationError("Password fields didn't match.")
         return attrs
 
+    def _save_unique(self, instance, **kwargs):
+        try:
+            with transaction.atomic():
+                instance.save(**kwargs)
+        except IntegrityError:
+            lookup = Q()
+            for field in UNIQUE_USER_FIELDS:
+                value = getattr(instance, field)
+                if value is not None:
+                    lookup |= Q(**{field: value})
+            taken = (
+                CustomUserModel.objects.filter(lookup)
+                .exclude(pk=instance.pk)
+                .values(*UNIQUE_USER_FIELDS)
+            )
+            errors = {}
+            for row in taken:
+                for field in UNIQUE_USER_FIELDS:
+                    if row[field] is not None and row[field] == getattr(
+                        instance, field
+                    ):
+                        error = instance.unique_error_message(CustomUserModel, (field,))
+                        errors[field] = error.messages
+            if not errors:
+                raise
+            raise serializers.ValidationError(errors)
+
     def create(self, validated_data):
         validated_data.pop("password_confirm", None)
         password = validated_data.pop("password")
-        user = CustomUserModel.objects.create_user(**validated_data)
+        validated_data["email"] = CustomUserModel.objects.normalize_email(
+            validated_data["email"]
+        )
+        user = CustomUserModel(**validated_data)
         user.set_password(password)
-        user.save()
+        self._save_unique(user, force_insert=True)
+
+        transaction.on_commit(lambda: request_email_confirmation.delay(user.email))
         return user
 
     def update(self, instance, validated_data):
         validated_data.pop("password_confirm", None)
         password = validated_data.pop("password", None)
 
+        # Only write the submitted columns, so a profile update cannot
+        # overwrite balances changed concurrently through access.credits.
+        update_fields = {*validated_data, "updated"}
+
+        stale_variants = None
+        if "avatar" in validated_data:
+            stale_variants = list(instance.avatar_variants.values())
+            instance.avatar_variants = {}
+            update_fields.add("avatar_variants")
+
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
 
         if password:
             instance.set_password(password)
+            update_fields.add("password")
 
-        instance.save()
+        self._save_unique(instance, update_fields=update_fields)
+
+        if stale_variants is not None:
+            self._schedule_avatar_processing(instance, stale_variants)
         return instance
 
+    def _schedule_avatar_processing(self, user, stale_variants):
+        # Variants are rendered off the request, once the upload is committed.
+        user_id, name = str(user.pk), user.avatar.name or None
+        if name or stale_variants:
+            transaction.on_commit(
+                lambda: process_avatar.delay(user_id, name, stale_variants)
+            )
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        request = self.context.get("request")
+        size = None
+        if request is not None:
+            try:
+                size = int(request.query_params.get("avatar_size", ""))
+            except (TypeError, ValueError):
+                size = None
+        url = instance.avatar_url(size)
+        if url and request is not None:
+            url = request.build_absolute_uri(url)
+        data["avatar"] = url
+        return data
+
 
 class CustomUserListSerializer(serializers.ModelSerializer):
     """Simplified serializer for user lists"""
@@ -110,6 +195,12 @@ class PreRegisterSerializer(serializers.ModelSerializer):
         read_only_fields = ("id", "created", "updated", "date")
 
 
+class PreRegisterQueueSerializer(serializers.Serializer):
+    """Format-only validation for queued pre-registrations"""
+
+    email = serializers.EmailField(max_length=200)
+
+
 class LoggedDeviceSerializer(serializers.ModelSerializer):
     user_email = serializers.CharField(source="user.email", read_only=True)
 
@@ -135,3 +226,59 @@ class LoggedDeviceSerializer(serializers.ModelSerializer):
                 "Device with this user, type, and name already exists."
             )
         return attrs
+
+
+class LoggedDeviceRegisterSerializer(serializers.Serializer):
+    """Input for registering a device or refreshing its login time"""
+
+    device_type = serializers.ChoiceField(choices=LoggedDevice.DEVICE_TYPE_CHOICES)
+    device_name = serializers.CharField(max_length=255)
+    place = serializers.CharField(max_length=100, required=False)
+
+
+class BroadcastSerializer(serializers.ModelSerializer):
+    """Broadcast notification; creating one starts its fan-out"""
+
+    progress = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = Broadcast
+        fields = (
+            "id",
+            "channel",
+            "topic",
+            "subject",
+            "body",
+            "status",
+            "progress",
+            "chunks_total",
+            "chunks_done",
+            "chunks_failed",
+            "recipients_total",
+            "recipients_delivered",
+            "created",
+            "updated",
+        )
+        read_only_fields = (
+            "id",
+            "status",
+            "chunks_total",
+            "chunks_done",
+            "chunks_failed",
+            "recipients_total",
+            "recipients_delivered",
+            "created",
+            "updated",
+        )
+
+    def validate_channel(self, value):
+        if value not in CHANNEL_BACKENDS:
+            raise serializers.ValidationError(
+                f"Broadcasts cannot be sent on the {value} channel yet."
+            )
+        return value
+
+    def create(self, validated_data):
+        broadcast = super().create(validated_data)
+        transaction.on_commit(lambda: fan_out_broadcast.delay(str(broadcast.pk)))
+        return broadcast
@@ -0,0 +1,19 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import profile_cache, user_cache
+from .models import CustomUserModel
+
+
+@receiver(post_save, sender=CustomUserModel)
+@receiver(post_delete, sender=CustomUserModel)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """Keep the authentication and profile caches in sync with the users table."""
+    user_id = instance.pk
+    user_cache.invalidate_user(user_id)
+    profile_cache.bump_version(user_id)
+    # Drop it again once committed so a concurrent request cannot re-cache
+    # the pre-transaction row.
+    transaction.on_commit(lambda: user_cache.invalidate_user(user_id))
+    transaction.on_commit(lambda: profile_cache.bump_version(user_id))
@@ -0,0 +1,83 @@
+import logging
+from smtplib import SMTPException
+
+from celery import Task, shared_task
+
+from django.conf import settings
+
+from . import avatars, broadcast, credits, login_buffer, pre_register_queue, retention
+from .models import EmailConfirmationControl
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def request_email_confirmation(email):
+    """Record an email confirmation request for a newly registered user"""
+    logger.info(f"Requesting email confirmation for {email}")
+    EmailConfirmationControl.objects.create(email=email)
+
+
+@shared_task
+def flush_device_logins():
+    """Write buffered LoggedDevice login times to the database"""
+    flushed = login_buffer.flush()
+    logger.info(f"Flushed login times for {flushed} devices")
+    return flushed
+
+
+@shared_task
+def drain_pre_registrations():
+    """Insert queued pre-registrations in batches"""
+    drained = pre_register_queue.drain()
+    logger.info(f"Drained {drained} queued pre-registrations")
+    return drained
+
+
+@shared_task
+def purge_control_tables():
+    """Create upcoming partitions and drop or delete expired control rows"""
+    retention.maintain_partitions()
+    results = retention.purge_expired()
+    logger.info(f"Purged expired control table rows: {results}")
+    return results
+
+
+@shared_task
+def fan_out_broadcast(broadcast_id):
+    """Split a broadcast's audience into chunk tasks"""
+    chunks = broadcast.dispatch(broadcast_id)
+    logger.info(f"Dispatched {chunks} chunks for broadcast {broadcast_id}")
+    return chunks
+
+
+class BroadcastChunkTask(Task):
+    autoretry_for = (SMTPException, OSError)
+    retry_backoff = True
+    max_retries = 5
+    ignore_result = True
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        # Only called once the retries are exhausted.
+        broadcast.record_failed_chunk(args[0], args[1])
+
+
+@shared_task(base=BroadcastChunkTask)
+def deliver_broadcast_chunk(broadcast_id, chunk_index, after, upto):
+    """Deliver a broadcast to one chunk of its recipients"""
+    return broadcast.deliver_chunk(broadcast_id, chunk_index, after, upto)
+
+
+@shared_task
+def process_avatar(user_id, original_name, stale=()):
+    """Render the resized variants of a newly uploaded avatar"""
+    variants = avatars.process_avatar(user_id, original_name, stale)
+    logger.info(f"Rendered {len(variants)} avatar variants for {user_id}")
+
+
+@shared_task
+def reconcile_credit_balances():
+    """Correct credit balance columns that drifted from the ledger"""
+    corrected = credits.reconcile(settings.CREDIT_RECONCILE_CHUNK_SIZE)
+    logger.info(f"Corrected credit balances of {corrected} users")
+    return corrected
@@ -1,19 +1,63 @@
+import gzip
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import skipUnless
+from unittest.mock import Mock, patch
+
+from PIL import Image
 from rest_framework import status
 from rest_framework.test import APIClient, APITestCase
 from rest_framework_simplejwt.tokens import RefreshToken
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.contrib.auth.hashers import make_password
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-
+from django.utils import timezone
+
+from django_app.celery import app
+from general import partitioning
+from general.testing import QueryBudgetMixin
+from general.throttling import limiter
+
+from . import profile_cache, revocation, tasks, user_cache
+from .avatars import process_avatar
+from .broadcast import (
+    CHANNEL_BACKENDS,
+    deliver_chunk,
+    deliver_email,
+    record_failed_chunk,
+)
+from .credits import IdempotencyKeyReused, InsufficientCredits, credit, debit, reconcile
+from .hashers import PasswordHashingUnavailable, pool
+from .login_buffer import flush, record_login
 from .models import (
+    Broadcast,
     CustomUserModel,
     EmailConfirmationControl,
     LoggedDevice,
     PasswordRecoveryEmail,
     PreRegister,
     ResetPasswordControl,
+    default_notification_settings,
+    subscription_condition,
 )
+from .pagination import LoggedDeviceCursorPagination, UserCursorPagination
 from .serializers import (
     CustomUserSerializer,
     EmailConfirmationControlSerializer,
@@ -22,6 +66,7 @@ from .serializers import (
     PreRegisterSerializer,
     ResetPasswordControlSerializer,
 )
+from .tasks import fan_out_broadcast, purge_control_tables
 
 
 class CustomUserModelTests(TestCase):
@@ -156,6 +201,8 @@ class APITests(APITestCase):
     """Test the API endpoints"""
 
     def setUp(self):
+        limiter.reset()
+        self.addCleanup(limiter.reset)
         self.client = APIClient()
         self.user_data = {
             "username": "testuser",
@@ -337,11 +384,1189 @@ class SerializerTests(TestCase):
         data = {"device_type": "desktop", "device_name": "Chrome"}
 
         # Create mock request with user
-        from unittest.mock import Mock
-
         request = Mock()
         request.user = self.user
 
         serializer = LoggedDeviceSerializer(data=data, context={"request": request})
         self.assertFalse(serializer.is_valid())
         self.assertIn("non_field_errors", serializer.errors)
+
+
+class UserCacheTests(APITestCase):
+    """Test the cached JWT user resolution"""
+
+    def setUp(self):
+        cache.clear()
+        user_cache.clear_local()
+        self.user = CustomUserModel.objects.create_user(
+            username="cacheuser", email="cache@example.com", password="cachepass123"
+        )
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_cached_user_skips_database(self):
+        """Test that a warm cache authenticates without queries"""
+        url = reverse("customusermodel-current-user")
+        self.client.get(url)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["email"], self.user.email)
+
+    def test_save_invalidates_cached_user(self):
+        """Test that saving the user refreshes the cached copy"""
+        url = reverse("customusermodel-current-user")
+        self.client.get(url)
+
+        self.user.username = "renamed"
+        self.user.save()
+
+        response = self.client.get(url)
+        self.assertEqual(response.data["username"], "renamed")
+
+    def test_deleted_user_is_rejected(self):
+        """Test that deleting the user evicts it from the cache"""
+        url = reverse("customusermodel-current-user")
+        self.client.get(url)
+
+        self.user.delete()
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class TokenRevocationTests(APITestCase):
+    """Test refresh rotation and session revocation"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUserModel.objects.create_user(
+            username="revokeuser", email="revoke@example.com", password="revokepass123"
+        )
+        self.refresh = RefreshToken.for_user(self.user)
+
+    def test_refresh_rotates_token(self):
+        """Test that refreshing returns a new refresh token"""
+        url = reverse("token_refresh")
+        response = self.client.post(url, {"refresh": str(self.refresh)}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("access", response.data)
+        self.assertNotEqual(response.data["refresh"], str(self.refresh))
+
+    def test_rotated_refresh_token_is_revoked(self):
+        """Test that a rotated-out refresh token cannot be replayed"""
+        url = reverse("token_refresh")
+        self.client.post(url, {"refresh": str(self.refresh)}, format="json")
+        response = self.client.post(url, {"refresh": str(self.refresh)}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revoke_sessions(self):
+        """Test revoking every session of the current user"""
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {self.refresh.access_token}"
+        )
+        response = self.client.post(reverse("customusermodel-revoke-sessions"))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        response = self.client.get(reverse("customusermodel-current-user"))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.credentials()
+        response = self.client.post(
+            reverse("token_refresh"), {"refresh": str(self.refresh)}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_login_in_the_same_second_as_revocation_is_valid(self):
+        """Test that revoking sessions spares tokens issued right after it"""
+        second = int(time.time())
+        before, after = RefreshToken.for_user(self.user), RefreshToken.for_user(
+            self.user
+        )
+        for token, offset in ((before, 0.25), (after, 0.75)):
+            token["iat"] = second
+            token[revocation.ISSUED_AT_CLAIM] = second + offset
+        with patch("access.revocation.time.time", return_value=second + 0.5):
+            revocation.store.revoke_user(self.user.pk)
+
+        self.assertTrue(revocation.store.is_revoked(before))
+        self.assertFalse(revocation.store.is_revoked(after))
+
+
+class PasswordHashingTests(APITestCase):
+    """Test the pooled password hasher"""
+
+    def setUp(self):
+        limiter.reset()
+        self.addCleanup(limiter.reset)
+
+    def tearDown(self):
+        pool.shutdown()
+
+    @override_settings(PASSWORD_HASHING_POOL_SIZE=1, PASSWORD_HASHING_ITERATIONS=1000)
+    def test_pool_mode_hashes_and_verifies(self):
+        """Test that hashing in the process pool round-trips"""
+        user = CustomUserModel.objects.create_user(
+            username="pooluser", email="pool@example.com", password="poolpass123"
+        )
+
+        self.assertTrue(user.password.startswith("pbkdf2_sha256$1000$"))
+        self.assertTrue(user.check_password("poolpass123"))
+        self.assertFalse(user.check_password("wrongpass123"))
+
+    @override_settings(PASSWORD_HASHING_POOL_SIZE=1, PASSWORD_HASHING_MAX_QUEUE=0)
+    def test_saturated_pool_returns_503(self):
+        """Test that login fails fast when no hashing slot is free"""
+        response = self.client.post(
+            reverse("token_obtain_pair"),
+            {"email": "nobody@example.com", "password": "whatever123"},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    @override_settings(
+        PASSWORD_HASHING_POOL_SIZE=1, PASSWORD_HASHING_QUEUE_TIMEOUT=0.05
+    )
+    def test_caller_stops_waiting_after_queue_timeout(self):
+        """Test that a caller behind a busy pool gets a 503 instead of blocking"""
+        future = Future()
+        executor = Mock()
+        executor.submit.return_value = future
+        slots = threading.BoundedSemaphore(1)
+        with patch.object(pool, "_get_executor", return_value=(executor, slots)):
+            with self.assertRaises(PasswordHashingUnavailable):
+                pool.encode("password", "salt", 1000)
+
+        self.assertTrue(future.cancelled())
+        # The slot was given back.
+        self.assertTrue(slots.acquire(blocking=False))
+
+    def test_login_rehashes_outdated_password(self):
+        """Test that login upgrades hashes made with another work factor"""
+        with self.settings(PASSWORD_HASHING_ITERATIONS=1000):
+            user = CustomUserModel.objects.create_user(
+                username="oldhash", email="oldhash@example.com", password="oldpass123"
+            )
+
+        with self.settings(PASSWORD_HASHING_ITERATIONS=2000):
+            response = self.client.post(
+                reverse("token_obtain_pair"),
+                {"email": "oldhash@example.com", "password": "oldpass123"},
+                format="json",
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith("pbkdf2_sha256$2000$"))
+
+
+@override_settings(PASSWORD_HASHING_ITERATIONS=1000)
+class RegistrationPipelineTests(APITestCase):
+    """Test the single-write registration pipeline"""
+
+    def setUp(self):
+        limiter.reset()
+        self.addCleanup(limiter.reset)
+        self.url = reverse("customusermodel-list")
+        self.user_data = {
+            "username": "signup",
+            "email": "signup@example.com",
+            "password": "signuppass123",
+            "password_confirm": "signuppass123",
+            "phone_number": "+15550000001",
+        }
+
+    def test_registration_hashes_once_and_inserts_once(self):
+        """Test that registration issues a single INSERT"""
+        with (
+            patch(
+                "django.contrib.auth.base_user.make_password", wraps=make_password
+            ) as hash_call,
+            CaptureQueriesContext(connection) as queries,
+        ):
+            response = self.client.post(self.url, self.user_data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(hash_call.call_count, 1)
+        statements = [
+            query["sql"]
+            for query in queries
+            if not query["sql"].startswith(("SAVEPOINT", "RELEASE"))
+        ]
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(statements[0].startswith("INSERT"))
+
+    def test_registration_schedules_confirmation_after_commit(self):
+        """Test that email confirmation is deferred until commit"""
+        with patch("access.serializers.request_email_confirmation.delay") as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(self.url, self.user_data, format="json")
+
+        delay.assert_called_once_with("signup@example.com")
+
+    def test_duplicate_fields_map_to_field_errors(self):
+        """Test that unique violations are reported per field"""
+        CustomUserModel.objects.create_user(
+            username="signup", email="signup@example.com", password="existing123"
+        )
+
+        response = self.client.post(self.url, self.user_data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("email", response.data)
+        self.assertIn("username", response.data)
+        self.assertNotIn("phone_number", response.data)
+        self.assertEqual(CustomUserModel.objects.count(), 1)
+
+
+@override_settings(PASSWORD_HASHING_ITERATIONS=1000)
+class ImportUsersCommandTests(TestCase):
+    """Test the import_users management command"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, "w") as handle:
+            handle.write(content)
+        return path
+
+    def test_import_csv(self):
+        """Test importing users from CSV with rejects"""
+        CustomUserModel.objects.create_user(
+            username="existing", email="existing@example.com", password="pass12345"
+        )
+        path = self.write(
+            "users.csv",
+            "email,username,password\n"
+            "one@example.com,one,secret123\n"
+            "two@example.com,two,\n"
+            "not-an-email,three,secret123\n"
+            "one@example.com,again,secret123\n"
+            "existing@example.com,other,secret123\n",
+        )
+        rejects = self.write("rejects.jsonl", "")
+        out = StringIO()
+
+        call_command(
+            "import_users", path, workers=0, batch_size=2, rejects=rejects, stdout=out
+        )
+
+        self.assertIn("Imported 2 users, rejected 3", out.getvalue())
+        self.assertTrue(
+            CustomUserModel.objects.get(email="one@example.com").check_password(
+                "secret123"
+            )
+        )
+        self.assertFalse(
+            CustomUserModel.objects.get(email="two@example.com").has_usable_password()
+        )
+        with open(rejects) as handle:
+            reasons = {row["line"]: row["reason"] for row in map(json.loads, handle)}
+        self.assertEqual(
+            reasons, {4: "invalid email", 5: "already exists", 6: "already exists"}
+        )
+
+    def test_import_jsonl_with_pre_hashed_passwords(self):
+        """Test importing Django-format password hashes as-is"""
+        password_hash = make_password("prehashed123")
+        path = self.write(
+            "users.jsonl",
+            f'{{"email": "hashed@example.com", "password_hash": "{password_hash}"}}\n'
+            '{"email": "bad@example.com", "password_hash": "nonsense"}\n',
+        )
+
+        call_command("import_users", path, workers=0, stdout=StringIO())
+
+        user = CustomUserModel.objects.get(email="hashed@example.com")
+        self.assertEqual(user.password, password_hash)
+        self.assertFalse(
+            CustomUserModel.objects.filter(email="bad@example.com").exists()
+        )
+
+
+class CursorPaginationTests(APITestCase):
+    """Test keyset pagination of users and devices"""
+
+    def setUp(self):
+        self.user = CustomUserModel.objects.create_user(
+            username="pager", email="pager@example.com", password="pagerpass123"
+        )
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def walk(self, url):
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn("count", response.data)
+            seen.extend(response.data["results"])
+            url = response.data["next"]
+        return seen
+
+    def test_user_list_walks_every_user_once(self):
+        """Test that following cursors visits each user exactly once"""
+        for i in range(4):
+            CustomUserModel.objects.create_user(
+                username=f"pager{i}", email=f"pager{i}@example.com", password=None
+            )
+
+        with patch.object(UserCursorPagination, "page_size", 2):
+            results = self.walk(reverse("customusermodel-list"))
+
+        user_ids = [row["userId"] for row in results]
+        self.assertEqual(len(user_ids), 5)
+        self.assertEqual(len(set(user_ids)), 5)
+
+    def test_device_list_is_ordered_by_last_login(self):
+        """Test that devices come back most recently used first"""
+        now = timezone.now()
+        for i in range(3):
+            LoggedDevice.objects.create(
+                user=self.user,
+                device_type="mobile",
+                device_name=f"Phone {i}",
+                last_login_at=now - timedelta(minutes=i),
+            )
+
+        results = self.walk(reverse("loggeddevice-list"))
+
+        self.assertEqual(
+            [row["device_name"] for row in results], ["Phone 0", "Phone 1", "Phone 2"]
+        )
+
+    def test_device_list_pages_through_devices_used_at_the_same_time(self):
+        """Test that cursors do not skip or repeat devices sharing a login time"""
+        now = timezone.now()
+        for i in range(5):
+            LoggedDevice.objects.create(
+                user=self.user,
+                device_type="mobile",
+                device_name=f"Phone {i}",
+                last_login_at=now - timedelta(minutes=i // 3),
+            )
+
+        with patch.object(LoggedDeviceCursorPagination, "page_size", 2):
+            results = self.walk(reverse("loggeddevice-list"))
+
+        names = [row["device_name"] for row in results]
+        self.assertEqual(sorted(names), [f"Phone {i}" for i in range(5)])
+
+
+class ExportTests(APITestCase):
+    """Test the streaming table exports"""
+
+    def setUp(self):
+        self.admin = CustomUserModel.objects.create_superuser(
+            username="admin", email="admin@example.com", password="adminpass123"
+        )
+        token = RefreshToken.for_user(self.admin).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        PreRegister.objects.create(email="wait1@example.com")
+        PreRegister.objects.create(email="wait2@example.com")
+
+    def test_ndjson_export(self):
+        """Test exporting a table as NDJSON"""
+        url = reverse("export_table", kwargs={"name": "pre-register"})
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        rows = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).splitlines()
+        ]
+        self.assertEqual(
+            sorted(row["email"] for row in rows),
+            ["wait1@example.com", "wait2@example.com"],
+        )
+
+    def test_gzipped_csv_export_excludes_passwords(self):
+        """Test exporting users as gzip-compressed CSV"""
+        url = reverse("export_table", kwargs={"name": "users"})
+        response = self.client.get(url, {"output": "csv", "gzip": "true"})
+
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertIn('filename="users.csv.gz"', response["Content-Disposition"])
+        body = gzip.decompress(b"".join(response.streaming_content)).decode()
+        header, row = body.splitlines()
+        self.assertTrue(header.startswith("userId,username,email"))
+        self.assertNotIn("password", header)
+        self.assertIn("admin@example.com", row)
+
+    def test_export_requires_staff(self):
+        """Test that regular users cannot export tables"""
+        user = CustomUserModel.objects.create_user(
+            username="regular", email="regular@example.com", password="regular123"
+        )
+        token = RefreshToken.for_user(user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+        url = reverse("export_table", kwargs={"name": "users"})
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+
+@override_settings(DEVICE_LOGIN_COALESCE=True)
+class DeviceLoginCoalescingTests(APITestCase):
+    """Test the write-coalescing buffer for device login times"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUserModel.objects.create_user(
+            username="phone", email="phone@example.com", password="phonepass123"
+        )
+        self.device = LoggedDevice.objects.create(
+            user=self.user, device_type="mobile", device_name="Phone"
+        )
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_touch_does_not_write_to_database(self):
+        """Test that update_login is buffered instead of saved"""
+        original = self.device.last_login_at
+        url = reverse("loggeddevice-update-login", kwargs={"pk": self.device.pk})
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(any(q["sql"].startswith("UPDATE") for q in queries))
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.last_login_at, original)
+
+    def test_reads_merge_pending_login_times(self):
+        """Test that list and detail reflect buffered touches"""
+        touched = record_login(self.device.pk)
+
+        detail = self.client.get(
+            reverse("loggeddevice-detail", kwargs={"pk": self.device.pk})
+        )
+        listing = self.client.get(reverse("loggeddevice-list"))
+
+        self.assertEqual(
+            detail.data["last_login_at"], touched.isoformat().replace("+00:00", "Z")
+        )
+        self.assertEqual(
+            listing.data["results"][0]["last_login_at"], detail.data["last_login_at"]
+        )
+
+    def test_flush_writes_latest_timestamp_once(self):
+        """Test that flushing applies the latest buffered time per device"""
+        first = self.device.last_login_at + timedelta(minutes=1)
+        latest = first + timedelta(minutes=1)
+        record_login(self.device.pk, first)
+        record_login(self.device.pk, latest)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(flush(), 1)
+
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.last_login_at, latest)
+        self.assertEqual(flush(), 0)
+
+    def test_requires_a_shared_cache(self):
+        """Test that the flag refuses to load without Redis behind the cache"""
+        for redis_url, refused in (("", True), ("redis://cache:6379/0", False)):
+            result = subprocess.run(
+                [sys.executable, "-c", "import django_app.settings"],
+                env={
+                    **os.environ,
+                    "DEVICE_LOGIN_COALESCE": "true",
+                    "REDIS_URL": redis_url,
+                },
+                capture_output=True,
+                text=True,
+            )
+            self.assertEqual(result.returncode != 0, refused, result.stderr)
+            self.assertEqual("DEVICE_LOGIN_COALESCE requires" in result.stderr, refused)
+
+
+class DeviceRegisterOrTouchTests(APITestCase):
+    """Test the single-statement device upsert"""
+
+    def setUp(self):
+        self.user = CustomUserModel.objects.create_user(
+            username="upsert", email="upsert@example.com", password="upsertpass123"
+        )
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.url = reverse("loggeddevice-register-or-touch")
+        self.client.get(reverse("customusermodel-current-user"))
+
+    def test_register_then_touch(self):
+        """Test that the first call registers and the second touches"""
+        data = {"device_type": "desktop", "device_name": "Firefox"}
+
+        with self.assertNumQueries(1):
+            first = self.client.post(self.url, data, format="json")
+        with self.assertNumQueries(1):
+            second = self.client.post(
+                self.url, {**data, "place": "Lisbon"}, format="json"
+            )
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.data["id"], second.data["id"])
+        self.assertEqual(second.data["user_email"], self.user.email)
+        self.assertEqual(second.data["place"], "Lisbon")
+        self.assertGreater(second.data["last_login_at"], first.data["last_login_at"])
+        self.assertEqual(LoggedDevice.objects.count(), 1)
+
+    def test_device_name_is_required(self):
+        """Test that devices without a name are rejected"""
+        response = self.client.post(self.url, {"device_type": "desktop"}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class QueryBudgetTests(QueryBudgetMixin, APITestCase):
+    """Test that list endpoints stay within their query budgets"""
+
+    def setUp(self):
+        self.user = CustomUserModel.objects.create_user(
+            username="budget",
+            email="budget@example.com",
+            password="budgetpass123",
+        )
+        for number in range(10):
+            LoggedDevice.objects.create(
+                user=self.user, device_type="desktop", device_name=f"Browser {number}"
+            )
+            CustomUserModel.objects.create_user(
+                username=f"member{number}",
+                email=f"member{number}@example.com",
+                password="memberpass123",
+            )
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.client.get(reverse("customusermodel-current-user"))
+
+    def test_device_list_budget(self):
+        """Test that listing devices does not look up the user per row"""
+        with self.assertQueryBudget(1):
+            response = self.client.get(reverse("loggeddevice-list"))
+
+        self.assertEqual(len(response.data["results"]), 10)
+
+    def test_user_list_budget(self):
+        """Test that listing users runs a fixed number of queries"""
+        with self.assertQueryBudget(1):
+            response = self.client.get(reverse("customusermodel-list"))
+
+        self.assertEqual(len(response.data["results"]), 11)
+
+
+@override_settings(PRE_REGISTER_ASYNC=True, PRE_REGISTER_BATCH_SIZE=3)
+class PreRegisterQueueTests(APITestCase):
+    """Test batched asynchronous pre-registration"""
+
+    def setUp(self):
+        cache.clear()
+        limiter.reset()
+        self.addCleanup(limiter.reset)
+        self.url = reverse("preregister-list")
+
+    def test_create_is_queued_without_queries(self):
+        """Test that a pre-registration is accepted without touching the database"""
+        with patch.object(tasks.drain_pre_registrations, "delay") as drain:
+            with self.assertNumQueries(0):
+                response = self.client.post(
+                    self.url, {"email": "queued@example.com"}, format="json"
+                )
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertFalse(PreRegister.objects.exists())
+        drain.assert_not_called()
+
+    def test_invalid_email_is_rejected(self):
+        """Test that the email format is still validated"""
+        response = self.client.post(self.url, {"email": "nope"}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_drain_inserts_in_batches(self):
+        """Test that the consumer writes queued emails with batch inserts"""
+        PreRegister.objects.create(email="existing@example.com")
+        emails = [f"burst{number}@example.com" for number in range(7)]
+        with patch.object(tasks.drain_pre_registrations, "delay") as drain:
+            for number, email in enumerate(
+                emails + ["existing@example.com", emails[0]]
+            ):
+                # A burst from many clients, each within its own budget.
+                self.client.post(
+                    self.url,
+                    {"email": email},
+                    format="json",
+                    REMOTE_ADDR=f"10.0.0.{number}",
+                )
+
+        # Eight emails were queued (the repeat was dropped), so two full
+        # batches triggered the consumer.
+        self.assertEqual(drain.call_count, 2)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(tasks.drain_pre_registrations(), 8)
+
+        inserts = [q for q in queries.captured_queries if "INSERT" in q["sql"]]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(PreRegister.objects.count(), 8)
+        self.assertEqual(tasks.drain_pre_registrations(), 0)
+
+    def test_requires_a_shared_cache(self):
+        """Test that the flag refuses to load without Redis behind the cache"""
+        for redis_url, refused in (("", True), ("redis://cache:6379/0", False)):
+            result = subprocess.run(
+                [sys.executable, "-c", "import django_app.settings"],
+                env={
+                    **os.environ,
+                    "PRE_REGISTER_ASYNC": "true",
+                    "REDIS_URL": redis_url,
+                },
+                capture_output=True,
+                text=True,
+            )
+            self.assertEqual(result.returncode != 0, refused, result.stderr)
+            self.assertEqual("PRE_REGISTER_ASYNC requires" in result.stderr, refused)
+
+
+class ThrottlingTests(APITestCase):
+    """Test the scoped rate limits on anonymous endpoints"""
+
+    def setUp(self):
+        limiter.reset()
+        self.addCleanup(limiter.reset)
+
+    def test_login_is_throttled(self):
+        """Test that repeated login attempts are answered with 429"""
+        url = reverse("token_obtain_pair")
+        data = {"email": "nobody@example.com", "password": "wrong"}
+        for _ in range(10):
+            response = self.client.post(url, data, format="json")
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        response = self.client.post(url, data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn("Retry-After", response)
+
+    def test_scopes_are_independent(self):
+        """Test that exhausting one scope does not affect another"""
+        url = reverse("preregister-list")
+        for number in range(6):
+            response = self.client.post(
+                url, {"email": f"wait{number}@example.com"}, format="json"
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        response = self.client.post(
+            reverse("token_obtain_pair"),
+            {"email": "nobody@example.com", "password": "wrong"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_reset_reads_are_not_throttled(self):
+        """Test that the password reset budget only applies to creation"""
+        user = CustomUserModel.objects.create_user(
+            username="reader", email="reader@example.com", password="readerpass123"
+        )
+        self.client.force_authenticate(user)
+        url = reverse("resetpasswordcontrol-list")
+        for _ in range(6):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class RetentionTests(TestCase):
+    """Test the control table retention purge"""
+
+    def age(self, model, pk, days):
+        model.objects.filter(pk=pk).update(date=timezone.now() - timedelta(days=days))
+
+    @override_settings(CONTROL_TABLE_RETENTION_DAYS=30, RETENTION_PURGE_CHUNK_SIZE=2)
+    def test_expired_rows_are_deleted_in_chunks(self):
+        """Test that only rows past the retention window are removed"""
+        for number in range(5):
+            old = ResetPasswordControl.objects.create(email=f"old{number}@example.com")
+            self.age(ResetPasswordControl, old.pk, 31)
+            old = EmailConfirmationControl.objects.create(
+                email=f"old{number}@example.com"
+            )
+            self.age(EmailConfirmationControl, old.pk, 31)
+        ResetPasswordControl.objects.create(email="recent@example.com")
+        pre_register = PreRegister.objects.create(email="waitlist@example.com")
+        self.age(PreRegister, pre_register.pk, 365)
+
+        results = purge_control_tables()
+
+        # On PostgreSQL the aged rows predate the monthly partitions and sit
+        # in the default partition, which is purged row by row as well.
+        self.assertEqual(
+            results["access_resetpasswordcontrol"], {"partitions": 0, "rows": 5}
+        )
+        self.assertEqual(
+            results["access_emailconfirmationcontrol"], {"partitions": 0, "rows": 5}
+        )
+        self.assertEqual(
+            list(ResetPasswordControl.objects.values_list("email", flat=True)),
+            ["recent@example.com"],
+        )
+        # Pre-registrations are kept unless PRE_REGISTER_RETENTION_DAYS is set.
+        self.assertNotIn("access_preregister", results)
+        self.assertTrue(PreRegister.objects.exists())
+
+    @skipUnless(connection.vendor == "postgresql", "Partitioning is PostgreSQL-only")
+    def test_new_partition_takes_its_rows_from_the_default_partition(self):
+        """Test that creating a month moves its rows out of the default partition"""
+        table = ResetPasswordControl._meta.db_table
+        month = partitioning.add_months(partitioning.month_start(timezone.now()), 12)
+        row = ResetPasswordControl.objects.create(email="future@example.com")
+        ResetPasswordControl.objects.filter(pk=row.pk).update(
+            date=month + timedelta(days=1)
+        )
+
+        created = partitioning.create_partitions(connection, table, month, month)
+
+        self.assertEqual(created, [partitioning.partition_name(table, month)])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT tableoid::regclass::text FROM {table} WHERE id = %s",
+                [row.pk],
+            )
+            self.assertEqual(cursor.fetchone()[0], created[0])
+
+
+class ProfileETagTests(APITestCase):
+    """Test conditional GET on the current-user profile"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUserModel.objects.create_user(
+            username="etag", email="etag@example.com", password="etagpass123"
+        )
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.url = reverse("customusermodel-current-user")
+
+    def test_unchanged_profile_is_not_modified(self):
+        """Test that a matching If-None-Match gets 304 without queries or serializing"""
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertIn("ETag", first)
+
+        with patch.object(CustomUserSerializer, "to_representation") as render:
+            with self.assertNumQueries(0):
+                response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], first["ETag"])
+        render.assert_not_called()
+
+    def test_saving_the_user_changes_the_etag(self):
+        """Test that a profile update invalidates the cached profile"""
+        first = self.client.get(self.url)
+        self.client.patch(
+            reverse("customusermodel-update-current-user"),
+            {"username": "renamed"},
+            format="json",
+        )
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], first["ETag"])
+        self.assertEqual(response.data["username"], "renamed")
+
+    def test_stale_request_user_is_not_cached_under_the_new_version(self):
+        """Test that a miss renders the database row, not the cached request.user"""
+        self.client.get(self.url)
+        # Another process renamed the user; this process still has the old copy.
+        CustomUserModel.objects.filter(pk=self.user.pk).update(username="renamed")
+        profile_cache.bump_version(self.user.pk)
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.data["username"], "renamed")
+        self.assertEqual(self.user.whoami["username"], "renamed")
+
+    def test_whoami_follows_saves(self):
+        """Test that the cached whoami is replaced when the user is saved"""
+        self.assertEqual(self.user.whoami["credits"], 0)
+
+        self.user.dalle_credits = 7
+        self.user.save()
+
+        self.assertEqual(
+            CustomUserModel.objects.get(pk=self.user.pk).whoami["credits"], 7
+        )
+
+
+class NotificationSubscriptionTests(TestCase):
+    """Test the denormalized notification subscription mask"""
+
+    def create_user(self, name, notification_settings):
+        user = CustomUserModel(
+            username=name,
+            email=f"{name}@example.com",
+            notification_settings=notification_settings,
+        )
+        user.save()
+        return user
+
+    def test_subscribed_streams_matching_ids(self):
+        """Test that only users with the channel/topic enabled are returned"""
+        subscribed = default_notification_settings()
+        subscribed["email"]["updates"] = True
+        push_only = default_notification_settings()
+        push_only["push"]["updates"] = True
+        expected = self.create_user("subscribed", subscribed)
+        self.create_user("push-only", push_only)
+        self.create_user("no-settings", None)
+
+        self.assertEqual(
+            list(CustomUserModel.objects.subscribed("email", "updates")),
+            [str(expected.pk)],
+        )
+        with self.assertRaises(ValueError):
+            CustomUserModel.objects.subscribed("sms", "updates")
+
+    def test_mask_follows_update_fields(self):
+        """Test that saving only notification_settings also saves the mask"""
+        user = self.create_user("toggler", None)
+        user.notification_settings = {"push": {"tips": True}}
+        user.save(update_fields=["notification_settings"])
+
+        self.assertEqual(
+            list(CustomUserModel.objects.subscribed("push", "tips")), [str(user.pk)]
+        )
+
+    def test_subscribed_uses_partial_index(self):
+        """Test that the lookup is served by the subscription's partial index"""
+        if connection.vendor == "postgresql":
+            # A tiny, unanalyzed table is cheaper to scan sequentially, so
+            # take that option away from the planner for this transaction.
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+        plan = (
+            CustomUserModel.objects.filter(subscription_condition("email", "payment"))
+            .values_list("userId", flat=True)
+            .explain()
+        )
+
+        self.assertIn("access_user_email_payment_idx", plan)
+
+
+@override_settings(NOTIFICATION_FANOUT_CHUNK_SIZE=2, NOTIFICATION_FANOUT_GROUP_SIZE=2)
+class BroadcastFanOutTests(APITestCase):
+    """Test chunked broadcast delivery"""
+
+    def setUp(self):
+        cache.clear()
+        eager = app.conf.task_always_eager
+        app.conf.task_always_eager = True
+        self.addCleanup(setattr, app.conf, "task_always_eager", eager)
+
+        for number in range(5):
+            self.create_user(f"fan{number}", subscribed=True)
+        self.create_user("muted", subscribed=False)
+        inactive = self.create_user("inactive", subscribed=True)
+        inactive.is_active = False
+        inactive.save()
+
+    def create_user(self, name, subscribed):
+        return CustomUserModel.objects.create(
+            username=name,
+            email=f"{name}@example.com",
+            notification_settings={"email": {"updates": subscribed}},
+        )
+
+    def create_broadcast(self):
+        return Broadcast.objects.create(
+            channel="email", topic="updates", subject="News", body="Hello"
+        )
+
+    def test_broadcast_is_delivered_in_chunks(self):
+        """Test that every active subscriber gets one message"""
+        broadcast = self.create_broadcast()
+
+        self.assertEqual(fan_out_broadcast(broadcast.pk), 3)
+
+        broadcast.refresh_from_db()
+        self.assertEqual(broadcast.status, "completed")
+        self.assertEqual(broadcast.chunks_done, 3)
+        self.assertEqual(broadcast.recipients_total, 5)
+        self.assertEqual(broadcast.recipients_delivered, 5)
+        self.assertEqual(broadcast.progress, 1.0)
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            [f"fan{number}@example.com" for number in range(5)],
+        )
+
+    def test_redelivered_chunk_is_skipped(self):
+        """Test that a chunk dispatched twice after a resume is only sent once"""
+        broadcast = self.create_broadcast()
+        upto = max(CustomUserModel.objects.values_list("userId", flat=True))
+
+        self.assertEqual(deliver_chunk(broadcast.pk, 0, "", upto), 5)
+        self.assertEqual(deliver_chunk(broadcast.pk, 0, "", upto), 0)
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_chunk_is_claimed_before_sending(self):
+        """Test that a chunk running concurrently with itself is only sent once"""
+        broadcast = self.create_broadcast()
+        upto = max(CustomUserModel.objects.values_list("userId", flat=True))
+        concurrent = []
+
+        def send(broadcast, users):
+            # The other copy of the chunk starts while this one is sending.
+            concurrent.append(deliver_chunk(broadcast.pk, 0, "", upto))
+            return deliver_email(broadcast, users)
+
+        with patch.dict(CHANNEL_BACKENDS, {"email": send}):
+            self.assertEqual(deliver_chunk(broadcast.pk, 0, "", upto), 5)
+
+        self.assertEqual(concurrent, [0])
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_failed_send_can_be_retried(self):
+        """Test that a chunk whose send raised is delivered by its retry"""
+        broadcast = self.create_broadcast()
+        upto = max(CustomUserModel.objects.values_list("userId", flat=True))
+
+        with patch.dict(CHANNEL_BACKENDS, {"email": Mock(side_effect=OSError)}):
+            with self.assertRaises(OSError):
+                deliver_chunk(broadcast.pk, 0, "", upto)
+
+        self.assertEqual(deliver_chunk(broadcast.pk, 0, "", upto), 5)
+
+    def test_failed_chunk_completes_broadcast(self):
+        """Test that a chunk out of retries still lets the broadcast finish"""
+        broadcast = self.create_broadcast()
+        Broadcast.objects.filter(pk=broadcast.pk).update(
+            dispatched=True, chunks_total=1
+        )
+
+        record_failed_chunk(broadcast.pk, 0)
+        record_failed_chunk(broadcast.pk, 0)
+
+        broadcast.refresh_from_db()
+        self.assertEqual(broadcast.chunks_failed, 1)
+        self.assertEqual(broadcast.status, "completed")
+
+    def test_only_staff_can_broadcast(self):
+        """Test that creating a broadcast requires staff and starts the fan-out"""
+        staff = CustomUserModel.objects.create_superuser(
+            "staff", "staff@example.com", "staffpass123"
+        )
+        url = reverse("broadcast-list")
+        data = {"channel": "email", "topic": "updates", "subject": "Hi", "body": "!"}
+
+        self.client.force_authenticate(CustomUserModel.objects.get(username="fan0"))
+        self.assertEqual(
+            self.client.post(url, data, format="json").status_code,
+            status.HTTP_403_FORBIDDEN,
+        )
+
+        self.client.force_authenticate(staff)
+        with patch("access.serializers.fan_out_broadcast.delay") as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(url, data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        delay.assert_called_once_with(response.data["id"])
+
+    def test_push_broadcasts_are_refused(self):
+        """Test that the push channel is rejected until a provider exists"""
+        staff = CustomUserModel.objects.create_superuser(
+            "staff", "staff@example.com", "staffpass123"
+        )
+        self.client.force_authenticate(staff)
+        data = {"channel": "push", "topic": "updates", "subject": "Hi", "body": "!"}
+
+        response = self.client.post(reverse("broadcast-list"), data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("channel", response.data)
+        self.assertFalse(Broadcast.objects.exists())
+
+
+class AvatarVariantTests(APITestCase):
+    """Test the asynchronous avatar variant pipeline"""
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.storage = CustomUserModel._meta.get_field("avatar").storage
+        location = patch.object(self.storage, "location", directory)
+        location.start()
+        self.addCleanup(location.stop)
+
+        self.user = CustomUserModel.objects.create_user(
+            username="avatar", email="avatar@example.com", password="avatarpass123"
+        )
+        self.client.force_authenticate(self.user)
+
+    def upload(self):
+        buffer = BytesIO()
+        Image.new("RGB", (1600, 1200), "teal").save(buffer, "JPEG")
+        upload = SimpleUploadedFile(
+            "face.jpg", buffer.getvalue(), content_type="image/jpeg"
+        )
+        with patch("access.serializers.process_avatar.delay") as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.patch(
+                    reverse("customusermodel-update-current-user"),
+                    {"avatar": upload},
+                    format="multipart",
+                )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return delay
+
+    def test_upload_schedules_processing(self):
+        """Test that the upload is stored as-is and processed off the request"""
+        delay = self.upload()
+
+        self.user.refresh_from_db()
+        delay.assert_called_once_with(str(self.user.pk), self.user.avatar.name, [])
+        self.assertEqual(self.user.avatar_variants, {})
+
+    def test_variants_are_rendered_and_served(self):
+        """Test that variants are written and the fitting one is returned"""
+        self.upload()
+        self.user.refresh_from_db()
+        variants = process_avatar(self.user.pk, self.user.avatar.name)
+        self.user.refresh_from_db()
+
+        self.assertEqual(sorted(variants, key=int), ["64", "128", "256", "512"])
+        with self.storage.open(variants["128"]) as handle:
+            image = Image.open(handle)
+            self.assertEqual(image.format, "WEBP")
+            self.assertEqual(image.size, (128, 96))
+
+        response = self.client.get(
+            reverse("customusermodel-current-user"), {"avatar_size": 100}
+        )
+        self.assertIn(variants["128"], response.data["avatar"])
+        self.assertIn(variants["256"], self.user.whoami["avatar"])
+
+    def test_replaced_avatar_variants_are_discarded(self):
+        """Test that variants of an avatar replaced meanwhile are not attached"""
+        self.upload()
+        self.user.refresh_from_db()
+        original = self.user.avatar.name
+        self.upload()
+
+        variants = process_avatar(self.user.pk, original)
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.avatar_variants, {})
+        self.assertFalse(any(self.storage.exists(name) for name in variants.values()))
+
+
+class CreditLedgerTests(APITestCase):
+    """Test the credit ledger and its conditional balance updates"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUserModel.objects.create_user(
+            username="spender", email="spender@example.com", password="spendpass123"
+        )
+        credit(self.user.pk, 10, reason="purchase")
+
+    def balance(self):
+        return CustomUserModel.objects.get(pk=self.user.pk).dalle_credits
+
+    def test_debit_updates_balance_and_ledger(self):
+        """Test that a debit lowers the balance and is recorded"""
+        entry = debit(self.user.pk, 3, reason="generation")
+
+        self.assertEqual(entry.amount, -3)
+        self.assertEqual(self.balance(), 7)
+        self.assertEqual(
+            sorted(self.user.credit_transactions.values_list("amount", flat=True)),
+            [-3, 10],
+        )
+
+    def test_overdraft_is_refused(self):
+        """Test that a debit larger than the balance changes nothing"""
+        with self.assertRaises(InsufficientCredits):
+            debit(self.user.pk, 11)
+
+        self.assertEqual(self.balance(), 10)
+        self.assertEqual(self.user.credit_transactions.count(), 1)
+
+    def test_idempotency_key_prevents_double_charge(self):
+        """Test that retrying with the same key replays the first debit"""
+        first = debit(self.user.pk, 4, idempotency_key="order-1")
+        second = debit(self.user.pk, 4, idempotency_key="order-1")
+
+        self.assertEqual(str(first.pk), str(second.pk))
+        self.assertEqual(self.balance(), 6)
+
+    def test_reused_idempotency_key_must_match(self):
+        """Test that a key replayed for another amount or operation is refused"""
+        debit(self.user.pk, 4, idempotency_key="order-2")
+
+        with self.assertRaises(IdempotencyKeyReused):
+            debit(self.user.pk, 5, idempotency_key="order-2")
+        with self.assertRaises(IdempotencyKeyReused):
+            credit(self.user.pk, 4, idempotency_key="order-2")
+        with self.assertRaises(IdempotencyKeyReused):
+            debit(self.user.pk, 4, account="subscription", idempotency_key="order-2")
+        self.assertEqual(self.balance(), 6)
+
+    def test_debit_is_one_conditional_update(self):
+        """Test that a debit neither reads nor locks the user row"""
+        with CaptureQueriesContext(connection) as queries:
+            debit(self.user.pk, 1)
+
+        statements = [query["sql"] for query in queries.captured_queries]
+        self.assertFalse(any("FOR UPDATE" in sql for sql in statements))
+        self.assertFalse(any(sql.startswith("SELECT") for sql in statements))
+
+    def test_profile_update_keeps_concurrent_debits(self):
+        """Test that a stale profile save does not restore spent credits"""
+        stale = CustomUserModel.objects.get(pk=self.user.pk)
+        debit(self.user.pk, 5)
+        self.client.force_authenticate(stale)
+
+        response = self.client.patch(
+            reverse("customusermodel-update-current-user"),
+            {"username": "renamed"},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.balance(), 5)
+
+    def test_reconcile_corrects_drift(self):
+        """Test that balance columns are brought back to the ledger sum"""
+        user = CustomUserModel.objects.get(pk=self.user.pk)
+        user.dalle_credits = 99
+        user.subscription_credits = 3
+        user.save()
+
+        self.assertEqual(reconcile(), 1)
+        user.refresh_from_db()
+        self.assertEqual((user.dalle_credits, user.subscription_credits), (10, 0))
+        self.assertEqual(reconcile(), 0)
+
+    def test_whoami_reflects_debits(self):
+        """Test that the cached profile is invalidated after a debit"""
+        user = CustomUserModel.objects.get(pk=self.user.pk)
+        self.assertEqual(user.whoami["credits"], 10)
+        with self.captureOnCommitCallbacks(execute=True):
+            debit(self.user.pk, 2)
+
+        self.assertEqual(
+            CustomUserModel.objects.get(pk=self.user.pk).whoami["credits"], 8
+        )
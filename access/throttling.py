@@ -0,0 +1,17 @@
+from general.throttling import GCRAThrottle
+
+
+class LoginRateThrottle(GCRAThrottle):
+    scope = "login"
+
+
+class RegistrationRateThrottle(GCRAThrottle):
+    scope = "register"
+
+
+class PreRegisterRateThrottle(GCRAThrottle):
+    scope = "pre_register"
+
+
+class PasswordResetRateThrottle(GCRAThrottle):
+    scope = "password_reset"
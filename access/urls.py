@@ -1,16 +1,18 @@
 from rest_framework.routers import DefaultRouter
-from rest_framework_simplejwt.views import TokenRefreshView
 
 from django.urls import include, path
 
 from .views import (
+    BroadcastViewSet,
     CustomTokenObtainPairView,
+    CustomTokenRefreshView,
     CustomUserViewSet,
     EmailConfirmationControlViewSet,
     LoggedDeviceViewSet,
     PasswordRecoveryEmailViewSet,
     PreRegisterViewSet,
     ResetPasswordControlViewSet,
+    export_table,
 )
 
 router = DefaultRouter()
@@ -20,13 +22,19 @@ router.register(r"password-recovery-email", PasswordRecoveryEmailViewSet)
 router.register(r"email-confirmation-control", EmailConfirmationControlViewSet)
 router.register(r"pre-register", PreRegisterViewSet)
 router.register(r"logged-devices", LoggedDeviceViewSet)
+router.register(r"broadcasts", BroadcastViewSet)
 
 urlpatterns = [
     path("api/access/", include(router.urls)),
+    path("api/access/exports/<str:name>/", export_table, name="export_table"),
     path(
         "api/access/auth/login/",
         CustomTokenObtainPairView.as_view(),
         name="token_obtain_pair",
     ),
-    path("api/access/auth/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
+    path(
+        "api/access/auth/refresh/",
+        CustomTokenRefreshView.as_view(),
+        name="token_refresh",
+    ),
 ]
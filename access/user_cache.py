@@ -0,0 +1,95 @@
+"""
+Two-tier cache used to resolve authenticated users without a database hit.
+
+Users are stored pickled, first in a small per-process LRU and then in the
+shared Django cache (Redis in production). Entries are invalidated by the
+``CustomUserModel`` save/delete signals in ``access.signals``; changes made
+through ``QuerySet.update()`` bypass signals and must call
+``invalidate_user`` explicitly.
+"""
+
+import logging
+import pickle
+
+from prometheus_client import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+from general.cache import LocalLRUCache
+
+logger = logging.getLogger(__name__)
+
+USER_CACHE_HITS = Counter(
+    "access_user_cache_hits_total",
+    "Authenticated user lookups served from cache",
+    ["tier"],
+)
+USER_CACHE_MISSES = Counter(
+    "access_user_cache_misses_total",
+    "Authenticated user lookups that fell through to the database",
+)
+USER_CACHE_EVICTIONS = Counter(
+    "access_user_cache_evictions_total",
+    "Entries evicted from the in-process user cache",
+)
+
+_local = LocalLRUCache(
+    maxsize=settings.USER_CACHE_LOCAL_MAXSIZE,
+    timeout=settings.USER_CACHE_LOCAL_TIMEOUT,
+    on_evict=USER_CACHE_EVICTIONS.inc,
+)
+
+
+def cache_key(user_id):
+    return f"access:user:{user_id}"
+
+
+def get_user(user_id):
+    """Return the cached user for ``user_id`` or ``None`` on a miss."""
+    key = cache_key(user_id)
+
+    payload = _local.get(key)
+    if payload is not None:
+        USER_CACHE_HITS.labels(tier="local").inc()
+        return pickle.loads(payload)
+
+    try:
+        payload = cache.get(key)
+    except Exception:
+        logger.warning("Shared user cache unavailable", exc_info=True)
+        payload = None
+
+    if payload is not None:
+        USER_CACHE_HITS.labels(tier="shared").inc()
+        _local.set(key, payload)
+        return pickle.loads(payload)
+
+    USER_CACHE_MISSES.inc()
+    return None
+
+
+def set_user(user):
+    """Store ``user`` in both cache tiers."""
+    key = cache_key(user.pk)
+    payload = pickle.dumps(user)
+    try:
+        cache.set(key, payload, settings.USER_CACHE_TIMEOUT)
+    except Exception:
+        logger.warning("Shared user cache unavailable", exc_info=True)
+    _local.set(key, payload)
+
+
+def invalidate_user(user_id):
+    """Drop ``user_id`` from both cache tiers."""
+    key = cache_key(user_id)
+    _local.delete(key)
+    try:
+        cache.delete(key)
+    except Exception:
+        logger.warning("Shared user cache unavailable", exc_info=True)
+
+
+def clear_local():
+    """Empty the in-process tier (mostly useful in tests)."""
+    _local.clear()
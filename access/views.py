@@ -1,11 +1,24 @@
-from rest_framework import permissions, status, viewsets
-from rest_framework.decorators import action
+from rest_framework import mixins, permissions, status, viewsets
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import (
+    TokenObtainPairSerializer,
+    TokenRefreshSerializer,
+)
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from drf_spectacular.utils import extend_schema, extend_schema_view
+from drf_spectacular.utils import OpenApiParameter, extend_schema, extend_schema_view
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from django.utils.translation import gettext_lazy as _
 
+from . import exports, login_buffer, pre_register_queue, profile_cache, revocation
 from .models import (
+    Broadcast,
     CustomUserModel,
     EmailConfirmationControl,
     LoggedDevice,
@@ -13,15 +26,25 @@ from .models import (
     PreRegister,
     ResetPasswordControl,
 )
+from .pagination import LoggedDeviceCursorPagination, UserCursorPagination
 from .serializers import (
+    BroadcastSerializer,
     CustomUserListSerializer,
     CustomUserSerializer,
     EmailConfirmationControlSerializer,
+    LoggedDeviceRegisterSerializer,
     LoggedDeviceSerializer,
     PasswordRecoveryEmailSerializer,
+    PreRegisterQueueSerializer,
     PreRegisterSerializer,
     ResetPasswordControlSerializer,
 )
+from .throttling import (
+    LoginRateThrottle,
+    PasswordResetRateThrottle,
+    PreRegisterRateThrottle,
+    RegistrationRateThrottle,
+)
 
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
@@ -33,7 +56,7 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     """
     @classmethod
     def get_token(cls, user):
-        token = super().get_token(user)
+        token = revocation.stamp(super().get_token(user))
         # Add custom claims
         token["email"] = user.email
         token["username"] = user.username
@@ -48,12 +71,58 @@ class CustomTokenObtainPairView(TokenObtainPairView):
     in the token payload for improved client-side functionality.
     """
     serializer_class = CustomTokenObtainPairSerializer
+    throttle_classes = [LoginRateThrottle]
+
+
+class CustomTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refresh serializer that enforces revocation through ``access.revocation``.
+
+    With ``BLACKLIST_AFTER_ROTATION`` enabled the presented refresh token is
+    claimed atomically before a new pair is issued, so replaying a rotated-out
+    token fails even when two refreshes race each other.
+    """
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+
+        if revocation.store.is_revoked(refresh):
+            raise TokenError(_("Token is blacklisted"))
+
+        data = {"access": str(revocation.stamp(refresh.access_token))}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                if not revocation.store.claim_for_rotation(refresh):
+                    raise TokenError(_("Token is blacklisted"))
+
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            revocation.stamp(refresh)
+
+            data["refresh"] = str(refresh)
+
+        return data
+
+
+class CustomTokenRefreshView(TokenRefreshView):
+    """
+    JWT refresh view with rotation-aware revocation.
+
+    Rotated refresh tokens are revoked in the cache-backed revocation store
+    instead of the SQL token blacklist.
+    """
+    serializer_class = CustomTokenRefreshSerializer
 
 
 @extend_schema_view(
     list=extend_schema(
         summary="List all users",
-        description="Retrieve a paginated list of all users in the system. Requires authentication.",
+        description=(
+            "Retrieve a cursor-paginated list of all users in the system, newest "
+            "first. Requires authentication."
+        ),
         tags=["Users"]
     ),
     create=extend_schema(
@@ -102,6 +171,7 @@ class CustomUserViewSet(viewsets.ModelViewSet):
     """
     queryset = CustomUserModel.objects.all()
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = UserCursorPagination
 
     def get_serializer_class(self):
         if self.action == "list":
@@ -115,16 +185,46 @@ class CustomUserViewSet(viewsets.ModelViewSet):
             permission_classes = [permissions.IsAuthenticated]
         return [permission() for permission in permission_classes]
 
+    def get_throttles(self):
+        if self.action == "create":
+            return [RegistrationRateThrottle()]
+        return super().get_throttles()
+
     @extend_schema(
         summary="Get current user profile",
-        description="Retrieve the profile information of the currently authenticated user.",
+        description=(
+            "Retrieve the profile information of the currently authenticated user. "
+            "Pass avatar_size to get the avatar variant that fits that many pixels. "
+            "Responses carry an ETag; send it back in If-None-Match to get 304 Not "
+            "Modified while the profile is unchanged."
+        ),
         tags=["Users"]
     )
     @action(detail=False, methods=["get"], url_path="me")
     def current_user(self, request):
-        """Get current user details"""
-        serializer = self.get_serializer(request.user)
-        return Response(serializer.data)
+        """Get current user details, answering 304 while the profile is unchanged"""
+        user = request.user
+        variant = f"{request.get_host()}:{request.query_params.get('avatar_size', '')}"
+        version = profile_cache.get_version(user.pk)
+        if version is None:
+            return Response(self.get_serializer(user).data)
+
+        etag = profile_cache.etag(version, variant)
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            profile_cache.PROFILE_CACHE_REQUESTS.labels(result="not_modified").inc()
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            data = profile_cache.get_or_render(
+                user.pk,
+                version,
+                variant,
+                lambda: dict(self.get_serializer(profile_cache.fresh(user)).data),
+            )
+            response = Response(data)
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        patch_vary_headers(response, ["Authorization"])
+        return response
 
     @extend_schema(
         summary="Update current user profile",
@@ -140,6 +240,20 @@ class CustomUserViewSet(viewsets.ModelViewSet):
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @extend_schema(
+        summary="Revoke all sessions",
+        description=(
+            "Revoke every access and refresh token issued to the currently "
+            "authenticated user."
+        ),
+        tags=["Users"]
+    )
+    @action(detail=False, methods=["post"], url_path="me/revoke-sessions")
+    def revoke_sessions(self, request):
+        """Revoke all tokens of the current user"""
+        revocation.store.revoke_user(request.user.pk)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 
 @extend_schema_view(
     list=extend_schema(
@@ -169,6 +283,11 @@ class ResetPasswordControlViewSet(viewsets.ModelViewSet):
     serializer_class = ResetPasswordControlSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_throttles(self):
+        if self.action == "create":
+            return [PasswordResetRateThrottle()]
+        return super().get_throttles()
+
 
 @extend_schema_view(
     list=extend_schema(
@@ -225,7 +344,11 @@ class EmailConfirmationControlViewSet(viewsets.ModelViewSet):
     ),
     create=extend_schema(
         summary="Create pre-registration",
-        description="Create a new pre-registration entry. Allows anonymous access for email collection.",
+        description=(
+            "Create a new pre-registration entry. Allows anonymous access for email "
+            "collection. With PRE_REGISTER_ASYNC enabled the email is only "
+            "format-checked and queued, and the response is 202 Accepted."
+        ),
         tags=["Registration"]
     ),
 )
@@ -246,6 +369,24 @@ class PreRegisterViewSet(viewsets.ModelViewSet):
             permission_classes = [permissions.IsAuthenticated]
         return [permission() for permission in permission_classes]
 
+    def get_throttles(self):
+        if self.action == "create":
+            return [PreRegisterRateThrottle()]
+        return super().get_throttles()
+
+    def create(self, request, *args, **kwargs):
+        """Queue the pre-registration when asynchronous ingestion is enabled"""
+        if not settings.PRE_REGISTER_ASYNC:
+            return super().create(request, *args, **kwargs)
+
+        serializer = PreRegisterQueueSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        pre_register_queue.enqueue(serializer.validated_data["email"])
+        return Response(
+            {"email": serializer.validated_data["email"], "status": "queued"},
+            status=status.HTTP_202_ACCEPTED,
+        )
+
 
 @extend_schema_view(
     list=extend_schema(
@@ -275,15 +416,52 @@ class LoggedDeviceViewSet(viewsets.ModelViewSet):
     queryset = LoggedDevice.objects.all()
     serializer_class = LoggedDeviceSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = LoggedDeviceCursorPagination
 
     def get_queryset(self):
         """Filter devices by current user"""
-        return LoggedDevice.objects.filter(user=self.request.user)
+        return LoggedDevice.objects.filter(user=self.request.user).select_related(
+            "user"
+        )
+
+    def get_object(self):
+        """Merge a buffered login time into the device"""
+        return login_buffer.merge_pending([super().get_object()])[0]
+
+    def paginate_queryset(self, queryset):
+        """Merge buffered login times into the page"""
+        page = super().paginate_queryset(queryset)
+        return page if page is None else login_buffer.merge_pending(page)
 
     def perform_create(self, serializer):
         """Auto-assign current user when creating device"""
         serializer.save(user=self.request.user)
 
+    @extend_schema(
+        summary="Register or touch device",
+        description=(
+            "Register the device for the current user, or refresh its last login time "
+            "if it is already registered, in a single statement."
+        ),
+        request=LoggedDeviceRegisterSerializer,
+        responses={200: LoggedDeviceSerializer, 201: LoggedDeviceSerializer},
+        tags=["Device Management"]
+    )
+    @action(detail=False, methods=["post"], url_path="register")
+    def register_or_touch(self, request):
+        """Register a device or update its last login time"""
+        serializer = LoggedDeviceRegisterSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        device = LoggedDevice.objects.register_or_touch(
+            request.user, **serializer.validated_data
+        )
+        device.user = request.user
+        created = device.created == device.updated
+        return Response(
+            LoggedDeviceSerializer(device).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
     @extend_schema(
         summary="Update device login time",
         description="Update the last login timestamp for a specific device.",
@@ -295,3 +473,99 @@ class LoggedDeviceViewSet(viewsets.ModelViewSet):
         device = self.get_object()
         device.update_last_login()
         return Response({"message": "Login time updated"}, status=status.HTTP_200_OK)
+
+
+@extend_schema_view(
+    list=extend_schema(
+        summary="List broadcasts",
+        description=(
+            "Retrieve notification broadcasts with their delivery progress, newest "
+            "first. Requires staff access."
+        ),
+        tags=["Notifications"]
+    ),
+    create=extend_schema(
+        summary="Create broadcast",
+        description=(
+            "Send a notification to every active user subscribed to the topic on the "
+            "channel. Delivery is fanned out to Celery workers in chunks; poll the "
+            "broadcast for progress. Requires staff access."
+        ),
+        tags=["Notifications"]
+    ),
+    retrieve=extend_schema(
+        summary="Get broadcast",
+        description=(
+            "Retrieve a broadcast and its delivery progress. Requires staff access."
+        ),
+        tags=["Notifications"]
+    ),
+)
+class BroadcastViewSet(
+    mixins.CreateModelMixin,
+    mixins.ListModelMixin,
+    mixins.RetrieveModelMixin,
+    viewsets.GenericViewSet,
+):
+    """
+    Notification broadcasts to subscribed users.
+
+    Broadcasts are delivered asynchronously in chunks and cannot be edited
+    once created.
+    """
+    queryset = Broadcast.objects.all()
+    serializer_class = BroadcastSerializer
+    permission_classes = [permissions.IsAdminUser]
+
+
+@extend_schema(
+    summary="Export table",
+    description=(
+        "Stream every row of the users, pre-register or logged-devices table as NDJSON "
+        "or CSV, optionally gzip-compressed. Requires staff access."
+    ),
+    parameters=[
+        OpenApiParameter(
+            name="output",
+            description="Row format",
+            required=False,
+            type=str,
+            enum=list(exports.FORMATS),
+        ),
+        OpenApiParameter(
+            name="gzip",
+            description="Compress the response body with gzip",
+            required=False,
+            type=bool,
+        ),
+    ],
+    tags=["Exports"]
+)
+@api_view(["GET"])
+@permission_classes([permissions.IsAdminUser])
+def export_table(request, name):
+    """
+    Stream a full table export.
+
+    Rows are written incrementally from a database cursor, so exports of any
+    size use constant memory in the web worker.
+    """
+    if name not in exports.EXPORTS:
+        return Response({"error": "Unknown export"}, status=status.HTTP_404_NOT_FOUND)
+
+    output = request.query_params.get("output", "ndjson")
+    if output not in exports.FORMATS:
+        return Response(
+            {"error": "Invalid output format"}, status=status.HTTP_400_BAD_REQUEST
+        )
+    compress = request.query_params.get("gzip", "").lower() in ("1", "true")
+
+    # A compressed export is a .gz file rather than a gzip-encoded CSV, so
+    # clients and proxies do not transparently decompress it.
+    response = StreamingHttpResponse(
+        exports.stream_export(name, output, compress),
+        content_type="application/gzip" if compress else exports.FORMATS[output],
+    )
+    filename = f"{name}.{output}" + (".gz" if compress else "")
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
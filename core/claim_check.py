@@ -0,0 +1,142 @@
+"""
+Claim-check offloading of large task payloads.
+
+Arguments of ``ClaimCheckTask`` tasks, and their return values, whose JSON
+encoding reaches ``CLAIM_CHECK_THRESHOLD`` bytes are written once to a
+``PrivateMediaStorage`` under ``CLAIM_CHECK_LOCATION`` and replaced by a
+small reference (``{"__claim_check__": name, "size": bytes, "signature":
+hmac}``), so neither RabbitMQ nor the result backend carries them.
+Arguments are resolved when the task runs; result references are left in
+the result backend and ``task_status`` streams the stored JSON into its
+response without decoding it. References are signed with ``SECRET_KEY``, so
+user data shaped like one is passed through as data and cannot make a
+worker read an arbitrary stored file. The location must be shared by the
+web and worker containers (a volume in docker-compose.yml and k8s/).
+
+Blobs are not tracked individually: ``collect_garbage`` (run by the
+``collect_claim_checks`` task) deletes those older than ``CLAIM_CHECK_TTL``,
+which should outlive both task retries and ``CELERY_RESULT_EXPIRES``.
+"""
+
+import json
+import logging
+import os
+import time
+from uuid import uuid4
+
+from celery import Task
+from prometheus_client import Counter
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from general.storage_backends import PrivateMediaStorage
+
+logger = logging.getLogger(__name__)
+
+CLAIM_CHECKS = Counter(
+    "core_claim_checks_total",
+    "Task payloads offloaded to the claim-check store",
+    ["kind"],
+)
+CLAIM_CHECK_BYTES = Counter(
+    "core_claim_check_bytes_total",
+    "Bytes offloaded to the claim-check store",
+    ["kind"],
+)
+
+REFERENCE_KEY = "__claim_check__"
+REFERENCE_FIELDS = {REFERENCE_KEY, "size", "signature"}
+CHUNK_SIZE = 64 * 1024
+
+storage = PrivateMediaStorage(
+    location=settings.CLAIM_CHECK_LOCATION, content_addressed=False
+)
+
+
+def _signature(name):
+    return salted_hmac("core.claim_check", name, algorithm="sha256").hexdigest()
+
+
+def is_reference(value):
+    """Whether ``value`` is a reference made by ``offload``."""
+    return (
+        isinstance(value, dict)
+        and value.keys() == REFERENCE_FIELDS
+        and isinstance(value[REFERENCE_KEY], str)
+        and isinstance(value["signature"], str)
+        and constant_time_compare(value["signature"], _signature(value[REFERENCE_KEY]))
+    )
+
+
+def _encode_if_large(value):
+    threshold = settings.CLAIM_CHECK_THRESHOLD
+    if value is None or isinstance(value, (bool, int, float)):
+        return None
+    # A string encodes to at least as many bytes as it has characters, so
+    # short ones are let through without encoding them an extra time.
+    if isinstance(value, str) and len(value) < threshold // 6:
+        return None
+    data = json.dumps(value).encode()
+    return data if len(data) >= threshold else None
+
+
+def offload(value, kind="argument"):
+    """Return ``value``, or a reference to it if it is large."""
+    data = _encode_if_large(value)
+    if data is None:
+        return value
+    key = uuid4().hex
+    name = storage.save(f"{key[:2]}/{key}.json", ContentFile(data))
+    CLAIM_CHECKS.labels(kind=kind).inc()
+    CLAIM_CHECK_BYTES.labels(kind=kind).inc(len(data))
+    return {REFERENCE_KEY: name, "size": len(data), "signature": _signature(name)}
+
+
+def resolve(value):
+    """Return the payload ``value`` refers to, or ``value`` itself."""
+    if not is_reference(value):
+        return value
+    with storage.open(value[REFERENCE_KEY], "rb") as handle:
+        return json.load(handle)
+
+
+def exists(reference):
+    return storage.exists(reference[REFERENCE_KEY])
+
+
+def stream(reference):
+    """Yield the stored JSON of ``reference`` in chunks, without decoding it."""
+    with storage.open(reference[REFERENCE_KEY], "rb") as handle:
+        yield from iter(lambda: handle.read(CHUNK_SIZE), b"")
+
+
+def collect_garbage(ttl=None):
+    """Delete blobs older than ``ttl`` seconds; returns how many were deleted."""
+    cutoff = time.time() - (settings.CLAIM_CHECK_TTL if ttl is None else ttl)
+    deleted = 0
+    for root, _, files in os.walk(storage.location):
+        for filename in files:
+            path = os.path.join(root, filename)
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    os.remove(path)
+                    deleted += 1
+            except FileNotFoundError:
+                continue
+    return deleted
+
+
+class ClaimCheckTask(Task):
+    """Task base that offloads large arguments and results."""
+
+    def apply_async(self, args=None, kwargs=None, **options):
+        args = [offload(arg) for arg in args or ()]
+        kwargs = {key: offload(value) for key, value in (kwargs or {}).items()}
+        return super().apply_async(args, kwargs, **options)
+
+    def __call__(self, *args, **kwargs):
+        args = [resolve(arg) for arg in args]
+        kwargs = {key: resolve(value) for key, value in kwargs.items()}
+        return offload(super().__call__(*args, **kwargs), kind="result")
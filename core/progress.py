@@ -0,0 +1,151 @@
+"""
+Progress reporting, checkpoints and cancellation for long-running tasks.
+
+A task drives a ``ProgressReporter`` with ``step(current, checkpoint)``
+between units of work. Progress is written to the result backend (and
+published through ``core.task_events``) at most ``TASK_PROGRESS_MAX_RATE``
+times per second, however fine the steps are; the writes in between are
+coalesced into the next one. Each write carries ``percent`` and an ``eta``
+extrapolated from the rate since the task (re)started.
+
+On the same cadence the reporter stores ``checkpoint`` and checks the
+cancellation flag set by ``cancel``. Both live in the result backend next to
+the task's metadata (and expire with it), so they are shared by the web and
+worker containers whatever the Django cache is. Tasks declared with
+``acks_late`` and ``reject_on_worker_lost`` are re-delivered with the same ID
+after a worker dies, and read ``reporter.checkpoint`` to resume where they
+stopped instead of starting over. A cancelled task is marked ``REVOKED`` and
+stops at its next step.
+"""
+
+import logging
+import time
+from datetime import datetime
+from datetime import timezone as dt_timezone
+
+from celery import states
+from celery.exceptions import Ignore
+from prometheus_client import Counter
+
+from django.conf import settings
+
+from django_app.celery import app
+
+from . import task_events
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_WRITES = Counter(
+    "core_task_progress_writes_total",
+    "Progress updates by whether they were written or coalesced",
+    ["outcome"],
+)
+TASKS_CANCELLED = Counter(
+    "core_tasks_cancelled_total",
+    "Long-running tasks stopped through their cancellation flag",
+)
+
+
+class TaskCancelled(Ignore):
+    """Raised from ``step`` once the task has been cancelled."""
+
+
+def checkpoint_key(task_id):
+    return f"tasks:checkpoint:{task_id}"
+
+
+def cancel_key(task_id):
+    return f"tasks:cancel:{task_id}"
+
+
+def cancel(task_id):
+    """Ask a running task to stop at its next step."""
+    app.backend.set(cancel_key(task_id), b"1")
+
+
+def load_checkpoint(task_id):
+    value = app.backend.get(checkpoint_key(task_id))
+    return None if value is None else app.backend.decode(value)
+
+
+def _clear(task_id):
+    for key in (checkpoint_key(task_id), cancel_key(task_id)):
+        app.backend.delete(key)
+
+
+class ProgressReporter:
+    def __init__(self, task, total):
+        self.task = task
+        self.task_id = task.request.id
+        self.total = total
+        self.min_interval = 1 / settings.TASK_PROGRESS_MAX_RATE
+        self.checkpoint = load_checkpoint(self.task_id)
+        self._last_write = None
+        self._started = None
+        self._start_step = None
+        self._pending = None
+
+    def step(self, current, checkpoint=None):
+        """
+        Record that ``current`` of ``total`` units are done.
+
+        ``checkpoint`` is what the task needs to resume after this step.
+        Raises ``TaskCancelled`` when the task has been cancelled.
+        """
+        now = time.monotonic()
+        if self._started is None:
+            # Rates are measured from the first step, so a resumed task does
+            # not count the work done before the restart.
+            self._started, self._start_step = now, current
+        self._pending = (current, checkpoint)
+        if self._last_write is not None and now - self._last_write < self.min_interval:
+            PROGRESS_WRITES.labels(outcome="coalesced").inc()
+            return
+        self._write(now)
+
+    def finish(self):
+        """Flush the last coalesced step and drop the checkpoint."""
+        if self._pending is not None:
+            self._write(time.monotonic(), check_cancelled=False)
+        _clear(self.task_id)
+
+    def _write(self, now, check_cancelled=True):
+        current, checkpoint = self._pending
+        self._pending = None
+        self._last_write = now
+
+        if check_cancelled and app.backend.get(cancel_key(self.task_id)):
+            self._stop()
+        if checkpoint is not None:
+            app.backend.set(
+                checkpoint_key(self.task_id), app.backend.encode(checkpoint)
+            )
+            self.checkpoint = checkpoint
+
+        task_events.report_progress(self.task, **self.snapshot(current, now))
+        PROGRESS_WRITES.labels(outcome="written").inc()
+
+    def snapshot(self, current, now):
+        percent = round(100 * current / self.total, 1) if self.total else 100.0
+        eta = None
+        done = current - self._start_step
+        if 0 < done and current < self.total:
+            remaining = (now - self._started) / done * (self.total - current)
+            eta = datetime.fromtimestamp(time.time() + remaining, dt_timezone.utc)
+            eta = eta.isoformat()
+        return {
+            "current": current,
+            "total": self.total,
+            "percent": percent,
+            "eta": eta,
+        }
+
+    def _stop(self):
+        TASKS_CANCELLED.inc()
+        logger.info(f"Task {self.task_id} cancelled")
+        _clear(self.task_id)
+        app.backend.mark_as_revoked(
+            self.task_id, "cancelled", request=self.task.request
+        )
+        task_events.publish(self.task_id, states.REVOKED, "cancelled")
+        raise TaskCancelled()
@@ -0,0 +1,120 @@
+"""
+Validation and batched publishing of task specs.
+
+A spec is the JSON object ``create_task`` accepts (``{"type": "add", "x": 1,
+"y": 2}``). ``submit_batch`` validates a whole list before anything is sent,
+then publishes it as one Celery ``group`` over a single producer taken from
+the app's connection pool, so a batch costs one broker connection checkout
+instead of one per task. The ``GroupResult`` is saved to the result backend
+so the batch can later be looked up by its ID.
+"""
+
+import collections
+
+from celery import group
+from prometheus_client import Counter, Histogram
+
+from django.conf import settings
+
+from django_app.celery import app
+
+from .tasks import add_numbers, long_running_task, process_data
+
+TASKS_SUBMITTED = Counter(
+    "core_tasks_submitted_total",
+    "Tasks published through the batch submission endpoint",
+    ["task_type"],
+)
+TASK_BATCH_SIZE = Histogram(
+    "core_task_batch_size",
+    "Number of tasks per batch submission",
+    buckets=(1, 10, 50, 100, 500, 1000, 5000),
+)
+
+
+class InvalidTaskSpec(ValueError):
+    pass
+
+
+def _integer(spec, key, default, minimum=None):
+    value = spec.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise InvalidTaskSpec(f"'{key}' must be an integer")
+    if minimum is not None and value < minimum:
+        raise InvalidTaskSpec(f"'{key}' must be at least {minimum}")
+    return value
+
+
+def _add(spec):
+    x, y = _integer(spec, "x", 1), _integer(spec, "y", 2)
+    return add_numbers.si(x, y), "add_numbers"
+
+
+def _long_running(spec):
+    duration = _integer(spec, "duration", 5, minimum=0)
+    if duration > settings.TASK_MAX_DURATION:
+        raise InvalidTaskSpec(
+            f"'duration' must be at most {settings.TASK_MAX_DURATION}"
+        )
+    return long_running_task.si(duration), "long_running_task"
+
+
+def _process_data(spec):
+    data = spec.get("data", "sample data")
+    if not isinstance(data, (str, list)):
+        raise InvalidTaskSpec("'data' must be a string or a list")
+    return process_data.si(data), "process_data"
+
+
+SPEC_BUILDERS = {
+    "add": _add,
+    "long_running": _long_running,
+    "process_data": _process_data,
+}
+
+
+def build_signature(spec):
+    """Return ``(signature, task_type)`` for ``spec``, or raise ``InvalidTaskSpec``."""
+    if not isinstance(spec, dict):
+        raise InvalidTaskSpec("Task spec must be an object")
+    task_type = spec.get("type", "add")
+    builder = SPEC_BUILDERS.get(task_type) if isinstance(task_type, str) else None
+    if builder is None:
+        raise InvalidTaskSpec("Invalid task type")
+    return builder(spec)
+
+
+def validate_batch(specs):
+    """
+    Build the signatures of every spec; returns ``(signatures, errors)``.
+
+    ``errors`` maps the index of each invalid spec to its message.
+    """
+    if not isinstance(specs, list) or not specs:
+        raise InvalidTaskSpec("'tasks' must be a non-empty list")
+    if len(specs) > settings.TASK_BATCH_MAX_SIZE:
+        raise InvalidTaskSpec(
+            f"At most {settings.TASK_BATCH_MAX_SIZE} tasks can be submitted at once"
+        )
+    signatures, errors = [], {}
+    for index, spec in enumerate(specs):
+        try:
+            signatures.append(build_signature(spec))
+        except InvalidTaskSpec as exc:
+            errors[index] = str(exc)
+    return signatures, errors
+
+
+def submit_batch(signatures):
+    """Publish ``(signature, task_type)`` pairs as one group; return the GroupResult."""
+    with app.producer_or_acquire() as producer:
+        result = group(signature for signature, _ in signatures).apply_async(
+            producer=producer
+        )
+    result.save()
+
+    TASK_BATCH_SIZE.observe(len(signatures))
+    counts = collections.Counter(task_type for _, task_type in signatures)
+    for task_type, count in counts.items():
+        TASKS_SUBMITTED.labels(task_type=task_type).inc(count)
+    return result
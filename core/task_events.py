@@ -0,0 +1,263 @@
+"""
+Push notifications of task state changes.
+
+Workers publish every state change of a task (``STARTED``, ``PROGRESS``,
+``SUCCESS``, ``FAILURE``, ``RETRY``, ``REVOKED``) to the Redis channel
+``tasks:events:<task_id>`` from Celery's task signals, and
+``report_progress`` does the same for progress updates. ``stream`` turns
+those messages into Server-Sent Events for ``/tasks/<task_id>/events/``.
+
+Streams are meant to be served by the ASGI application: each one is a
+coroutine waiting on an ``asyncio.Queue``, and all streams of an event loop
+share a single Redis pub/sub connection (``TaskEventHub``), subscribed only
+to the channels somebody is listening to. An idle stream therefore costs a
+queue and a keep-alive comment every ``TASK_EVENTS_KEEPALIVE`` seconds, for
+at most ``TASK_EVENTS_MAX_AGE`` seconds. Without ``TASK_EVENTS_REDIS_URL``
+streams fall back to polling the result backend from the server every
+``TASK_EVENTS_POLL_INTERVAL`` seconds. Under WSGI a stream would be buffered
+whole before anything is sent, and hold a worker thread meanwhile.
+"""
+
+import asyncio
+import json
+import logging
+import time
+import weakref
+from collections import defaultdict
+
+import redis
+import redis.asyncio
+from asgiref.sync import sync_to_async
+from celery import states
+from celery.signals import (
+    task_failure,
+    task_prerun,
+    task_retry,
+    task_revoked,
+    task_success,
+)
+from prometheus_client import Counter, Gauge
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .task_results import fetch_meta, summarize
+
+logger = logging.getLogger(__name__)
+
+TASK_EVENTS_PUBLISHED = Counter(
+    "core_task_events_published_total",
+    "Task state changes published to Redis",
+    ["status"],
+)
+TASK_EVENTS_PUBLISH_ERRORS = Counter(
+    "core_task_events_publish_errors_total",
+    "Task state changes that could not be published",
+)
+TASK_EVENT_STREAMS = Gauge(
+    "core_task_event_streams",
+    "Open task event streams",
+)
+
+CHANNEL_PREFIX = "tasks:events:"
+QUEUE_SIZE = 100
+
+_client = None
+
+
+def channel(task_id):
+    return f"{CHANNEL_PREFIX}{task_id}"
+
+
+def get_client():
+    global _client
+    if _client is None and settings.TASK_EVENTS_REDIS_URL:
+        _client = redis.Redis.from_url(
+            settings.TASK_EVENTS_REDIS_URL, socket_timeout=1, socket_connect_timeout=1
+        )
+    return _client
+
+
+def publish(task_id, status, result=None):
+    """Publish a state change; never raises, so tasks are not affected."""
+    client = get_client()
+    if client is None or not task_id:
+        return
+    event = summarize(task_id, {"status": status, "result": result})
+    try:
+        client.publish(channel(task_id), json.dumps(event, cls=DjangoJSONEncoder))
+    except (redis.RedisError, TypeError, ValueError):
+        TASK_EVENTS_PUBLISH_ERRORS.inc()
+        logger.warning(f"Could not publish {status} of task {task_id}", exc_info=True)
+        return
+    TASK_EVENTS_PUBLISHED.labels(status=status).inc()
+
+
+def report_progress(task, **progress):
+    """Store ``progress`` as the task's PROGRESS state and publish it."""
+    task.update_state(state="PROGRESS", meta=progress)
+    publish(task.request.id, "PROGRESS", progress)
+
+
+@task_prerun.connect
+def _on_prerun(task_id=None, **kwargs):
+    publish(task_id, states.STARTED)
+
+
+@task_success.connect
+def _on_success(sender=None, result=None, **kwargs):
+    publish(sender.request.id, states.SUCCESS, result)
+
+
+@task_failure.connect
+def _on_failure(task_id=None, exception=None, **kwargs):
+    publish(task_id, states.FAILURE, exception)
+
+
+@task_retry.connect
+def _on_retry(request=None, reason=None, **kwargs):
+    publish(request.id, states.RETRY, reason)
+
+
+@task_revoked.connect
+def _on_revoked(request=None, **kwargs):
+    publish(request.id, states.REVOKED, "revoked")
+
+
+class TaskEventHub:
+    """Fans the messages of one Redis pub/sub connection out to local queues."""
+
+    def __init__(self, url):
+        self.url = url
+        self.pubsub = None
+        self.reader = None
+        self.listeners = defaultdict(set)
+        self.lock = asyncio.Lock()
+
+    def _connect(self):
+        client = redis.asyncio.Redis.from_url(self.url)
+        return client.pubsub(ignore_subscribe_messages=True)
+
+    async def subscribe(self, task_id):
+        name = channel(task_id)
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        async with self.lock:
+            if self.pubsub is None:
+                self.pubsub = self._connect()
+            if not self.listeners[name]:
+                await self.pubsub.subscribe(name)
+            self.listeners[name].add(queue)
+            if self.reader is None or self.reader.done():
+                self.reader = asyncio.create_task(self._read())
+        return queue
+
+    async def unsubscribe(self, task_id, queue):
+        name = channel(task_id)
+        async with self.lock:
+            listeners = self.listeners.get(name, set())
+            listeners.discard(queue)
+            if not listeners and name in self.listeners:
+                del self.listeners[name]
+                if self.pubsub is not None:
+                    await self.pubsub.unsubscribe(name)
+
+    async def _read(self):
+        try:
+            while self.listeners:
+                message = await self.pubsub.get_message(timeout=1.0)
+                if message is None:
+                    continue
+                name = message["channel"]
+                if isinstance(name, bytes):
+                    name = name.decode()
+                for queue in list(self.listeners.get(name, ())):
+                    if not queue.full():
+                        queue.put_nowait(message["data"])
+        except (redis.RedisError, OSError):
+            logger.warning("Task event subscription lost", exc_info=True)
+            # Ends every stream; clients reconnect and resubscribe.
+            for listeners in self.listeners.values():
+                for queue in listeners:
+                    if queue.full():
+                        queue.get_nowait()
+                    queue.put_nowait(None)
+            self.listeners.clear()
+            self.pubsub = None
+
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+def get_hub():
+    """The hub of the running event loop, or ``None`` without Redis."""
+    if not settings.TASK_EVENTS_REDIS_URL:
+        return None
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = _hubs[loop] = TaskEventHub(settings.TASK_EVENTS_REDIS_URL)
+    return hub
+
+
+def sse(event):
+    data = json.dumps(event, cls=DjangoJSONEncoder, separators=(",", ":"))
+    return f"event: status\ndata: {data}\n\n"
+
+
+async def current_state(task_id):
+    [meta] = await sync_to_async(fetch_meta, thread_sensitive=False)([task_id])
+    return summarize(task_id, meta)
+
+
+async def stream(task_id):
+    """
+    Yield the task's state as SSE messages until it is ready.
+
+    A stream ends after ``TASK_EVENTS_MAX_AGE`` seconds, whatever the state
+    of the task (clients reconnect and get the current state first, so
+    nothing is lost). The result backend cannot tell a task still waiting in
+    the queue from an unknown ID, so ``PENDING`` streams are bounded the same
+    way instead of being ended early.
+    """
+    hub = get_hub()
+    # Subscribe before reading the current state so no change is missed.
+    queue = await hub.subscribe(task_id) if hub else None
+    TASK_EVENT_STREAMS.inc()
+    try:
+        yield f"retry: {settings.TASK_EVENTS_RETRY_MS}\n\n"
+        event = await current_state(task_id)
+        yield sse(event)
+
+        keepalive = settings.TASK_EVENTS_KEEPALIVE
+        last_sent = time.monotonic()
+        deadline = last_sent + settings.TASK_EVENTS_MAX_AGE
+        while event["status"] not in states.READY_STATES:
+            now = time.monotonic()
+            if now >= deadline:
+                return
+            if now - last_sent >= keepalive:
+                last_sent = now
+                yield ": keepalive\n\n"
+            wake = min(last_sent + keepalive, deadline)
+            if queue is not None:
+                try:
+                    data = await asyncio.wait_for(queue.get(), wake - now)
+                except asyncio.TimeoutError:
+                    continue
+                if data is None:
+                    return
+                received = json.loads(data)
+            else:
+                await asyncio.sleep(
+                    min(settings.TASK_EVENTS_POLL_INTERVAL, max(wake - now, 0))
+                )
+                received = await current_state(task_id)
+                if received == event:
+                    continue
+            event = received
+            last_sent = time.monotonic()
+            yield sse(event)
+    finally:
+        TASK_EVENT_STREAMS.dec()
+        if queue is not None:
+            await hub.unsubscribe(task_id, queue)
@@ -0,0 +1,89 @@
+"""
+Batched reads of Celery task state.
+
+``AsyncResult`` reads a task's metadata from the result backend on every
+``status``/``result`` access until the task is ready. ``fetch_meta`` reads
+the metadata of many tasks with one ``MGET`` per chunk against key-value
+backends (Redis in production) and decodes each payload once; other
+backends fall back to one read per task. ``summarize`` turns a metadata dict
+into the compact form returned by the task status endpoints; results
+offloaded to the claim-check store are flagged rather than inlined.
+"""
+
+from celery import states
+from celery.backends.base import BaseKeyValueStoreBackend
+from prometheus_client import Histogram
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from django_app.celery import app
+
+from . import claim_check
+
+TASK_STATUS_LOOKUP_SIZE = Histogram(
+    "core_task_status_lookup_size",
+    "Number of task IDs per status lookup",
+    buckets=(1, 10, 50, 100, 500, 1000, 5000),
+)
+
+PENDING_META = {"status": states.PENDING, "result": None}
+
+
+def fetch_meta(task_ids, backend=None):
+    """Return the metadata dicts of ``task_ids``, in order."""
+    backend = backend or app.backend
+    if not task_ids:
+        return []
+    if isinstance(backend, BaseKeyValueStoreBackend):
+        keys = [backend.get_key_for_task(task_id) for task_id in task_ids]
+        try:
+            values = backend.mget(keys)
+        except NotImplementedError:
+            pass
+        else:
+            if hasattr(values, "get"):
+                # Some clients (e.g. memcached) return a mapping.
+                values = [values.get(key) for key in keys]
+            return [
+                backend.decode_result(value) if value else dict(PENDING_META)
+                for value in values
+            ]
+    return [backend.get_task_meta(task_id) for task_id in task_ids]
+
+
+def group_task_ids(group_id):
+    """IDs of the tasks of a saved group, or ``None`` if it is unknown."""
+    result = app.GroupResult.restore(group_id)
+    if result is None:
+        return None
+    return [task.id for task in result.results]
+
+
+def summarize(task_id, meta):
+    """Compact status of one task; ``result``/``progress``/``error`` only when set."""
+    status = meta["status"]
+    summary = {"task_id": task_id, "status": status}
+    if status == states.SUCCESS:
+        if claim_check.is_reference(meta["result"]):
+            # Fetched whole from /tasks/<task_id>/ instead.
+            summary["result_offloaded"] = True
+        else:
+            summary["result"] = meta["result"]
+    elif status == "PROGRESS":
+        summary["progress"] = meta["result"]
+    elif status in states.EXCEPTION_STATES:
+        summary["error"] = str(meta["result"])
+    return summary
+
+
+def stream_statuses(task_ids, chunk_size):
+    """Yield one NDJSON line per task, reading the backend a chunk at a time."""
+    TASK_STATUS_LOOKUP_SIZE.observe(len(task_ids))
+    encoder = DjangoJSONEncoder(separators=(",", ":"))
+    for start in range(0, len(task_ids), chunk_size):
+        chunk = task_ids[start : start + chunk_size]
+        lines = [
+            encoder.encode(summarize(task_id, meta)) + "\n"
+            for task_id, meta in zip(chunk, fetch_meta(chunk))
+        ]
+        yield "".join(lines)
@@ -3,6 +3,10 @@ import time
 
 from celery import shared_task
 
+from . import claim_check
+from .claim_check import ClaimCheckTask
+from .progress import ProgressReporter
+
 logger = logging.getLogger(__name__)
 
 
@@ -13,16 +17,23 @@ def add_numbers(x, y):
     return x + y
 
 
-@shared_task
-def long_running_task(duration=5):
+# Acknowledged once done, so a task lost with its worker is re-delivered and
+# resumes from its last checkpoint.
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def long_running_task(self, duration=5):
     """Task that simulates a long running process"""
-    logger.info(f"Starting long running task for {duration} seconds")
-    time.sleep(duration)
+    progress = ProgressReporter(self, total=duration)
+    start = progress.checkpoint or 0
+    logger.info(f"Starting long running task for {duration} seconds at {start}")
+    for elapsed in range(start + 1, duration + 1):
+        time.sleep(1)
+        progress.step(elapsed, checkpoint=elapsed)
+    progress.finish()
     logger.info("Long running task completed")
     return f"Task completed after {duration} seconds"
 
 
-@shared_task
+@shared_task(base=ClaimCheckTask)
 def process_data(data):
     """Task to process some data"""
     logger.info(f"Processing data: {data}")
@@ -35,3 +46,11 @@ def process_data(data):
     }
     logger.info(f"Data processing completed: {result}")
     return result
+
+
+@shared_task
+def collect_claim_checks():
+    """Delete claim-check blobs older than CLAIM_CHECK_TTL"""
+    deleted = claim_check.collect_garbage()
+    logger.info(f"Deleted {deleted} expired claim-check blobs")
+    return deleted
@@ -1,8 +1,28 @@
+import asyncio
 import json
+import os
+import shutil
+import tempfile
+import time
+from unittest.mock import MagicMock, Mock, PropertyMock, patch
 
-from django.test import Client, TestCase
+from celery import Task
+from celery.backends.cache import CacheBackend
+from celery.result import AsyncResult, GroupResult
+
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 
+from django_app.celery import app
+from general.throttling import limiter
+
+from . import claim_check
+from .claim_check import collect_garbage, is_reference, offload, resolve, storage
+from .progress import ProgressReporter, load_checkpoint
+from .task_events import TaskEventHub, _on_prerun
+from .task_results import summarize
+from .tasks import long_running_task, process_data
+
 
 class CoreViewsTestCase(TestCase):
     def setUp(self):
@@ -43,3 +63,423 @@ class CoreViewsTestCase(TestCase):
         self.assertEqual(response.status_code, 400)
         data = response.json()
         self.assertEqual(data["error"], "Invalid task type")
+
+    def test_create_task_is_throttled(self):
+        """Test that task creation is rate limited per client"""
+        limiter.reset()
+        self.addCleanup(limiter.reset)
+        for _ in range(60):
+            self.client.post(
+                reverse("create_task"),
+                data=json.dumps({"type": "invalid"}),
+                content_type="application/json",
+            )
+        response = self.client.post(
+            reverse("create_task"),
+            data=json.dumps({"type": "invalid"}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+
+
+class TaskBatchTestCase(TestCase):
+    """Test batch task submission"""
+
+    def setUp(self):
+        limiter.reset()
+        self.addCleanup(limiter.reset)
+
+    def post(self, payload):
+        return self.client.post(
+            reverse("create_task_batch"),
+            data=json.dumps(payload),
+            content_type="application/json",
+        )
+
+    def test_batch_is_published_as_one_group(self):
+        """Test that every spec is sent in one group and its IDs are returned"""
+        app.conf.task_always_eager = True
+        self.addCleanup(setattr, app.conf, "task_always_eager", False)
+
+        specs = [{"type": "add", "x": i, "y": i} for i in range(20)]
+        with patch.object(GroupResult, "save") as save:
+            response = self.post({"tasks": specs})
+
+        self.assertEqual(response.status_code, 202)
+        data = response.json()
+        self.assertEqual(data["count"], 20)
+        self.assertEqual(len({task["task_id"] for task in data["tasks"]}), 20)
+        self.assertTrue(data["group_id"])
+        save.assert_called_once_with()
+
+    def test_invalid_specs_publish_nothing(self):
+        """Test that one invalid spec rejects the whole batch"""
+        with patch("core.submission.submit_batch") as submit:
+            response = self.post(
+                {
+                    "tasks": [
+                        {"type": "add", "x": 1, "y": 2},
+                        {"type": "add", "x": "one"},
+                        {"type": "unknown"},
+                        {"type": ["add"]},
+                    ]
+                }
+            )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json()["errors"],
+            {
+                "1": "'x' must be an integer",
+                "2": "Invalid task type",
+                "3": "Invalid task type",
+            },
+        )
+        submit.assert_not_called()
+
+    def test_batch_size_is_limited(self):
+        """Test that empty and oversized batches are rejected"""
+        self.assertEqual(self.post({"tasks": []}).status_code, 400)
+        with override_settings(TASK_BATCH_MAX_SIZE=2):
+            response = self.post({"tasks": [{"type": "add"}] * 3})
+        self.assertEqual(response.status_code, 400)
+
+
+class MemoryResultBackendMixin:
+    """Swap the app's result backend for an in-memory one in ``self.backend``"""
+
+    def setUp(self):
+        super().setUp()
+        self.backend = CacheBackend(app=app, backend="memory")
+        backend = patch.object(
+            type(app), "backend", new_callable=PropertyMock, return_value=self.backend
+        )
+        backend.start()
+        self.addCleanup(backend.stop)
+
+
+class TaskStatusTestCase(MemoryResultBackendMixin, TestCase):
+    """Test single and bulk task status lookups"""
+
+    def setUp(self):
+        super().setUp()
+        self.backend.store_result("done", 8, "SUCCESS")
+        self.backend.mark_as_failure("failed", ValueError("boom"))
+
+    def statuses(self, response):
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        body = b"".join(response.streaming_content).decode()
+        return [json.loads(line) for line in body.splitlines()]
+
+    def test_single_status(self):
+        """Test that the single task endpoint keeps its response format"""
+        response = self.client.get(reverse("task_status", args=["failed"]))
+
+        self.assertEqual(
+            response.json(),
+            {
+                "task_id": "failed",
+                "status": "FAILURE",
+                "result": None,
+                "error": "boom",
+                "progress": None,
+            },
+        )
+
+    def test_bulk_status_is_read_with_one_mget_per_chunk(self):
+        """Test that statuses are batched and returned in request order"""
+        ids = ["done", "waiting", "failed"]
+        with patch.object(self.backend, "mget", wraps=self.backend.mget) as mget:
+            with override_settings(TASK_STATUS_CHUNK_SIZE=2):
+                response = self.client.post(
+                    reverse("task_statuses"),
+                    data=json.dumps({"task_ids": ids}),
+                    content_type="application/json",
+                )
+                statuses = self.statuses(response)
+
+        self.assertEqual(mget.call_count, 2)
+        self.assertEqual(
+            statuses,
+            [
+                {"task_id": "done", "status": "SUCCESS", "result": 8},
+                {"task_id": "waiting", "status": "PENDING"},
+                {"task_id": "failed", "status": "FAILURE", "error": "boom"},
+            ],
+        )
+
+    def test_bulk_status_by_group(self):
+        """Test that a saved group is expanded to its tasks"""
+        GroupResult("batch", [AsyncResult("done", app=app)], app=app).save()
+
+        response = self.client.get(reverse("task_statuses"), {"group_id": "batch"})
+        self.assertEqual(
+            self.statuses(response),
+            [{"task_id": "done", "status": "SUCCESS", "result": 8}],
+        )
+        response = self.client.get(reverse("task_statuses"), {"group_id": "missing"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_bulk_status_requires_ids(self):
+        """Test that a lookup without IDs is rejected"""
+        response = self.client.get(reverse("task_statuses"))
+        self.assertEqual(response.status_code, 400)
+
+
+class FakePubSub:
+    """In-memory stand-in for a redis.asyncio PubSub"""
+
+    def __init__(self):
+        self.messages = asyncio.Queue()
+        self.channels = set()
+
+    async def subscribe(self, name):
+        self.channels.add(name)
+
+    async def unsubscribe(self, name):
+        self.channels.discard(name)
+
+    async def get_message(self, timeout):
+        try:
+            return await asyncio.wait_for(self.messages.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class TaskEventsTestCase(MemoryResultBackendMixin, TestCase):
+    """Test pushed task state changes"""
+
+    def test_signals_publish_state_changes(self):
+        """Test that task state changes are published to the task's channel"""
+        client = Mock()
+        with patch("core.task_events.get_client", return_value=client):
+            _on_prerun(task_id="abc")
+
+        channel, data = client.publish.call_args.args
+        self.assertEqual(channel, "tasks:events:abc")
+        self.assertEqual(json.loads(data), {"task_id": "abc", "status": "STARTED"})
+
+    async def test_finished_task_stream_ends_immediately(self):
+        """Test that a ready task gets its final state and the stream closes"""
+        self.backend.store_result("sse-done", 8, "SUCCESS")
+
+        response = await self.async_client.get(
+            reverse("task_events", args=["sse-done"])
+        )
+
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        body = b"".join([chunk async for chunk in response.streaming_content])
+        self.assertIn(b'"status":"SUCCESS","result":8', body)
+
+    async def test_stream_pushes_published_changes(self):
+        """Test that messages from the shared subscription reach the stream"""
+        pubsub = FakePubSub()
+        with (
+            override_settings(TASK_EVENTS_REDIS_URL="redis://events"),
+            patch.object(TaskEventHub, "_connect", return_value=pubsub),
+        ):
+            response = await self.async_client.get(
+                reverse("task_events", args=["sse-running"])
+            )
+            chunks = aiter(response.streaming_content)
+            self.assertTrue((await anext(chunks)).startswith(b"retry:"))
+            self.assertIn(b'"PENDING"', await anext(chunks))
+            self.assertEqual(pubsub.channels, {"tasks:events:sse-running"})
+
+            await pubsub.messages.put(
+                {
+                    "channel": b"tasks:events:sse-running",
+                    "data": json.dumps(
+                        {"task_id": "sse-running", "status": "SUCCESS", "result": 3}
+                    ),
+                }
+            )
+            self.assertIn(b'"SUCCESS"', await anext(chunks))
+            self.assertEqual([chunk async for chunk in chunks], [])
+
+        self.assertEqual(pubsub.channels, set())
+
+    @override_settings(TASK_EVENTS_MAX_AGE=0)
+    async def test_queued_task_stream_is_only_bounded_by_max_age(self):
+        """Test that a PENDING task's stream ends like any other, for a reconnect"""
+        response = await self.async_client.get(
+            reverse("task_events", args=["sse-queued"])
+        )
+
+        body = b"".join([chunk async for chunk in response.streaming_content])
+        self.assertIn(b'"status":"PENDING"', body)
+
+    @override_settings(TASK_EVENTS_MAX_AGE=0)
+    async def test_stream_lifetime_is_bounded(self):
+        """Test that a stream of a running task ends after TASK_EVENTS_MAX_AGE"""
+        self.backend.store_result("sse-long", {"current": 1, "total": 9}, "PROGRESS")
+
+        response = await self.async_client.get(
+            reverse("task_events", args=["sse-long"])
+        )
+
+        body = b"".join([chunk async for chunk in response.streaming_content])
+        self.assertIn(b'"status":"PROGRESS"', body)
+
+
+@override_settings(CLAIM_CHECK_THRESHOLD=100)
+class ClaimCheckTestCase(MemoryResultBackendMixin, TestCase):
+    """Test offloading of large task payloads"""
+
+    def setUp(self):
+        super().setUp()
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        storage = patch.object(claim_check.storage, "location", location)
+        storage.start()
+        self.addCleanup(storage.stop)
+
+    def test_only_large_payloads_are_offloaded(self):
+        """Test that payloads above the threshold become references"""
+        self.assertEqual(offload("small"), "small")
+        self.assertEqual(offload(list(range(5))), list(range(5)))
+
+        payload = ["x" * 10] * 20
+        reference = offload(payload)
+        self.assertTrue(is_reference(reference))
+        self.assertEqual(resolve(reference), payload)
+
+    def test_task_arguments_and_results_are_offloaded(self):
+        """Test that a task sends references and resolves them when it runs"""
+        data = "y" * 500
+        with patch.object(Task, "apply_async") as publish:
+            process_data.delay(data)
+        [reference] = publish.call_args.args[0]
+        self.assertTrue(is_reference(reference))
+
+        with patch("core.tasks.time.sleep"):
+            result = process_data.apply(args=[reference]).result
+
+        self.assertTrue(is_reference(result))
+        self.assertEqual(
+            resolve(result), {"processed": True, "data": data, "result": 500}
+        )
+
+    def test_unsigned_references_are_plain_data(self):
+        """Test that user data shaped like a reference is not resolved"""
+        reference = offload(["secret" * 50])
+        forged = {"__claim_check__": reference["__claim_check__"], "size": 1}
+        self.assertFalse(is_reference(forged))
+        self.assertFalse(is_reference(dict(reference, signature="0" * 64)))
+
+        with patch("core.tasks.time.sleep"):
+            result = process_data.apply(args=[forged]).result
+
+        self.assertEqual(resolve(result)["data"], forged)
+
+    def test_task_status_streams_offloaded_results(self):
+        """Test that an offloaded result is streamed into the status response"""
+        payload = {"rows": ["z" * 50] * 10}
+        self.backend.store_result(
+            "offloaded", offload(payload, kind="result"), "SUCCESS"
+        )
+
+        response = self.client.get(reverse("task_status", args=["offloaded"]))
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(
+            json.loads(b"".join(response.streaming_content)),
+            {
+                "task_id": "offloaded",
+                "status": "SUCCESS",
+                "result": payload,
+                "error": None,
+                "progress": None,
+            },
+        )
+
+    def test_summaries_flag_offloaded_results(self):
+        """Test that bulk and pushed statuses do not expose the reference"""
+        reference = offload({"rows": ["z" * 50] * 10}, kind="result")
+
+        self.assertEqual(
+            summarize("offloaded", {"status": "SUCCESS", "result": reference}),
+            {"task_id": "offloaded", "status": "SUCCESS", "result_offloaded": True},
+        )
+
+    def test_expired_blobs_are_collected(self):
+        """Test that blobs older than the TTL are deleted"""
+        old = offload(["o" * 200])["__claim_check__"]
+        new = offload(["n" * 200])["__claim_check__"]
+        past = time.time() - 3600
+        os.utime(storage.path(old), (past, past))
+
+        self.assertEqual(collect_garbage(ttl=60), 1)
+        self.assertFalse(storage.exists(old))
+        self.assertTrue(storage.exists(new))
+
+
+class TaskProgressTestCase(MemoryResultBackendMixin, TestCase):
+    """Test throttled progress, checkpoints and cancellation of long tasks"""
+
+    def setUp(self):
+        super().setUp()
+        sleep = patch("core.tasks.time.sleep")
+        self.sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+
+    def test_progress_writes_are_coalesced(self):
+        """Test that fast steps are written at most TASK_PROGRESS_MAX_RATE per second"""
+        task = MagicMock()
+        task.request.id = "coalesced"
+        with override_settings(TASK_PROGRESS_MAX_RATE=0.01):
+            progress = ProgressReporter(task, total=100)
+            for step in range(1, 101):
+                progress.step(step, checkpoint=step)
+            progress.finish()
+
+        # The first step and the final flush.
+        self.assertEqual(task.update_state.call_count, 2)
+        meta = task.update_state.call_args.kwargs["meta"]
+        self.assertEqual(meta["current"], 100)
+        self.assertEqual(meta["percent"], 100.0)
+
+    def test_task_resumes_from_checkpoint(self):
+        """Test that a re-delivered task skips the steps it already did"""
+        task = long_running_task
+        task.push_request(id="resumed")
+        try:
+            ProgressReporter(task, total=5).step(3, checkpoint=3)
+        finally:
+            task.pop_request()
+
+        result = long_running_task.apply(args=[5], task_id="resumed")
+
+        self.assertEqual(result.get(), "Task completed after 5 seconds")
+        self.assertEqual(self.sleep.call_count, 2)
+        self.assertIsNone(load_checkpoint("resumed"))
+
+    def test_cancelled_task_stops_between_steps(self):
+        """Test that the cancel endpoint stops a running task at its next step"""
+        with patch.object(app.control, "revoke") as revoke:
+            response = self.client.post(reverse("cancel_task", args=["cancelled"]))
+        self.assertEqual(response.status_code, 202)
+        revoke.assert_called_once_with("cancelled")
+
+        long_running_task.apply(args=[5], task_id="cancelled")
+
+        self.assertEqual(self.sleep.call_count, 1)
+        self.assertEqual(self.backend.get_task_meta("cancelled")["status"], "REVOKED")
+        response = self.client.post(reverse("cancel_task", args=["cancelled"]))
+        self.assertEqual(response.status_code, 409)
+
+    def test_status_exposes_percent_and_eta(self):
+        """Test that the status endpoint returns the last progress report"""
+        progress = {
+            "current": 2,
+            "total": 8,
+            "percent": 25.0,
+            "eta": "2026-01-01T00:00:06+00:00",
+        }
+        self.backend.store_result("running", progress, "PROGRESS")
+
+        response = self.client.get(reverse("task_status", args=["running"]))
+
+        self.assertEqual(response.json()["status"], "PROGRESS")
+        self.assertEqual(response.json()["progress"], progress)
@@ -6,5 +6,9 @@ urlpatterns = [
     path("", views.home, name="home"),
     path("health/", views.health_check, name="health"),
     path("tasks/", views.create_task, name="create_task"),
+    path("tasks/batch/", views.create_task_batch, name="create_task_batch"),
+    path("tasks/status/", views.task_statuses, name="task_statuses"),
     path("tasks/<str:task_id>/", views.task_status, name="task_status"),
+    path("tasks/<str:task_id>/events/", views.task_events, name="task_events"),
+    path("tasks/<str:task_id>/cancel/", views.cancel_task, name="cancel_task"),
 ]
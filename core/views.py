@@ -1,6 +1,7 @@
 import json
 
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
@@ -10,6 +11,11 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 
+from django_app.celery import app
+from general.throttling import throttle
+
+from . import claim_check, progress, submission, task_results
+from .task_events import stream as task_events_stream
 from .tasks import add_numbers, long_running_task, process_data
 
 
@@ -136,6 +142,7 @@ def health_check(request):
 )
 @csrf_exempt
 @require_http_methods(["POST"])
+@throttle("tasks")
 def create_task(request):
     """
     Create and execute Celery tasks.
@@ -195,6 +202,94 @@ def create_task(request):
         return JsonResponse({"error": str(e)}, status=500)
 
 
+@extend_schema(
+    summary="Create Celery Tasks in Batch",
+    description=(
+        "Validate a list of task specs and publish them all as one Celery group. "
+        "Nothing is published unless every spec is valid."
+    ),
+    request={
+        "application/json": {
+            "type": "object",
+            "properties": {
+                "tasks": {
+                    "type": "array",
+                    "description": "Task specs, in the same format accepted by /tasks/",
+                    "items": {"type": "object"}
+                }
+            },
+            "required": ["tasks"]
+        }
+    },
+    responses={
+        202: OpenApiResponse(
+            description="Tasks published",
+            examples=[
+                {
+                    "group_id": "7c9e6679-7425-40de-944b-e07fc1f90ae7",
+                    "count": 2,
+                    "tasks": [
+                        {
+                            "task_id": "550e8400-e29b-41d4-a716-446655440000",
+                            "task_type": "add_numbers"
+                        },
+                        {
+                            "task_id": "6fa459ea-ee8a-3ca4-894e-db77e160355e",
+                            "task_type": "process_data"
+                        }
+                    ]
+                }
+            ]
+        ),
+        400: OpenApiResponse(description="Invalid JSON or task specs"),
+        500: OpenApiResponse(description="Internal server error")
+    },
+    tags=["Tasks"]
+)
+@csrf_exempt
+@require_http_methods(["POST"])
+@throttle("task_batches")
+def create_task_batch(request):
+    """
+    Create many Celery tasks with one request.
+
+    The specs are validated first; if any is invalid nothing is published
+    and the errors are returned by index. Otherwise the tasks are sent as a
+    single group over one pooled broker connection.
+    """
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
+
+    try:
+        specs = data.get("tasks") if isinstance(data, dict) else data
+        signatures, errors = submission.validate_batch(specs)
+    except submission.InvalidTaskSpec as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    if errors:
+        return JsonResponse(
+            {"error": "Invalid task specs", "errors": errors}, status=400
+        )
+
+    try:
+        result = submission.submit_batch(signatures)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+    return JsonResponse(
+        {
+            "group_id": result.id,
+            "count": len(result.results),
+            "tasks": [
+                {"task_id": task.id, "task_type": task_type}
+                for task, (_, task_type) in zip(result.results, signatures)
+            ],
+        },
+        status=202,
+    )
+
+
 @extend_schema(
     summary="Get Task Status",
     description="Check the status and result of a Celery task by its ID.",
@@ -215,7 +310,8 @@ def create_task(request):
                     "task_id": "550e8400-e29b-41d4-a716-446655440000",
                     "status": "SUCCESS",
                     "result": 8,
-                    "error": None
+                    "error": None,
+                    "progress": None
                 }
             ]
         )
@@ -237,16 +333,236 @@ def task_status(request, task_id):
     
     For successful tasks, the result will contain the task output.
     For failed tasks, the error field will contain the error message.
+    For tasks in progress, progress holds the completed steps, percent
+    and ETA last reported by the worker.
     """
-    from celery.result import AsyncResult
+    # One backend read, instead of one per AsyncResult attribute access.
+    [meta] = task_results.fetch_meta([task_id])
+    status = meta["status"]
 
-    task = AsyncResult(task_id)
+    if status == "SUCCESS" and claim_check.is_reference(meta["result"]):
+        return offloaded_result_response(task_id, status, meta["result"])
 
     return JsonResponse(
         {
             "task_id": task_id,
-            "status": task.status,
-            "result": task.result if task.status == "SUCCESS" else None,
-            "error": str(task.result) if task.status == "FAILURE" else None,
+            "status": status,
+            "result": meta["result"] if status == "SUCCESS" else None,
+            "error": str(meta["result"]) if status == "FAILURE" else None,
+            "progress": meta["result"] if status == "PROGRESS" else None,
         }
     )
+
+
+def offloaded_result_response(task_id, status, reference):
+    """Stream an offloaded result into the task status document as stored."""
+    if not claim_check.exists(reference):
+        return JsonResponse(
+            {
+                "task_id": task_id,
+                "status": status,
+                "result": None,
+                "error": "Result expired",
+                "progress": None,
+            }
+        )
+    head = json.dumps({"task_id": task_id, "status": status})[:-1] + ', "result": '
+
+    def document():
+        yield head.encode()
+        yield from claim_check.stream(reference)
+        yield b', "error": null, "progress": null}'
+
+    return StreamingHttpResponse(document(), content_type="application/json")
+
+
+@extend_schema(
+    summary="Cancel Task",
+    description=(
+        "Cancel a Celery task. A task that has not started yet is revoked and never "
+        "runs; a long-running task that reports its progress stops cooperatively at "
+        "its next step and is marked REVOKED, without its worker being killed."
+    ),
+    parameters=[
+        OpenApiParameter(
+            name="task_id",
+            description="The UUID of the task to cancel",
+            required=True,
+            type=str,
+            location=OpenApiParameter.PATH
+        )
+    ],
+    responses={
+        202: OpenApiResponse(
+            description="Cancellation requested",
+            examples=[
+                {
+                    "task_id": "550e8400-e29b-41d4-a716-446655440000",
+                    "status": "CANCELLING"
+                }
+            ]
+        ),
+        409: OpenApiResponse(description="The task has already finished")
+    },
+    tags=["Tasks"]
+)
+@csrf_exempt
+@require_http_methods(["POST"])
+def cancel_task(request, task_id):
+    """
+    Ask a task to stop.
+
+    Queued tasks are revoked so workers drop them; running tasks see the
+    cancellation flag between two steps.
+    """
+    [meta] = task_results.fetch_meta([task_id])
+    if meta["status"] in ("SUCCESS", "FAILURE", "REVOKED"):
+        return JsonResponse(
+            {
+                "task_id": task_id,
+                "status": meta["status"],
+                "error": "Task already finished",
+            },
+            status=409,
+        )
+    progress.cancel(task_id)
+    app.control.revoke(task_id)
+    return JsonResponse({"task_id": task_id, "status": "CANCELLING"}, status=202)
+
+
+@extend_schema(
+    summary="Stream Task Status Changes",
+    description=(
+        "Server-Sent Events stream of a task's state. The current state is sent first, "
+        "then every change (STARTED, PROGRESS, SUCCESS, FAILURE, RETRY, REVOKED) as it "
+        "happens, until the task is ready. Replaces polling /tasks/{task_id}/; meant "
+        "to be served by the ASGI application."
+    ),
+    parameters=[
+        OpenApiParameter(
+            name="task_id",
+            description="The UUID of the task to follow",
+            required=True,
+            type=str,
+            location=OpenApiParameter.PATH
+        )
+    ],
+    responses={
+        200: OpenApiResponse(
+            description=(
+                "text/event-stream; each event's data is the task's compact status"
+            ),
+            examples=[
+                {
+                    "task_id": "550e8400-e29b-41d4-a716-446655440000",
+                    "status": "PROGRESS",
+                    "progress": {"current": 3, "total": 10}
+                }
+            ]
+        )
+    },
+    tags=["Tasks"]
+)
+@require_http_methods(["GET"])
+async def task_events(request, task_id):
+    """
+    Stream task state changes as Server-Sent Events.
+
+    Changes are pushed through Redis pub/sub from the workers, so an idle
+    stream costs nothing but a periodic keep-alive comment.
+    """
+    response = StreamingHttpResponse(
+        task_events_stream(task_id), content_type="text/event-stream"
+    )
+    response["Cache-Control"] = "no-cache"
+    # Keep nginx from buffering the stream.
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@extend_schema(
+    summary="Get Task Statuses in Bulk",
+    description=(
+        "Check the status of many Celery tasks at once, given their IDs or the ID of a "
+        "batch. The metadata is read from the result backend with one MGET per chunk "
+        "and streamed back as NDJSON, one line per task in request order. result is "
+        "only present for SUCCESS and error only for failed, retried or revoked tasks."
+    ),
+    parameters=[
+        OpenApiParameter(
+            name="group_id",
+            description="ID of a batch returned by /tasks/batch/",
+            required=False,
+            type=str,
+            location=OpenApiParameter.QUERY
+        ),
+        OpenApiParameter(
+            name="ids",
+            description=(
+                "Comma-separated task IDs (GET only; POST {\"task_ids\": [...]} for "
+                "long lists)"
+            ),
+            required=False,
+            type=str,
+            location=OpenApiParameter.QUERY
+        )
+    ],
+    responses={
+        200: OpenApiResponse(
+            description="One JSON object per line",
+            examples=[
+                {
+                    "task_id": "550e8400-e29b-41d4-a716-446655440000",
+                    "status": "SUCCESS",
+                    "result": 8
+                }
+            ]
+        ),
+        400: OpenApiResponse(description="Missing or too many task IDs"),
+        404: OpenApiResponse(description="Unknown group ID")
+    },
+    tags=["Tasks"]
+)
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+def task_statuses(request):
+    """
+    Check the status of many tasks with one request.
+
+    Accepts task IDs (``ids`` query parameter, or ``task_ids`` in a JSON
+    body) or a ``group_id``. Results are streamed a chunk at a time, so
+    the first lines are sent before the last chunk has been read.
+    """
+    params = request.GET
+    if request.method == "POST":
+        try:
+            params = json.loads(request.body or b"{}")
+        except json.JSONDecodeError:
+            return JsonResponse({"error": "Invalid JSON"}, status=400)
+        if not isinstance(params, dict):
+            return JsonResponse({"error": "Expected a JSON object"}, status=400)
+
+    group_id = params.get("group_id")
+    if group_id:
+        task_ids = task_results.group_task_ids(group_id)
+        if task_ids is None:
+            return JsonResponse({"error": "Unknown group"}, status=404)
+    elif request.method == "POST":
+        task_ids = params.get("task_ids")
+    else:
+        task_ids = [task_id for task_id in params.get("ids", "").split(",") if task_id]
+
+    if not isinstance(task_ids, list) or not task_ids or not all(
+        isinstance(task_id, str) and task_id for task_id in task_ids
+    ):
+        return JsonResponse({"error": "Provide task IDs or a group ID"}, status=400)
+    if len(task_ids) > settings.TASK_STATUS_MAX_IDS:
+        return JsonResponse(
+            {"error": f"At most {settings.TASK_STATUS_MAX_IDS} tasks per request"},
+            status=400,
+        )
+
+    return StreamingHttpResponse(
+        task_results.stream_statuses(task_ids, settings.TASK_STATUS_CHUNK_SIZE),
+        content_type="application/x-ndjson",
+    )
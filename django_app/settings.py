@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -51,6 +53,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django_prometheus.middleware.PrometheusBeforeMiddleware",
+    "general.query_inspector.QueryInspectorMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -115,6 +118,25 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+PASSWORD_HASHERS = [
+    "access.hashers.PooledPBKDF2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+    "django.contrib.auth.hashers.Argon2PasswordHasher",
+    "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
+    "django.contrib.auth.hashers.ScryptPasswordHasher",
+]
+
+# Password hashing execution (access.hashers). A pool size of 0 hashes inline.
+PASSWORD_HASHING_ITERATIONS = int(
+    os.environ.get("PASSWORD_HASHING_ITERATIONS", 1_000_000)
+)
+PASSWORD_HASHING_POOL_SIZE = int(os.environ.get("PASSWORD_HASHING_POOL_SIZE", 0))
+PASSWORD_HASHING_MAX_QUEUE = int(os.environ.get("PASSWORD_HASHING_MAX_QUEUE", 32))
+PASSWORD_HASHING_QUEUE_TIMEOUT = float(
+    os.environ.get("PASSWORD_HASHING_QUEUE_TIMEOUT", 2.0)
+)
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -146,6 +168,179 @@ CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULE = {}
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+REDIS_URL = os.environ.get("REDIS_URL", "")
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# GCRA rate limiter store (general.throttling)
+THROTTLE_REDIS_URL = os.environ.get("THROTTLE_REDIS_URL", REDIS_URL)
+
+# Authenticated user cache (access.user_cache)
+USER_CACHE_TIMEOUT = int(os.environ.get("USER_CACHE_TIMEOUT", 300))
+USER_CACHE_LOCAL_MAXSIZE = int(os.environ.get("USER_CACHE_LOCAL_MAXSIZE", 1024))
+USER_CACHE_LOCAL_TIMEOUT = int(os.environ.get("USER_CACHE_LOCAL_TIMEOUT", 5))
+
+# Versioned current-user profile cache (access.profile_cache)
+PROFILE_CACHE_TIMEOUT = int(os.environ.get("PROFILE_CACHE_TIMEOUT", 300))
+
+# JWT revocation store (access.revocation)
+TOKEN_REVOCATION_SYNC_INTERVAL = float(
+    os.environ.get("TOKEN_REVOCATION_SYNC_INTERVAL", 1.0)
+)
+TOKEN_REVOCATION_BLOOM_CAPACITY = int(
+    os.environ.get("TOKEN_REVOCATION_BLOOM_CAPACITY", 1_000_000)
+)
+TOKEN_REVOCATION_BLOOM_ERROR_RATE = float(
+    os.environ.get("TOKEN_REVOCATION_BLOOM_ERROR_RATE", 0.001)
+)
+
+# LoggedDevice login-time write coalescing (access.login_buffer)
+DEVICE_LOGIN_COALESCE = (
+    os.environ.get("DEVICE_LOGIN_COALESCE", "False").lower() == "true"
+)
+DEVICE_LOGIN_FLUSH_INTERVAL = int(os.environ.get("DEVICE_LOGIN_FLUSH_INTERVAL", 10))
+
+if DEVICE_LOGIN_COALESCE and not REDIS_URL:
+    # Pending timestamps live in the default cache, which is per-process
+    # without Redis: the flush task would never see them.
+    raise ImproperlyConfigured("DEVICE_LOGIN_COALESCE requires REDIS_URL to be set.")
+
+if DEVICE_LOGIN_COALESCE:
+    CELERY_BEAT_SCHEDULE["flush-device-logins"] = {
+        "task": "access.tasks.flush_device_logins",
+        "schedule": DEVICE_LOGIN_FLUSH_INTERVAL,
+    }
+
+# Batched asynchronous pre-registration ingestion (access.pre_register_queue)
+PRE_REGISTER_ASYNC = os.environ.get("PRE_REGISTER_ASYNC", "False").lower() == "true"
+PRE_REGISTER_BATCH_SIZE = int(os.environ.get("PRE_REGISTER_BATCH_SIZE", 1000))
+PRE_REGISTER_DRAIN_INTERVAL = int(os.environ.get("PRE_REGISTER_DRAIN_INTERVAL", 5))
+
+if PRE_REGISTER_ASYNC and not REDIS_URL:
+    # The queue lives in the default cache, which is per-process without Redis:
+    # workers would never see what the web processes enqueue.
+    raise ImproperlyConfigured("PRE_REGISTER_ASYNC requires REDIS_URL to be set.")
+
+if PRE_REGISTER_ASYNC:
+    CELERY_BEAT_SCHEDULE["drain-pre-registrations"] = {
+        "task": "access.tasks.drain_pre_registrations",
+        "schedule": PRE_REGISTER_DRAIN_INTERVAL,
+    }
+
+# Control table partitioning and retention (access.retention)
+CONTROL_TABLE_RETENTION_DAYS = int(os.environ.get("CONTROL_TABLE_RETENTION_DAYS", 90))
+CONTROL_TABLE_PARTITION_MONTHS_AHEAD = int(
+    os.environ.get("CONTROL_TABLE_PARTITION_MONTHS_AHEAD", 3)
+)
+PRE_REGISTER_RETENTION_DAYS = int(os.environ.get("PRE_REGISTER_RETENTION_DAYS", 0))
+RETENTION_PURGE_CHUNK_SIZE = int(os.environ.get("RETENTION_PURGE_CHUNK_SIZE", 5000))
+
+CELERY_BEAT_SCHEDULE["purge-control-tables"] = {
+    "task": "access.tasks.purge_control_tables",
+    "schedule": 60 * 60 * 24,
+}
+
+# Notification broadcast fan-out (access.broadcast)
+NOTIFICATION_FANOUT_CHUNK_SIZE = int(
+    os.environ.get("NOTIFICATION_FANOUT_CHUNK_SIZE", 1000)
+)
+NOTIFICATION_FANOUT_GROUP_SIZE = int(
+    os.environ.get("NOTIFICATION_FANOUT_GROUP_SIZE", 50)
+)
+
+# Avatar variants (access.avatars)
+AVATAR_VARIANT_SIZES = [
+    int(size)
+    for size in os.environ.get("AVATAR_VARIANT_SIZES", "64,128,256,512").split(",")
+]
+AVATAR_DEFAULT_SIZE = int(os.environ.get("AVATAR_DEFAULT_SIZE", 256))
+AVATAR_VARIANT_FORMAT = os.environ.get("AVATAR_VARIANT_FORMAT", "WEBP").upper()
+AVATAR_VARIANT_QUALITY = int(os.environ.get("AVATAR_VARIANT_QUALITY", 80))
+
+# Credit ledger balance reconciliation (access.credits)
+CREDIT_RECONCILE_INTERVAL = int(os.environ.get("CREDIT_RECONCILE_INTERVAL", 3600))
+CREDIT_RECONCILE_CHUNK_SIZE = int(os.environ.get("CREDIT_RECONCILE_CHUNK_SIZE", 1000))
+
+CELERY_BEAT_SCHEDULE["reconcile-credit-balances"] = {
+    "task": "access.tasks.reconcile_credit_balances",
+    "schedule": CREDIT_RECONCILE_INTERVAL,
+}
+
+# Content-addressed private media layout (general.storage_backends)
+PRIVATE_MEDIA_CONTENT_ADDRESSED = (
+    os.environ.get("PRIVATE_MEDIA_CONTENT_ADDRESSED", "False").lower() == "true"
+)
+
+# Signed private media URLs and serving (general.media)
+PRIVATE_MEDIA_URL_TTL = int(os.environ.get("PRIVATE_MEDIA_URL_TTL", 3600))
+# "django" (FileResponse), "nginx" (X-Accel-Redirect) or "sendfile" (X-Sendfile).
+# Production defaults to nginx so that files never stream through a worker.
+PRIVATE_MEDIA_SERVE = os.environ.get(
+    "PRIVATE_MEDIA_SERVE", "django" if DEBUG else "nginx"
+).lower()
+PRIVATE_MEDIA_ACCEL_PREFIX = os.environ.get(
+    "PRIVATE_MEDIA_ACCEL_PREFIX", "/protected_media/"
+)
+PRIVATE_MEDIA_CACHE_MAX_AGE = int(
+    os.environ.get("PRIVATE_MEDIA_CACHE_MAX_AGE", 60 * 60 * 24 * 365)
+)
+
+# Batch task submission (core.submission)
+TASK_BATCH_MAX_SIZE = int(os.environ.get("TASK_BATCH_MAX_SIZE", 5000))
+TASK_MAX_DURATION = int(os.environ.get("TASK_MAX_DURATION", 300))
+
+# Bulk task status lookups (core.task_results)
+TASK_STATUS_MAX_IDS = int(os.environ.get("TASK_STATUS_MAX_IDS", 5000))
+TASK_STATUS_CHUNK_SIZE = int(os.environ.get("TASK_STATUS_CHUNK_SIZE", 500))
+
+# Claim-check offloading of large task payloads (core.claim_check)
+CLAIM_CHECK_LOCATION = os.environ.get(
+    "CLAIM_CHECK_LOCATION", os.path.join(BASE_DIR, "claim_checks")
+)
+CLAIM_CHECK_THRESHOLD = int(os.environ.get("CLAIM_CHECK_THRESHOLD", 256 * 1024))
+CLAIM_CHECK_TTL = int(os.environ.get("CLAIM_CHECK_TTL", 60 * 60 * 24 * 2))
+
+CELERY_BEAT_SCHEDULE["collect-claim-checks"] = {
+    "task": "core.tasks.collect_claim_checks",
+    "schedule": 60 * 60,
+}
+
+# Task state change streams (core.task_events)
+TASK_EVENTS_REDIS_URL = os.environ.get("TASK_EVENTS_REDIS_URL", REDIS_URL)
+TASK_EVENTS_KEEPALIVE = int(os.environ.get("TASK_EVENTS_KEEPALIVE", 15))
+TASK_EVENTS_POLL_INTERVAL = float(os.environ.get("TASK_EVENTS_POLL_INTERVAL", 1.0))
+TASK_EVENTS_RETRY_MS = int(os.environ.get("TASK_EVENTS_RETRY_MS", 3000))
+TASK_EVENTS_MAX_AGE = int(os.environ.get("TASK_EVENTS_MAX_AGE", 300))
+
+# Throttled progress reporting of long-running tasks (core.progress)
+TASK_PROGRESS_MAX_RATE = float(os.environ.get("TASK_PROGRESS_MAX_RATE", 2.0))
+
+# Per-request query counting and N+1 detection (general.query_inspector)
+QUERY_INSPECTOR_ENABLED = (
+    os.environ.get("QUERY_INSPECTOR_ENABLED", str(DEBUG)).lower() == "true"
+)
+QUERY_INSPECTOR_CAPTURE_STACKS = (
+    os.environ.get("QUERY_INSPECTOR_CAPTURE_STACKS", str(DEBUG)).lower() == "true"
+)
+QUERY_INSPECTOR_N_PLUS_ONE_THRESHOLD = int(
+    os.environ.get("QUERY_INSPECTOR_N_PLUS_ONE_THRESHOLD", 5)
+)
 
 # Static files
 STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
@@ -183,7 +378,7 @@ AUTH_USER_MODEL = "access.CustomUserModel"
 # Django REST Framework
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "access.authentication.CachedJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
@@ -191,6 +386,15 @@ REST_FRAMEWORK = {
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 20,
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    # Scoped GCRA throttles (general.throttling)
+    "DEFAULT_THROTTLE_RATES": {
+        "login": os.environ.get("THROTTLE_RATE_LOGIN", "10/min"),
+        "register": os.environ.get("THROTTLE_RATE_REGISTER", "5/min"),
+        "pre_register": os.environ.get("THROTTLE_RATE_PRE_REGISTER", "5/min"),
+        "password_reset": os.environ.get("THROTTLE_RATE_PASSWORD_RESET", "5/hour"),
+        "tasks": os.environ.get("THROTTLE_RATE_TASKS", "60/min"),
+        "task_batches": os.environ.get("THROTTLE_RATE_TASK_BATCHES", "10/min"),
+    },
 }
 
 # JWT Settings
@@ -27,6 +27,7 @@ urlpatterns = [
     path("admin/", admin.site.urls),
     path("", include("core.urls")),
     path("", include("access.urls")),
+    path("", include("general.urls")),
     path("", include("django_prometheus.urls")),
     # API Documentation
     path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
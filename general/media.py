@@ -0,0 +1,156 @@
+"""
+Signed URLs and proxy-offloaded serving for private media.
+
+``PrivateMediaStorage.url`` appends ``expires`` and ``signature`` (an HMAC of
+the name and expiry keyed on ``SECRET_KEY``) to every URL, and ``serve``
+answers those URLs once the signature checks out. Expiry times are rounded
+up to a multiple of ``PRIVATE_MEDIA_URL_TTL``, so a file keeps the same URL
+for a whole window and browsers and cached profiles can reuse it.
+
+In production the bytes never pass through Python: ``PRIVATE_MEDIA_SERVE``
+set to ``"nginx"`` (the default without ``DEBUG``) answers with
+``X-Accel-Redirect`` and ``"sendfile"`` with ``X-Sendfile``, leaving the
+transfer (including Range requests) to the proxy. ``"django"``, the default
+with ``DEBUG`` and for running without a proxy, answers with a
+``FileResponse`` (206 for single byte ranges). Gunicorn may hand that file to
+``os.sendfile`` under the WSGI deployment, but nothing guarantees it: under
+ASGI, TLS, or another server, the file is read through Python in chunks.
+"""
+
+import mimetypes
+import os
+import re
+import time
+from urllib.parse import quote, urlencode
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.utils.http import http_date
+
+SIGNATURE_SALT = "general.media.private"
+RANGE_HEADER = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def signature(name, expires):
+    return salted_hmac(SIGNATURE_SALT, f"{name}:{expires}").hexdigest()
+
+
+def sign(name, now=None):
+    """Return the query string that authorizes access to ``name``."""
+    ttl = settings.PRIVATE_MEDIA_URL_TTL
+    now = int(time.time() if now is None else now)
+    # Valid for at least one TTL, and identical throughout the current window.
+    expires = (now // ttl + 2) * ttl
+    return urlencode({"expires": expires, "signature": signature(name, expires)})
+
+
+def verify(name, expires, given, now=None):
+    try:
+        expires = int(expires)
+    except (TypeError, ValueError):
+        return False
+    if expires < (time.time() if now is None else now):
+        return False
+    return constant_time_compare(signature(name, expires), given or "")
+
+
+class FileRange:
+    """
+    Read-only view of ``length`` bytes of ``file`` from its current position.
+
+    It keeps ``fileno`` so ``wsgi.file_wrapper`` can still use ``sendfile``,
+    which transfers the response's Content-Length from the current offset.
+    """
+
+    def __init__(self, file, length):
+        self.file = file
+        self.name = file.name
+        self.remaining = length
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """Return ``(start, end)`` for a single satisfiable byte range, else ``None``."""
+    match = RANGE_HEADER.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        return None
+    return start, end
+
+
+def cache_control(storage, expires, now=None):
+    """Return the Cache-Control value for a URL valid until ``expires``."""
+    if storage.content_addressed:
+        # A content-addressed name always refers to the same bytes.
+        return f"private, max-age={settings.PRIVATE_MEDIA_CACHE_MAX_AGE}, immutable"
+    # Flat names can be deleted and saved again with other content, so a copy
+    # is only reused for as long as the URL that fetched it is valid.
+    now = int(time.time() if now is None else now)
+    max_age = max(0, min(expires - now, settings.PRIVATE_MEDIA_CACHE_MAX_AGE))
+    return f"private, max-age={max_age}"
+
+
+def serve(request, storage, name, expires):
+    """Answer an already authorized request for ``name`` in ``storage``."""
+    path = storage.path(name)
+    if not os.path.isfile(path):
+        return HttpResponse(status=404)
+
+    mode = settings.PRIVATE_MEDIA_SERVE
+    content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    if mode == "nginx":
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = settings.PRIVATE_MEDIA_ACCEL_PREFIX + quote(name)
+    elif mode == "sendfile":
+        response = HttpResponse(content_type=content_type)
+        response["X-Sendfile"] = path
+    else:
+        response = file_response(request, path, content_type)
+
+    response["Cache-Control"] = cache_control(storage, expires)
+    return response
+
+
+def file_response(request, path, content_type):
+    size = os.path.getsize(path)
+    header = request.headers.get("Range")
+    byte_range = parse_range(header, size) if header else None
+    if header and byte_range is None and RANGE_HEADER.match(header.strip()):
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+
+    file = open(path, "rb")
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        file.seek(start)
+        response = FileResponse(
+            FileRange(file, end - start + 1), content_type=content_type, status=206
+        )
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = str(end - start + 1)
+    response["Accept-Ranges"] = "bytes"
+    response["Last-Modified"] = http_date(os.path.getmtime(path))
+    return response
@@ -0,0 +1,273 @@
+"""
+Monthly range partitioning and retention for append-only tables.
+
+On PostgreSQL a table converted with ``partition_table`` is declared
+``PARTITION BY RANGE (<column>)`` with one partition per calendar month
+(``<table>_pYYYYMM``) plus a default partition. Expiring data is then a
+``DROP TABLE`` of whole partitions, which writes no WAL per row and leaves
+nothing for autovacuum. Rows outside the monthly partitions (older than the
+conversion, or dated past the months created so far) land in the default
+partition; they are purged with chunked deletes, and moved into a month's
+partition when it is created. Other backends, and tables that were never
+converted, fall back to deleting expired rows in small primary-key chunks.
+"""
+
+import logging
+import re
+from datetime import datetime
+from datetime import timezone as dt_timezone
+
+from django.db import connections, router, transaction
+
+logger = logging.getLogger(__name__)
+
+PARTITION_SUFFIX = re.compile(r"_p(\d{4})(\d{2})$")
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(value, months):
+    month = value.month - 1 + months
+    return value.replace(year=value.year + month // 12, month=month % 12 + 1)
+
+
+def partition_name(table, start):
+    return f"{table}_p{start:%Y%m}"
+
+
+def is_partitioned(connection, table):
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table p "
+            "JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = %s AND pg_table_is_visible(c.oid)",
+            [table],
+        )
+        return cursor.fetchone() is not None
+
+
+def partitioning_of(connection, table):
+    """Return ``(partition key column, default partition name or None)``."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT a.attname, d.relname FROM pg_partitioned_table p "
+            "JOIN pg_class c ON c.oid = p.partrelid "
+            "JOIN pg_attribute a "
+            "ON a.attrelid = p.partrelid AND a.attnum = p.partattrs[0] "
+            "LEFT JOIN pg_class d ON d.oid = p.partdefid "
+            "WHERE c.relname = %s AND pg_table_is_visible(c.oid)",
+            [table],
+        )
+        return cursor.fetchone()
+
+
+def list_partitions(connection, table):
+    """Return ``{partition name: month start}`` for the monthly partitions."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits i "
+            "JOIN pg_class parent ON parent.oid = i.inhparent "
+            "JOIN pg_class child ON child.oid = i.inhrelid "
+            "WHERE parent.relname = %s AND pg_table_is_visible(parent.oid)",
+            [table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = {}
+    for name in names:
+        match = PARTITION_SUFFIX.search(name)
+        if match:
+            year, month = (int(part) for part in match.groups())
+            partitions[name] = datetime(year, month, 1, tzinfo=dt_timezone.utc)
+    return partitions
+
+
+def create_partitions(connection, table, first, last):
+    """
+    Create the monthly partitions of ``table`` covering ``first``..``last``.
+
+    PostgreSQL refuses a new partition while the default partition holds
+    rows for its range, so each month is built as a plain table, filled
+    with those rows, and attached in one transaction. Returns the names of
+    the partitions created.
+    """
+    qn = connection.ops.quote_name
+    column, default = partitioning_of(connection, table)
+    existing = list_partitions(connection, table)
+    created = []
+    start = month_start(first)
+    while start <= last:
+        end = add_months(start, 1)
+        name = partition_name(table, start)
+        if name not in existing:
+            with transaction.atomic(using=connection.alias):
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f"CREATE TABLE {qn(name)} (LIKE {qn(table)} "
+                        f"INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+                    )
+                    if default:
+                        cursor.execute(
+                            f"WITH moved AS (DELETE FROM {qn(default)} "
+                            f"WHERE {qn(column)} >= %s AND {qn(column)} < %s "
+                            f"RETURNING *) "
+                            f"INSERT INTO {qn(name)} SELECT * FROM moved",
+                            [start, end],
+                        )
+                    cursor.execute(
+                        f"ALTER TABLE {qn(table)} ATTACH PARTITION {qn(name)} "
+                        f"FOR VALUES FROM ('{start.isoformat()}') "
+                        f"TO ('{end.isoformat()}')"
+                    )
+            created.append(name)
+        start = end
+    return created
+
+
+def partition_table(connection, model, column, months_ahead):
+    """
+    Rebuild ``model``'s table as a monthly range-partitioned table.
+
+    The primary key becomes ``(pk, column)``, as PostgreSQL requires the
+    partition key in every unique constraint. Existing rows are copied into
+    partitions created from the oldest row's month onwards.
+    """
+    table = model._meta.db_table
+    if connection.vendor != "postgresql" or is_partitioned(connection, table):
+        return False
+
+    qn = connection.ops.quote_name
+    pk = model._meta.pk
+    old = f"{table}_unpartitioned"
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {qn(table)} RENAME TO {qn(old)}")
+        # Free the primary key's index name for the new table.
+        cursor.execute(
+            "SELECT conname FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype = 'p'",
+            [old],
+        )
+        for (constraint,) in cursor.fetchall():
+            cursor.execute(f"ALTER TABLE {qn(old)} DROP CONSTRAINT {qn(constraint)}")
+        cursor.execute(
+            f"CREATE TABLE {qn(table)} "
+            f"(LIKE {qn(old)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS, "
+            f"PRIMARY KEY ({qn(pk.column)}, {qn(column)})) "
+            f"PARTITION BY RANGE ({qn(column)})"
+        )
+        if pk.get_internal_type() in ("AutoField", "BigAutoField"):
+            # Identity columns are not copied by LIKE, so keep numbering going
+            # with a sequence owned by the new table.
+            sequence = f"{table}_{pk.column}_partitioned_seq"
+            cursor.execute(
+                f"CREATE SEQUENCE {qn(sequence)} OWNED BY {qn(table)}.{qn(pk.column)}"
+            )
+            cursor.execute(
+                f"ALTER TABLE {qn(table)} ALTER COLUMN {qn(pk.column)} "
+                f"SET DEFAULT nextval('{sequence}')"
+            )
+            cursor.execute(
+                f"SELECT setval('{sequence}', "
+                f"COALESCE((SELECT MAX({qn(pk.column)}) FROM {qn(old)}), 0) + 1, false)"
+            )
+        cursor.execute(
+            f"CREATE TABLE {qn(f'{table}_default')} PARTITION OF {qn(table)} DEFAULT"
+        )
+        cursor.execute(f"SELECT MIN({qn(column)}) FROM {qn(old)}")
+        oldest = cursor.fetchone()[0]
+
+    now = datetime.now(dt_timezone.utc)
+    create_partitions(
+        connection, table, oldest or now, add_months(month_start(now), months_ahead)
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {qn(table)} SELECT * FROM {qn(old)}")
+        cursor.execute(f"DROP TABLE {qn(old)}")
+    return True
+
+
+def ensure_partitions(model, months_ahead):
+    """Create partitions for the current month and ``months_ahead`` after it."""
+    connection = connections[router.db_for_write(model)]
+    table = model._meta.db_table
+    if not is_partitioned(connection, table):
+        return []
+    now = month_start(datetime.now(dt_timezone.utc))
+    return create_partitions(connection, table, now, add_months(now, months_ahead))
+
+
+def drop_expired_partitions(connection, table, cutoff):
+    qn = connection.ops.quote_name
+    dropped = []
+    for name, start in sorted(list_partitions(connection, table).items()):
+        if add_months(start, 1) > cutoff:
+            continue
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(f"ALTER TABLE {qn(table)} DETACH PARTITION {qn(name)}")
+                cursor.execute(f"DROP TABLE {qn(name)}")
+        dropped.append(name)
+    return dropped
+
+
+def delete_expired_default_rows(connection, model, cutoff, chunk_size):
+    """Delete default-partition rows older than ``cutoff`` in chunks."""
+    qn = connection.ops.quote_name
+    table = model._meta.db_table
+    column, default = partitioning_of(connection, table)
+    if not default:
+        return 0
+    pk = qn(model._meta.pk.column)
+    deleted = 0
+    while True:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {qn(default)} WHERE {pk} IN "
+                f"(SELECT {pk} FROM {qn(default)} WHERE {qn(column)} < %s LIMIT %s)",
+                [cutoff, chunk_size],
+            )
+            if not cursor.rowcount:
+                return deleted
+            deleted += cursor.rowcount
+
+
+def delete_expired_rows(model, column, cutoff, chunk_size):
+    """Delete rows older than ``cutoff`` in primary-key chunks; returns the count."""
+    manager = model._base_manager
+    deleted = 0
+    while True:
+        pks = list(
+            manager.filter(**{f"{column}__lt": cutoff})
+            .order_by()
+            .values_list("pk", flat=True)[:chunk_size]
+        )
+        if not pks:
+            return deleted
+        deleted += manager.filter(pk__in=pks).delete()[0]
+
+
+def purge(model, column, cutoff, chunk_size):
+    """
+    Remove rows of ``model`` older than ``cutoff``.
+
+    Partitioned tables lose whole months that ended before ``cutoff``, and
+    the expired rows of their default partition; rows in the month
+    straddling ``cutoff`` stay until that partition expires.
+    """
+    connection = connections[router.db_for_write(model)]
+    table = model._meta.db_table
+    if is_partitioned(connection, table):
+        dropped = drop_expired_partitions(connection, table, cutoff)
+        if dropped:
+            logger.info(f"Dropped partitions {', '.join(dropped)}")
+        return {
+            "partitions": len(dropped),
+            "rows": delete_expired_default_rows(connection, model, cutoff, chunk_size),
+        }
+    return {
+        "partitions": 0,
+        "rows": delete_expired_rows(model, column, cutoff, chunk_size),
+    }
@@ -0,0 +1,191 @@
+"""
+Per-request SQL query accounting.
+
+``QueryInspectorMiddleware`` installs an ``execute_wrapper`` on every database
+connection for the duration of a request, counts the queries and the time
+spent in them, and exports both as per-view histograms on ``/metrics``. Queries
+are grouped by shape (the SQL with literals stripped); a shape that repeats at
+least ``QUERY_INSPECTOR_N_PLUS_ONE_THRESHOLD`` times in one request is reported
+as a likely N+1, together with the application frame that issued it.
+
+``QueryInspector`` can be used on its own, which is what
+``general.testing.QueryBudgetMixin`` does to enforce query budgets in tests.
+"""
+
+import logging
+import re
+import time
+import traceback
+from collections import Counter as ShapeCounter
+from contextlib import ExitStack
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from prometheus_client import Counter, Histogram
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+VIEW_QUERIES = Histogram(
+    "django_view_db_queries",
+    "SQL queries issued per request",
+    ["view"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, float("inf")),
+)
+VIEW_QUERY_SECONDS = Histogram(
+    "django_view_db_query_seconds",
+    "Time spent in SQL queries per request",
+    ["view"],
+)
+N_PLUS_ONE_DETECTED = Counter(
+    "django_view_n_plus_one_total",
+    "Requests in which a query shape repeated past the N+1 threshold",
+    ["view"],
+)
+
+PROJECT_ROOT = str(Path(settings.BASE_DIR).resolve())
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN \((?:\s*(?:%s|\?)\s*,?)+\)", re.IGNORECASE)
+
+
+def query_shape(sql):
+    """Return ``sql`` with literals and ``IN`` lists collapsed."""
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = sql.replace("%s", "?")
+    return _IN_LIST.sub("IN (...)", sql)
+
+
+def view_label(request):
+    """Return the URL name of the view that served ``request``."""
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "<unresolved>"
+    if match.view_name:
+        return match.view_name
+    view = getattr(match.func, "cls", None) or getattr(
+        match.func, "view_class", match.func
+    )
+    return f"{view.__module__}.{view.__qualname__}"
+
+
+def _origin():
+    """Return the innermost application frame outside this module."""
+    for frame in reversed(traceback.extract_stack()[:-2]):
+        filename = str(Path(frame.filename).resolve())
+        if (
+            filename.startswith(PROJECT_ROOT)
+            and "site-packages" not in filename
+            and filename != str(Path(__file__).resolve())
+        ):
+            path = Path(filename).relative_to(PROJECT_ROOT)
+            return f"{path}:{frame.lineno} in {frame.name}"
+    return None
+
+
+class QueryInspector:
+    """Context manager that records every query run while it is active."""
+
+    def __init__(self, capture_stacks=True):
+        self.capture_stacks = capture_stacks
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = ShapeCounter()
+        self.origins = {}
+        self._stack = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            shape = query_shape(sql)
+            self.shapes[shape] += 1
+            if self.capture_stacks and shape not in self.origins:
+                self.origins[shape] = _origin()
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+        self._stack = None
+
+    def repeated(self, threshold):
+        """Return ``(shape, count, origin)`` for shapes run ``threshold`` times."""
+        return [
+            (shape, count, self.origins.get(shape))
+            for shape, count in self.shapes.most_common()
+            if count >= threshold
+        ]
+
+
+class QueryInspectorMiddleware:
+    """Export per-view query counts and time, and log likely N+1 queries."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.QUERY_INSPECTOR_ENABLED:
+            return self.get_response(request)
+
+        with self._inspector() as inspector:
+            response = self.get_response(request)
+        return self._record(request, response, inspector)
+
+    async def __acall__(self, request):
+        if not settings.QUERY_INSPECTOR_ENABLED:
+            return await self.get_response(request)
+
+        # Async views reach the ORM through sync_to_async, which runs in the
+        # request's thread-sensitive executor, so the wrappers are installed
+        # on that thread's connections rather than the event loop's.
+        inspector = self._inspector()
+        await sync_to_async(inspector.__enter__)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(inspector.__exit__)(None, None, None)
+        return self._record(request, response, inspector)
+
+    def _inspector(self):
+        return QueryInspector(capture_stacks=settings.QUERY_INSPECTOR_CAPTURE_STACKS)
+
+    def _record(self, request, response, inspector):
+        view = view_label(request)
+        VIEW_QUERIES.labels(view=view).observe(inspector.count)
+        VIEW_QUERY_SECONDS.labels(view=view).observe(inspector.duration)
+
+        repeated = inspector.repeated(settings.QUERY_INSPECTOR_N_PLUS_ONE_THRESHOLD)
+        if repeated:
+            N_PLUS_ONE_DETECTED.labels(view=view).inc()
+            for shape, count, origin in repeated:
+                logger.warning(
+                    "Possible N+1 in %s: %d queries of shape %r from %s",
+                    view,
+                    count,
+                    shape,
+                    origin or "<unknown>",
+                )
+
+        if settings.DEBUG:
+            response["X-DB-Query-Count"] = str(inspector.count)
+            response["X-DB-Query-Time"] = f"{inspector.duration * 1000:.1f}ms"
+        return response
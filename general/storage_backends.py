@@ -1,8 +1,38 @@
+"""
+Storage backends.
+
+``PrivateMediaStorage`` can store files by content
+(``PRIVATE_MEDIA_CONTENT_ADDRESSED``): a file is named after the SHA-256 of
+its bytes, computed while it is streamed to a temporary file, and placed in
+two levels of hashed subdirectories (``ab/cd/abcd...ef.jpg``) so no directory
+grows past a few thousand entries. The temporary file is renamed into place,
+so readers never see a partial file. Saving content that is already stored
+only increments a reference count kept under ``.refs/``, and ``delete`` only
+removes the file once its last reference is gone.
+"""
+
+import fcntl
+import hashlib
 import os
+import re
+import tempfile
+from contextlib import contextmanager
+
+from prometheus_client import Counter
 
 from django.conf import settings
 from django.core.files.storage import FileSystemStorage
 
+from .media import sign
+
+PRIVATE_MEDIA_WRITES = Counter(
+    "private_media_writes_total",
+    "Content-addressed private media saves by outcome",
+    ["result"],
+)
+
+CONTENT_NAME = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})(\.\w+)?$")
+
 
 class PrivateMediaStorage(FileSystemStorage):
     """
@@ -10,16 +40,114 @@ class PrivateMediaStorage(FileSystemStorage):
     In production, this should be replaced with proper cloud storage.
     """
 
-    def __init__(self, location=None, base_url=None):
+    tmp_dir = ".tmp"
+    refs_dir = ".refs"
+
+    def __init__(self, location=None, base_url=None, content_addressed=None):
         if location is None:
             location = os.path.join(settings.BASE_DIR, "private_media")
         if base_url is None:
             base_url = "/private_media/"
+        if content_addressed is None:
+            content_addressed = settings.PRIVATE_MEDIA_CONTENT_ADDRESSED
+        self.content_addressed = content_addressed
         super().__init__(location, base_url)
 
+    def url(self, name):
+        """URL of ``name`` carrying an expiring signature (see ``general.media``)."""
+        return f"{super().url(name)}?{sign(name)}"
+
+    def get_available_name(self, name, max_length=None):
+        if self.content_addressed:
+            # The stored name is derived from the content in _save().
+            return name
+        return super().get_available_name(name, max_length)
+
     def _save(self, name, content):
-        # Ensure directory exists
-        full_path = self.path(name)
-        directory = os.path.dirname(full_path)
-        os.makedirs(directory, exist_ok=True)
-        return super()._save(name, content)
+        if not self.content_addressed:
+            return super()._save(name, content)
+
+        tmp_dir = os.path.join(self.location, self.tmp_dir)
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            digest = hashlib.sha256()
+            with os.fdopen(fd, "wb") as tmp:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    tmp.write(chunk)
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            os.chmod(tmp_path, self.file_permissions_mode or 0o644)
+
+            name = self.content_name(digest.hexdigest(), name)
+            with self._refs_locked(name) as refs:
+                stored = self.exists(name)
+                count = self._read_refs(refs) or int(stored)
+                if stored:
+                    PRIVATE_MEDIA_WRITES.labels(result="deduplicated").inc()
+                else:
+                    path = self.path(name)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    os.replace(tmp_path, path)
+                    PRIVATE_MEDIA_WRITES.labels(result="stored").inc()
+                self._write_refs(refs, count + 1)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return name
+
+    def delete(self, name):
+        if not self.content_addressed or not CONTENT_NAME.match(name or ""):
+            return super().delete(name)
+        with self._refs_locked(name) as refs:
+            # Files stored before reference counting have one implicit reference.
+            count = self._read_refs(refs) or 1
+            if count > 1:
+                self._write_refs(refs, count - 1)
+                return
+            super().delete(name)
+            os.remove(refs.name)
+
+    def content_name(self, digest, original_name):
+        extension = os.path.splitext(original_name)[1].lower()
+        return f"{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+    def refs_path(self, name):
+        return os.path.join(self.location, self.refs_dir, name)
+
+    @contextmanager
+    def _refs_locked(self, name):
+        """Open the reference count file of ``name`` under an exclusive lock."""
+        path = self.refs_path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        while True:
+            refs = open(path, "a+")
+            fcntl.flock(refs, fcntl.LOCK_EX)
+            # A concurrent delete may have removed the file while we waited.
+            if os.fstat(refs.fileno()).st_nlink:
+                break
+            refs.close()
+        try:
+            yield refs
+        finally:
+            refs.close()
+
+    def _read_refs(self, refs):
+        refs.seek(0)
+        value = refs.read().strip()
+        return int(value) if value else 0
+
+    def _write_refs(self, refs, count):
+        refs.seek(0)
+        refs.truncate()
+        refs.write(str(count))
+        refs.flush()
+
+    def reference_count(self, name):
+        """Number of saves of ``name`` not yet deleted."""
+        try:
+            with open(self.refs_path(name)) as refs:
+                return self._read_refs(refs)
+        except FileNotFoundError:
+            return int(self.exists(name))
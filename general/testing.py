@@ -0,0 +1,40 @@
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .query_inspector import QueryInspector
+
+
+class QueryBudgetMixin:
+    """
+    ``TestCase`` mixin for enforcing per-endpoint query budgets.
+
+    Unlike ``assertNumQueries`` the budget is an upper bound, and repeated
+    query shapes (likely N+1 queries) fail the test on their own.
+    """
+
+    @contextmanager
+    def assertQueryBudget(self, max_queries, n_plus_one_threshold=None):
+        threshold = (
+            n_plus_one_threshold or settings.QUERY_INSPECTOR_N_PLUS_ONE_THRESHOLD
+        )
+        with QueryInspector() as inspector:
+            yield inspector
+
+        repeated = inspector.repeated(threshold)
+        if repeated:
+            self.fail(
+                "Repeated queries:\n"
+                + "\n".join(
+                    f"  {count}x {shape}\n    from {origin}"
+                    for shape, count, origin in repeated
+                )
+            )
+        if inspector.count > max_queries:
+            self.fail(
+                f"{inspector.count} queries executed, budget is {max_queries}:\n"
+                + "\n".join(
+                    f"  {count}x {shape}"
+                    for shape, count in inspector.shapes.most_common()
+                )
+            )
@@ -1,3 +1,268 @@
-from django.test import TestCase
+import hashlib
+import shutil
+import tempfile
+from datetime import datetime
+from datetime import timezone as dt_timezone
+from unittest.mock import Mock, patch
+from urllib.parse import parse_qs
 
-# Create your tests here.
+from prometheus_client import REGISTRY
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+
+from . import views
+from .cache import BloomFilter, LocalLRUCache
+from .media import sign
+from .partitioning import add_months, month_start, partition_name
+from .query_inspector import QueryInspector, query_shape
+from .storage_backends import PrivateMediaStorage
+from .throttling import GCRALimiter
+
+
+class LocalLRUCacheTests(TestCase):
+    """Test the in-process LRU cache"""
+
+    def test_least_recently_used_entry_is_evicted(self):
+        evicted = []
+        lru = LocalLRUCache(maxsize=2, timeout=60, on_evict=evicted.append)
+        lru.set("a", 1)
+        lru.set("b", 2)
+        lru.get("a")
+        lru.set("c", 3)
+
+        self.assertEqual(lru.get("a"), 1)
+        self.assertIsNone(lru.get("b"))
+        self.assertEqual(evicted, [1])
+
+    def test_expired_entry_is_a_miss(self):
+        lru = LocalLRUCache(maxsize=2, timeout=-1)
+        lru.set("a", 1)
+        self.assertIsNone(lru.get("a"))
+
+
+class BloomFilterTests(TestCase):
+    """Test the Bloom filter used by the revocation store"""
+
+    def test_added_items_are_members(self):
+        bloom = BloomFilter(capacity=100, error_rate=0.01)
+        for i in range(100):
+            bloom.add(f"item-{i}")
+
+        self.assertTrue(all(f"item-{i}" in bloom for i in range(100)))
+        self.assertTrue(bloom.saturated)
+        false_positives = sum(f"other-{i}" in bloom for i in range(1000))
+        self.assertLess(false_positives, 50)
+
+
+class QueryInspectorTests(TestCase):
+    """Test per-request query accounting"""
+
+    def test_shape_ignores_literals(self):
+        self.assertEqual(
+            query_shape(
+                "SELECT * FROM t WHERE id = 12 AND name = 'x' AND k IN (%s, %s)"
+            ),
+            "SELECT * FROM t WHERE id = ? AND name = ? AND k IN (...)",
+        )
+
+    def test_repeated_shapes_are_reported(self):
+        with QueryInspector() as inspector:
+            for pk in range(5):
+                get_user_model().objects.filter(pk=pk).first()
+
+        self.assertEqual(inspector.count, 5)
+        [(shape, count, origin)] = inspector.repeated(5)
+        self.assertEqual(count, 5)
+        self.assertIn("general/tests.py", origin)
+
+    @override_settings(QUERY_INSPECTOR_ENABLED=True)
+    def test_middleware_observes_view_queries(self):
+        sample = ("django_view_db_queries_count", {"view": "health"})
+        before = REGISTRY.get_sample_value(*sample) or 0
+
+        self.client.get("/health/")
+
+        self.assertEqual(REGISTRY.get_sample_value(*sample), before + 1)
+
+    @override_settings(QUERY_INSPECTOR_ENABLED=True)
+    async def test_middleware_observes_async_requests(self):
+        """The middleware also runs natively under ASGI."""
+        sample = ("django_view_db_queries_count", {"view": "health"})
+        before = REGISTRY.get_sample_value(*sample) or 0
+
+        await self.async_client.get("/health/")
+
+        self.assertEqual(REGISTRY.get_sample_value(*sample), before + 1)
+
+    def test_middleware_can_be_disabled(self):
+        sample = ("django_view_db_queries_count", {"view": "health"})
+        before = REGISTRY.get_sample_value(*sample) or 0
+
+        with override_settings(QUERY_INSPECTOR_ENABLED=False):
+            self.client.get("/health/")
+
+        self.assertEqual(REGISTRY.get_sample_value(*sample) or 0, before)
+
+
+class GCRALimiterTests(TestCase):
+    """Test the GCRA rate limiter"""
+
+    def test_burst_then_throttle(self):
+        limiter = GCRALimiter()
+        decisions = [limiter.hit("k", limit=3, period=60) for _ in range(4)]
+
+        self.assertEqual([wait for _, wait in decisions[:3]], [0, 0, 0])
+        backend, wait = decisions[3]
+        self.assertEqual(backend, "local")
+        self.assertAlmostEqual(wait, 20, delta=1)
+
+    def test_redis_is_one_script_call(self):
+        limiter = GCRALimiter()
+        client = Mock()
+        client.register_script.return_value.return_value = 1500
+        with patch.object(limiter, "_redis_client", return_value=client):
+            self.assertEqual(limiter.hit("k", limit=3, period=60), ("redis", 1.5))
+
+        client.register_script.return_value.assert_called_once()
+
+    def test_falls_back_to_local_on_redis_error(self):
+        limiter = GCRALimiter()
+        client = Mock()
+        client.register_script.return_value.side_effect = RedisConnectionError
+        with patch.object(limiter, "_redis_client", return_value=client):
+            self.assertEqual(limiter.hit("k", limit=3, period=60), ("local", 0))
+
+
+class PartitioningTests(TestCase):
+    """Test the monthly partition helpers"""
+
+    def test_month_arithmetic_wraps_years(self):
+        start = month_start(datetime(2026, 11, 17, 8, 30, tzinfo=dt_timezone.utc))
+
+        self.assertEqual(start, datetime(2026, 11, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(
+            add_months(start, 2), datetime(2027, 1, 1, tzinfo=dt_timezone.utc)
+        )
+        self.assertEqual(
+            partition_name("access_table", add_months(start, 2)),
+            "access_table_p202701",
+        )
+
+
+class ContentAddressedStorageTests(TestCase):
+    """Test the content-addressed layout of PrivateMediaStorage"""
+
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        self.storage = PrivateMediaStorage(location=location, content_addressed=True)
+
+    def test_files_are_named_by_content_hash(self):
+        name = self.storage.save("avatar.JPG", ContentFile(b"pixels"))
+
+        digest = hashlib.sha256(b"pixels").hexdigest()
+        self.assertEqual(name, f"{digest[:2]}/{digest[2:4]}/{digest}.jpg")
+        with self.storage.open(name) as handle:
+            self.assertEqual(handle.read(), b"pixels")
+        self.assertEqual(self.storage.listdir(".tmp"), ([], []))
+
+    def test_duplicates_are_reference_counted(self):
+        first = self.storage.save("a.png", ContentFile(b"same"))
+        second = self.storage.save("b.png", ContentFile(b"same"))
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.storage.reference_count(first), 2)
+
+        self.storage.delete(first)
+        self.assertTrue(self.storage.exists(first))
+        self.storage.delete(first)
+        self.assertFalse(self.storage.exists(first))
+        self.assertEqual(self.storage.reference_count(first), 0)
+
+    def test_flat_names_are_deleted_directly(self):
+        legacy = PrivateMediaStorage(
+            location=self.storage.location, content_addressed=False
+        )
+        name = legacy.save("legacy.png", ContentFile(b"old"))
+
+        self.storage.delete(name)
+        self.assertFalse(legacy.exists(name))
+
+
+@override_settings(PRIVATE_MEDIA_SERVE="django")
+class PrivateMediaServingTests(TestCase):
+    """Test signed private media URLs and how they are served"""
+
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        storage = patch.object(views.private_storage, "location", location)
+        storage.start()
+        self.addCleanup(storage.stop)
+        self.storage = views.private_storage
+        self.name = self.storage.save("report.txt", ContentFile(b"0123456789"))
+
+    def get(self, url, **headers):
+        response = self.client.get(url, headers=headers)
+        if response.streaming:
+            response.body = b"".join(response.streaming_content)
+            response.close()
+        return response
+
+    def test_signed_url_serves_the_file(self):
+        response = self.get(self.storage.url(self.name))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.body, b"0123456789")
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+
+    def test_flat_names_are_cached_until_the_url_expires(self):
+        query = sign(self.name, now=1000)
+        expires = int(parse_qs(query)["expires"][0])
+
+        with patch("general.media.time.time", return_value=1000):
+            response = self.get(f"/private_media/{self.name}?{query}")
+
+        self.assertEqual(
+            response["Cache-Control"], f"private, max-age={expires - 1000}"
+        )
+
+    def test_content_addressed_names_are_immutable(self):
+        with patch.object(self.storage, "content_addressed", True):
+            response = self.get(self.storage.url(self.name))
+
+        self.assertEqual(
+            response["Cache-Control"],
+            f"private, max-age={settings.PRIVATE_MEDIA_CACHE_MAX_AGE}, immutable",
+        )
+
+    def test_tampered_or_expired_urls_are_rejected(self):
+        url = self.storage.url(self.name)
+        self.assertEqual(self.get(url.replace("report", "other")).status_code, 403)
+        self.assertEqual(self.get(url[:-1]).status_code, 403)
+        expired = f"/private_media/{self.name}?{sign(self.name, now=0)}"
+        self.assertEqual(self.get(expired).status_code, 403)
+
+    def test_range_requests(self):
+        url = self.storage.url(self.name)
+
+        response = self.get(url, Range="bytes=2-5")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.body, b"2345")
+        self.assertEqual(response["Content-Range"], "bytes 2-5/10")
+        self.assertEqual(response["Content-Length"], "4")
+
+        self.assertEqual(self.get(url, Range="bytes=-3").body, b"789")
+        self.assertEqual(self.get(url, Range="bytes=20-").status_code, 416)
+
+    @override_settings(PRIVATE_MEDIA_SERVE="nginx")
+    def test_proxy_handles_the_transfer(self):
+        response = self.get(self.storage.url(self.name))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected_media/{self.name}")
+        self.assertEqual(response.content, b"")
@@ -0,0 +1,191 @@
+"""
+GCRA rate limiting for DRF views and plain Django views.
+
+Each throttle decision is one atomic Lua script run on Redis (a single
+EVALSHA round trip) that stores only the key's theoretical arrival time, so
+the cost per request is constant and concurrent workers cannot race each
+other. Without ``THROTTLE_REDIS_URL`` (defaults to ``REDIS_URL``), or when
+Redis is unreachable, the limiter falls back to the same algorithm in
+process memory, which keeps limits enforced per worker instead of failing
+open or closed.
+
+Rates come from ``REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"]`` and are looked
+up per scope, in the ``"<requests>/<period>"`` format DRF uses.
+"""
+
+import logging
+import math
+import threading
+import time
+from functools import wraps
+
+import redis
+from prometheus_client import Counter
+from redis.exceptions import RedisError
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+from django.conf import settings
+from django.http import JsonResponse
+
+from .cache import LocalLRUCache
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_DECISIONS = Counter(
+    "django_throttle_decisions_total",
+    "Rate limit decisions",
+    ["scope", "decision", "backend"],
+)
+THROTTLE_BACKEND_ERRORS = Counter(
+    "django_throttle_backend_errors_total",
+    "Rate limit checks that fell back to process memory after a Redis error",
+)
+
+# KEYS[1]: limiter key. ARGV[1]: emission interval, ARGV[2]: period, both in
+# milliseconds. Returns the milliseconds to wait, 0 when the request is allowed.
+GCRA_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local interval = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local tat = math.max(tonumber(redis.call('GET', KEYS[1]) or now), now)
+local allow_at = tat + interval - period
+if now < allow_at then
+    return allow_at - now
+end
+redis.call('SET', KEYS[1], tat + interval, 'PX', tat + interval - now)
+return 0
+"""
+
+
+class GCRALimiter:
+    """Generic cell rate limiter with a Redis and an in-process backend."""
+
+    def __init__(self, local_maxsize=10000):
+        self._local = LocalLRUCache(maxsize=local_maxsize, timeout=86400)
+        self._local_lock = threading.Lock()
+        self._client = None
+        self._script = None
+
+    def _redis_client(self):
+        if self._client is None and settings.THROTTLE_REDIS_URL:
+            self._client = redis.Redis.from_url(
+                settings.THROTTLE_REDIS_URL,
+                socket_timeout=0.5,
+                socket_connect_timeout=0.5,
+            )
+        return self._client
+
+    def _hit_redis(self, client, key, interval, period):
+        if self._script is None:
+            self._script = client.register_script(GCRA_SCRIPT)
+        wait = self._script(
+            keys=[key],
+            args=[math.ceil(interval * 1000), period * 1000],
+            client=client,
+        )
+        return int(wait) / 1000
+
+    def _hit_local(self, key, interval, period):
+        now = time.monotonic()
+        with self._local_lock:
+            tat = max(self._local.get(key) or now, now)
+            allow_at = tat + interval - period
+            if now < allow_at:
+                return allow_at - now
+            self._local.set(key, tat + interval)
+            return 0
+
+    def hit(self, key, limit, period):
+        """
+        Count a request against ``key`` and return ``(backend, wait)``.
+
+        ``wait`` is 0 when the request is allowed, otherwise the seconds until
+        the next request would be.
+        """
+        interval = period / limit
+        client = self._redis_client()
+        if client is not None:
+            try:
+                return "redis", self._hit_redis(client, key, interval, period)
+            except RedisError:
+                THROTTLE_BACKEND_ERRORS.inc()
+                logger.warning("Rate limiter falling back to process memory")
+        return "local", self._hit_local(key, interval, period)
+
+    def reset(self):
+        """Forget the in-process state; meant for tests."""
+        self._local.clear()
+
+
+limiter = GCRALimiter()
+
+
+class GCRAThrottle(SimpleRateThrottle):
+    """
+    Per-scope throttle backed by ``limiter``.
+
+    Requests are keyed on the authenticated user, or on the client address
+    for anonymous requests. Subclasses only need to set ``scope``.
+    """
+
+    cache_format = "throttle:%(scope)s:%(ident)s"
+
+    def __init__(self, scope=None):
+        if scope is not None:
+            self.scope = scope
+        super().__init__()
+
+    def get_rate(self):
+        # Read the rates on every instantiation instead of once at import time.
+        self.THROTTLE_RATES = api_settings.DEFAULT_THROTTLE_RATES
+        return super().get_rate()
+
+    def get_cache_key(self, request, view):
+        user = getattr(request, "user", None)
+        if user is not None and user.is_authenticated:
+            ident = user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {"scope": self.scope, "ident": ident}
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+
+        backend, self._wait = limiter.hit(key, self.num_requests, self.duration)
+        THROTTLE_DECISIONS.labels(
+            scope=self.scope,
+            decision="throttled" if self._wait else "allowed",
+            backend=backend,
+        ).inc()
+        return not self._wait
+
+    def wait(self):
+        return self._wait
+
+
+def throttle(scope):
+    """Apply a ``GCRAThrottle`` for ``scope`` to a plain Django view."""
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapped(request, *args, **kwargs):
+            throttle = GCRAThrottle(scope)
+            if not throttle.allow_request(request, None):
+                wait = math.ceil(throttle.wait())
+                response = JsonResponse(
+                    {"error": f"Request was throttled. Retry in {wait} seconds."},
+                    status=429,
+                )
+                response["Retry-After"] = str(wait)
+                return response
+            return view_func(request, *args, **kwargs)
+
+        return wrapped
+
+    return decorator
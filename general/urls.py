@@ -0,0 +1,7 @@
+from django.urls import path
+
+from . import views
+
+urlpatterns = [
+    path("private_media/<path:name>", views.private_media, name="private_media"),
+]
@@ -1,3 +1,16 @@
-from django.shortcuts import render
+from django.http import HttpResponse
+from django.views.decorators.http import require_http_methods
 
-# Create your views here.
+from . import media
+from .storage_backends import PrivateMediaStorage
+
+private_storage = PrivateMediaStorage()
+
+
+@require_http_methods(["GET", "HEAD"])
+def private_media(request, name):
+    """Serve a private media file to holders of a valid signed URL"""
+    expires = request.GET.get("expires")
+    if not media.verify(name, expires, request.GET.get("signature")):
+        return HttpResponse(status=403)
+    return media.serve(request, private_storage, name, int(expires))